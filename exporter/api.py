@@ -4,26 +4,117 @@ Functions for exporting learning resources
 
 from __future__ import unicode_literals
 
+from collections import defaultdict, deque
 import errno
+import hashlib
+from multiprocessing.pool import ThreadPool
 import os
-import re
+import shutil
+import sys
 import tarfile
-from shutil import rmtree
-from tempfile import mkdtemp, mkstemp
+import time
+import zipfile
+from io import BytesIO
+from tempfile import mkdtemp, NamedTemporaryFile, SpooledTemporaryFile
 
-from django.utils.text import slugify
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files import File
 from django.core.files.storage import default_storage
+from django.db.models import Prefetch
+from django.utils.text import slugify
+from statsd.defaults.django import statsd
+
+from exporter.compression import ParallelGzipWriter
 from lore.settings import EXPORT_PATH_PREFIX
-from learningresources.models import STATIC_ASSET_BASEPATH
+from learningresources.models import (
+    LearningResource,
+    StaticAsset,
+    STATIC_ASSET_BASEPATH,
+)
+
+# Tarballs smaller than this are built in memory, larger ones roll
+# over into an anonymous temporary file.
+TARBALL_SPOOL_MAX_SIZE = 32 * 1024 * 1024
+# Number of LearningResources loaded from the database at a time.
+EXPORT_CHUNK_SIZE = 500
+# Bytes read from storage at a time when fetching static assets.
+FETCH_CHUNK_SIZE = 64 * 1024
+
+# File extension of each archive format an export can be written as.
+ARCHIVE_EXTENSIONS = {
+    "gz": ".tar.gz",
+    "bz2": ".tar.bz2",
+    "xz": ".tar.xz",
+    "tar": ".tar",
+    "zip": ".zip",
+}
+# Archive formats supported by this Python, xz needs Python 3.
+EXPORT_CODECS = tuple(
+    codec for codec in ("gz", "bz2", "xz", "tar", "zip")
+    if codec in ("gz", "tar", "zip") or codec in tarfile.TarFile.OPEN_METH
+)
+# Files which are already compressed and are stored as is where the
+# archive format allows it.
+STORED_EXTENSIONS = frozenset([
+    ".7z", ".avi", ".bz2", ".flv", ".gif", ".gz", ".jpeg", ".jpg", ".m4a",
+    ".m4v", ".mkv", ".mov", ".mp3", ".mp4", ".mpeg", ".mpg", ".oga", ".ogg",
+    ".ogv", ".pdf", ".png", ".tgz", ".webm", ".webp", ".woff", ".woff2",
+    ".xz", ".zip",
+])
+# ZipFile.open() can write members from Python 3.6.
+ZIP_STREAMING = sys.version_info >= (3, 6)
+
+cache = caches["lore_export"]
+# Bytes written to the export cache are counted per window as long as the
+# cache timeout. Entries written during a window expire before the end of
+# the next one, so the last two windows count every unexpired entry.
+CACHE_BYTES_KEY = "bytes_written:{window}"
+
+
+def _reserve_cache_bytes(size):
+    """
+    Count size bytes about to be written to the export cache, unless they
+    would take it over EXPORT_CACHE_MAX_BYTES.
+
+    Args:
+        size (int): Bytes of the entry
+    Returns:
+        bool: True if the entry can be cached
+    """
+    timeout = cache.default_timeout
+    window = int(time.time() // timeout)
+    current = CACHE_BYTES_KEY.format(window=window)
+    cache.add(current, 0, 2 * timeout)
+    try:
+        written = cache.incr(current, size)
+    except ValueError:
+        # The counter expired in between, don't cache rather than guess.
+        return False
+    previous = cache.get(CACHE_BYTES_KEY.format(window=window - 1)) or 0
+    if written + previous > settings.EXPORT_CACHE_MAX_BYTES:
+        cache.decr(current, size)
+        return False
+    return True
 
 
-def _find_unused_path(path):
-    """Iterate through filenames until we get to one that isn't taken."""
+def _find_unused_path(path, used_paths):
+    """
+    Iterate through filenames until we get to one that isn't taken.
+
+    Args:
+        path (unicode): Path within the export
+        used_paths (set of unicode): Paths already in the export
+    Returns:
+        (unicode, bool):
+            First item is an unused path.
+            Second item is True if path was already taken.
+    """
     base, ext = os.path.splitext(path)
 
     collision = False
     i = 1
-    while os.path.exists(path):
+    while path in used_paths:
         collision = True
         path = "{base}_{i}{ext}".format(
             base=base,
@@ -35,18 +126,93 @@ def _find_unused_path(path):
     return path, collision
 
 
-# pylint: disable=too-many-locals
-def export_resources_to_directory(learning_resources):
+def _load_resources(resource_ids):
     """
-    Create files of LearningResource and StaticAsset contents inside directory.
+    Load LearningResources with their type, static assets and the static
+    assets' courses, using two queries per chunk of resources.
 
     Args:
-        learning_resources (list of learningresources.models.LearningResource):
-            LearningResources to export in tarball
+        resource_ids (iterable of int): Primary keys of LearningResources
     Returns:
-        (unicode, bool):
-            First item is newly created temp directory with files inside of it.
-            Second item is True if a static asset collision was detected.
+        generator: Yields LearningResources ordered by id
+    """
+    resource_ids = sorted(set(resource_ids))
+    for start in range(0, len(resource_ids), EXPORT_CHUNK_SIZE):
+        chunk = resource_ids[start:start + EXPORT_CHUNK_SIZE]
+        resources = LearningResource.objects.filter(
+            id__in=chunk
+        ).select_related(
+            'learning_resource_type'
+        ).prefetch_related(Prefetch(
+            'static_assets',
+            queryset=StaticAsset.objects.select_related(
+                'course').order_by('id')
+        )).order_by('id')
+        for resource in resources:
+            yield resource
+
+
+def _cache_key(kind, object_id, *parts):
+    """
+    Build an export cache key which changes whenever one of its parts does.
+
+    Args:
+        kind (unicode): Kind of cached item
+        object_id (int): Primary key of the cached object
+        parts (list): Values the cached item depends on
+    Returns:
+        unicode: Cache key
+    """
+    digest = hashlib.sha1(
+        "|".join("{0}".format(part) for part in parts).encode('utf-8'))
+    return "export_{kind}_{id}_{digest}".format(
+        kind=kind, id=object_id, digest=digest.hexdigest())
+
+
+def _resource_cache_keys(resource_ids):
+    """
+    Look up what the export of each LearningResource depends on and build
+    its cache key, using two queries.
+
+    Args:
+        resource_ids (list of int): Primary keys of LearningResources
+    Returns:
+        dict: Maps LearningResource id to its cache key
+    """
+    assets = defaultdict(list)
+    for resource_id, asset_id, asset_modified in (
+            LearningResource.static_assets.through.objects.filter(
+                learningresource__id__in=resource_ids
+            ).values_list(
+                'learningresource_id',
+                'staticasset_id',
+                'staticasset__date_modified',
+            ).order_by('staticasset_id')):
+        assets[resource_id].append((asset_id, asset_modified.isoformat()))
+
+    return {
+        resource_id: _cache_key(
+            "resource", resource_id, date_modified.isoformat(),
+            *assets[resource_id]
+        )
+        for resource_id, date_modified in LearningResource.objects.filter(
+            id__in=resource_ids
+        ).values_list('id', 'date_modified')
+    }
+
+
+def _prepare_resource(learning_resource):
+    """
+    Render what the export needs to know about a LearningResource.
+
+    Args:
+        learning_resource (LearningResource):
+            LearningResource with its type, static assets and their
+            courses loaded
+    Returns:
+        dict:
+            path and content of the resource XML, plus
+            (id, path, storage name, cache key) for each StaticAsset
     """
     def sanitize(url_name):
         """Sanitize title for use in filename."""
@@ -54,106 +220,486 @@ def export_resources_to_directory(learning_resources):
         # and we have a number and extension too.
         return slugify(url_name)[:200]
 
-    tempdir = mkdtemp()
-    collision = False
-    type_dirs_created = set()
-    try:
-        os.mkdir(os.path.join(tempdir, "static"))
-        for learning_resource in learning_resources:
-            if learning_resource.url_name is not None:
-                filename = "{id}_{url_name}.xml".format(
-                    id=learning_resource.id,
-                    url_name=sanitize(learning_resource.url_name),
-                )
-            else:
-                filename = "{id}.xml".format(id=learning_resource.id)
+    if learning_resource.url_name is not None:
+        filename = "{id}_{url_name}.xml".format(
+            id=learning_resource.id,
+            url_name=sanitize(learning_resource.url_name),
+        )
+    else:
+        filename = "{id}.xml".format(id=learning_resource.id)
+
+    assets = []
+    for static_asset in learning_resource.static_assets.all():
+        prefix = STATIC_ASSET_BASEPATH.format(
+            org=static_asset.course.org,
+            course_number=static_asset.course.course_number,
+            run=static_asset.course.run,
+        )
+        asset_path = static_asset.asset.name
+        if asset_path.startswith(prefix):
+            asset_path = asset_path[len(prefix):]
+        assets.append((
+            static_asset.id,
+            os.path.join("static", asset_path),
+            static_asset.asset.name,
+            _cache_key(
+                "asset",
+                static_asset.id,
+                static_asset.date_modified.isoformat(),
+            ),
+        ))
+
+    return {
+        "path": os.path.join(
+            learning_resource.learning_resource_type.name, filename),
+        "content": learning_resource.content_xml.encode('utf-8'),
+        "assets": assets,
+    }
 
-            type_name = learning_resource.learning_resource_type.name
-            if type_name not in type_dirs_created:
-                os.mkdir(os.path.join(tempdir, type_name))
-                type_dirs_created.add(type_name)
-            with open(os.path.join(tempdir, type_name, filename), 'w') as f:
-                f.write(learning_resource.content_xml)
+
+def _iter_export_members(resource_ids):
+    """
+    Yield LearningResource and StaticAsset contents which make up an export,
+    without touching the local disk. A StaticAsset shared by several
+    LearningResources is only yielded once.
+
+    Prepared resources and small static assets are taken from the export
+    cache, so only resources and assets changed since they were last
+    exported are loaded from the database and storage.
+
+    Args:
+        resource_ids (iterable of int):
+            Primary keys of LearningResources to export
+    Returns:
+        generator:
+            Yields (path, size, opener, cache_key) for each file in the
+            export. path is relative to the root of the export and opener
+            is a function returning a file-like object with the contents.
+            size is None when it isn't known without reading the file.
+            cache_key is where the contents should be cached once read,
+            or None if they don't need to be.
+    """
+    max_item_size = settings.EXPORT_CACHE_MAX_ITEM_SIZE
+    resource_ids = sorted(set(resource_ids))
+    exported_asset_ids = set()
+    for start in range(0, len(resource_ids), EXPORT_CHUNK_SIZE):
+        keys = _resource_cache_keys(
+            resource_ids[start:start + EXPORT_CHUNK_SIZE])
+        entries = cache.get_many(list(keys.values()))
+
+        missing = [
+            resource_id for resource_id, key in keys.items()
+            if key not in entries
+        ]
+        prepared = {}
+        for learning_resource in _load_resources(missing):
+            entry = _prepare_resource(learning_resource)
+            entries[keys[learning_resource.id]] = entry
+            if (len(entry["content"]) <= max_item_size and
+                    _reserve_cache_bytes(len(entry["content"]))):
+                prepared[keys[learning_resource.id]] = entry
+        cache.set_many(prepared)
+
+        for resource_id in sorted(keys):
+            entry = entries[keys[resource_id]]
+            content = entry["content"]
+            yield (
+                entry["path"],
+                len(content),
+                lambda content=content: BytesIO(content),
+                None,
+            )
 
             # Output to static directory.
-            for static_asset in learning_resource.static_assets.all():
-                prefix = STATIC_ASSET_BASEPATH.format(
-                    org=static_asset.course.org,
-                    course_number=static_asset.course.course_number,
-                    run=static_asset.course.run,
-                )
-                asset_path = static_asset.asset.name
-                if asset_path.startswith(prefix):
-                    asset_path = asset_path[len(prefix):]
-
-                static_path = os.path.join(tempdir, "static", asset_path)
-                static_path, found_collision = _find_unused_path(static_path)
-                if found_collision:
-                    collision = found_collision
-
-                path, _ = os.path.split(static_path)
-                try:
-                    os.makedirs(path)
-                except OSError as exc:
-                    if exc.errno == errno.EEXIST and os.path.isdir(path):
-                        pass
-                    else:
-                        raise
-                with open(static_path, 'wb') as outfile:
-                    outfile.write(static_asset.asset.read())
-
-        # If we never put anything in static, remove it.
-        if not os.listdir(os.path.join(tempdir, "static")):
-            rmtree(os.path.join(tempdir, "static"))
-    except:
-        # Clean up temporary directory since we can't return it anymore.
-        rmtree(tempdir)
+            assets = [
+                asset for asset in entry["assets"]
+                if asset[0] not in exported_asset_ids
+            ]
+            blobs = cache.get_many([asset[3] for asset in assets])
+            for asset_id, path, name, key in assets:
+                exported_asset_ids.add(asset_id)
+                if key in blobs:
+                    blob = blobs[key]
+                    yield (
+                        path,
+                        len(blob),
+                        lambda blob=blob: BytesIO(blob),
+                        None,
+                    )
+                else:
+                    yield (
+                        path,
+                        None,
+                        lambda name=name: default_storage.open(name, 'rb'),
+                        key,
+                    )
+
+
+def _fetch_member(opener, max_memory, cache_key=None):
+    """
+    Read a file into a spooled temporary file, hashing it on the way.
+    Small files are also stored in the export cache.
+
+    Args:
+        opener (function): Returns a file-like object with the contents
+        max_memory (int): Bytes held in memory before spooling to disk
+        cache_key (unicode): Where to cache the contents, or None
+    Returns:
+        (SpooledTemporaryFile, int, unicode, float):
+            The contents rewound to the start, their size, their SHA1
+            hex digest and the seconds it took to read them.
+    """
+    start = time.time()
+    spool = SpooledTemporaryFile(max_size=max_memory)
+    digest = hashlib.sha1()
+    try:
+        with opener() as infile:
+            for chunk in iter(lambda: infile.read(FETCH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                spool.write(chunk)
+        size = spool.tell()
+        if (cache_key is not None and
+                size <= settings.EXPORT_CACHE_MAX_ITEM_SIZE and
+                _reserve_cache_bytes(size)):
+            spool.seek(0)
+            cache.set(cache_key, spool.read())
+        spool.seek(0)
+    except Exception:  # pylint: disable=broad-except
+        spool.close()
         raise
-    return tempdir, collision
+    return spool, size, digest.hexdigest(), time.time() - start
 
 
-def export_resources_to_tarball(learning_resources, username):
+def _prefetch_members(members):
     """
-    Create tarball and put LearningResource and StaticAsset contents in it.
+    Read export members in parallel from a bounded thread pool, yielding
+    them in their original order. At most EXPORT_ASSET_THREADS members are
+    in flight at a time and each keeps at most EXPORT_ASSET_MAX_MEMORY bytes
+    in memory.
 
     Args:
-        learning_resources (list of learningresources.models.LearningResource):
-            LearningResources to export in tarball
-        username (unicode): Name of user
+        members (iterable): (path, size, opener, cache_key) for each file
+    Returns:
+        generator:
+            Yields (path, size, opener, sha1) for each file, where size
+            is known and opener returns the prefetched contents.
+    """
+    threads = settings.EXPORT_ASSET_THREADS
+    max_memory = settings.EXPORT_ASSET_MAX_MEMORY
+    start = time.time()
+    total_bytes = 0
+    pool = ThreadPool(threads)
+    window = deque()
+
+    def finish(pending):
+        """Wait for the oldest member and record its statistics."""
+        path, result = pending
+        spool, size, sha1, elapsed = result.get()
+        statsd.timing('lore.exporter.fetch_member', int(elapsed * 1000))
+        return path, size, lambda: spool, sha1
+
+    try:
+        for path, _, opener, cache_key in members:
+            window.append((
+                path,
+                pool.apply_async(
+                    _fetch_member, (opener, max_memory, cache_key)),
+            ))
+            if len(window) >= threads:
+                member = finish(window.popleft())
+                total_bytes += member[1]
+                yield member
+        while len(window) > 0:
+            member = finish(window.popleft())
+            total_bytes += member[1]
+            yield member
+    finally:
+        # Discard members which were fetched but never consumed.
+        for _, result in window:
+            if result.ready() and result.successful():
+                result.get()[0].close()
+        pool.terminate()
+        pool.join()
+
+    elapsed = time.time() - start
+    statsd.incr('lore.exporter.bytes', total_bytes)
+    if elapsed > 0:
+        statsd.gauge(
+            'lore.exporter.bytes_per_second', int(total_bytes / elapsed))
+
+
+def _dedupe_members(members):
+    """
+    Drop files whose path and contents were already exported, and rename
+    files which have the same path as an exported file but different
+    contents.
+
+    Args:
+        members (iterable): (path, size, opener, sha1) for each file
+    Returns:
+        generator:
+            Yields (path, size, opener, collision) for each distinct file.
+            collision is True if the file was renamed.
+    """
+    used_paths = set()
+    # Maps requested path to the exported path for each SHA1.
+    exported = {}
+    for path, size, opener, sha1 in members:
+        by_hash = exported.setdefault(path, {})
+        if sha1 in by_hash:
+            opener().close()
+            continue
+        unused_path, collision = _find_unused_path(path, used_paths)
+        used_paths.add(unused_path)
+        by_hash[sha1] = unused_path
+        yield unused_path, size, opener, collision
+
+
+def _export_members(resource_ids):
+    """
+    Fetch, deduplicate and name the files of an export.
+
+    Args:
+        resource_ids (iterable of int):
+            Primary keys of LearningResources to export
+    Returns:
+        generator: Yields (path, size, opener, collision) for each file
+    """
+    return _dedupe_members(
+        _prefetch_members(_iter_export_members(resource_ids))
+    )
+
+
+def export_resources_to_directory(resource_ids):
+    """
+    Create files of LearningResource and StaticAsset contents inside directory.
+
+    Args:
+        resource_ids (iterable of int):
+            Primary keys of LearningResources to export
     Returns:
         (unicode, bool):
-            First item is path of tarball within django-storage.
-            Second item is whether a static asset collision was detected.
+            First item is newly created temp directory with files inside of it.
+            Second item is True if a static asset collision was detected.
     """
-    handle, tempfilepath = mkstemp()
-    os.close(handle)
+    tempdir = mkdtemp()
+    collision = False
     try:
-        oldcwd = os.getcwd()
-        tempdir, collision = export_resources_to_directory(learning_resources)
-        try:
-            os.chdir(tempdir)
-            archive = tarfile.open(tempfilepath, mode='w:gz')
+        for path, _, opener, found_collision in _export_members(
+                resource_ids):
+            collision = collision or found_collision
+            abs_path = os.path.join(tempdir, path)
+            try:
+                os.makedirs(os.path.dirname(abs_path))
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+            with opener() as infile, open(abs_path, 'wb') as outfile:
+                shutil.copyfileobj(infile, outfile)
+    except Exception:  # pylint: disable=broad-except
+        # Clean up temporary directory since we can't return it anymore.
+        shutil.rmtree(tempdir)
+        raise
+    return tempdir, collision
 
-            for root, _, files in os.walk("."):
-                for name in files:
-                    abs_path = os.path.join(root, name)
-                    abs_path = re.sub(r'^\./', '', abs_path)
-                    archive.add(abs_path)
 
-            archive.close()
-            output_path = '{prefix}{username}_exports.tar.gz'.format(
-                prefix=EXPORT_PATH_PREFIX,
-                username=username
-            )
+def _is_stored(path):
+    """
+    Check whether a file is already compressed.
 
-            # Remove any old paths.
-            default_storage.delete(output_path)
-            return (
-                default_storage.save(output_path, open(tempfilepath, 'rb')),
-                collision
-            )
+    Args:
+        path (unicode): Path within the export
+    Returns:
+        bool: True if compressing the file again gains nothing
+    """
+    return os.path.splitext(path)[1].lower() in STORED_EXTENSIONS
+
+
+def _write_tar(members, outfile, codec, level):
+    """
+    Write export members as a tar archive.
+
+    gzip archives are compressed in parallel blocks, and blocks holding
+    already compressed files are stored. bz2 and xz archives are compressed
+    as a single stream.
+
+    Args:
+        members (iterable): (path, size, opener, collision) for each file
+        outfile (file): Writable file-like object for the archive
+        codec (unicode): One of gz, bz2, xz or tar
+        level (int): Compression level
+    Returns:
+        bool: True if a static asset collision was detected
+    """
+    writer = None
+    if codec == "gz":
+        writer = ParallelGzipWriter(
+            outfile, level, settings.EXPORT_COMPRESSION_THREADS)
+        archive = tarfile.open(fileobj=writer, mode='w|')
+    elif codec == "bz2":
+        archive = tarfile.open(
+            fileobj=outfile, mode='w:bz2', compresslevel=max(level, 1))
+    elif codec == "xz":
+        archive = tarfile.open(fileobj=outfile, mode='w:xz', preset=level)
+    else:
+        archive = tarfile.open(fileobj=outfile, mode='w')
+
+    collision = False
+    mtime = time.time()
+    try:
+        try:
+            for path, size, opener, found_collision in members:
+                collision = collision or found_collision
+                if writer is not None:
+                    writer.set_level(0 if _is_stored(path) else level)
+                info = tarfile.TarInfo(name=path)
+                info.size = size
+                info.mtime = mtime
+                with opener() as infile:
+                    archive.addfile(info, infile)
         finally:
-            os.chdir(oldcwd)
-            rmtree(tempdir)
+            archive.close()
     finally:
-        os.remove(tempfilepath)
+        if writer is not None:
+            writer.close()
+    return collision
+
+
+def _write_zip(members, outfile, level):
+    """
+    Write export members as a zip archive, storing already compressed files.
+
+    Args:
+        members (iterable): (path, size, opener, collision) for each file
+        outfile (file): Writable, seekable file-like object for the archive
+        level (int): Compression level, used from Python 3.7
+    Returns:
+        bool: True if a static asset collision was detected
+    """
+    kwargs = {}
+    if sys.version_info >= (3, 7):
+        kwargs['compresslevel'] = level
+    collision = False
+    now = time.time()
+    date_time = time.localtime(now)[:6]
+    with zipfile.ZipFile(
+            outfile, 'w', zipfile.ZIP_DEFLATED, allowZip64=True,
+            **kwargs) as archive:
+        for path, size, opener, found_collision in members:
+            collision = collision or found_collision
+            info = zipfile.ZipInfo(path, date_time=date_time)
+            info.external_attr = 0o644 << 16
+            if level == 0 or _is_stored(path):
+                info.compress_type = zipfile.ZIP_STORED
+            else:
+                info.compress_type = zipfile.ZIP_DEFLATED
+            with opener() as infile:
+                if ZIP_STREAMING:
+                    with archive.open(
+                            info, 'w', force_zip64=True) as member:
+                        shutil.copyfileobj(infile, member)
+                elif (size is not None and
+                      size <= settings.EXPORT_ASSET_MAX_MEMORY):
+                    archive.writestr(info, infile.read())
+                else:
+                    _write_zip_member_from_file(archive, info, infile, now)
+    return collision
+
+
+def _write_zip_member_from_file(archive, info, infile, mtime):
+    """
+    Write a zip member through a temporary file, which ZipFile.write
+    compresses in chunks, for Pythons without ZipFile.open() for writing.
+
+    Args:
+        archive (zipfile.ZipFile): Archive open for writing
+        info (zipfile.ZipInfo): Name and compression of the member
+        infile (file): Contents of the member
+        mtime (float): Modification time of the member
+    """
+    with NamedTemporaryFile() as temp:
+        shutil.copyfileobj(infile, temp)
+        temp.flush()
+        os.chmod(temp.name, 0o644)
+        os.utime(temp.name, (mtime, mtime))
+        archive.write(
+            temp.name, arcname=info.filename,
+            compress_type=info.compress_type)
+
+
+def write_archive(resource_ids, outfile, codec=None, level=None):
+    """
+    Write LearningResource and StaticAsset contents as archive members
+    directly into outfile, streaming each file's contents.
+
+    Args:
+        resource_ids (iterable of int):
+            Primary keys of LearningResources to export
+        outfile (file): Writable, seekable file-like object for the archive
+        codec (unicode):
+            One of EXPORT_CODECS, defaults to settings.EXPORT_CODEC
+        level (int):
+            Compression level from 0 to 9, defaults to
+            settings.EXPORT_COMPRESSION_LEVEL
+    Returns:
+        bool: True if a static asset collision was detected
+    """
+    if codec is None:
+        codec = settings.EXPORT_CODEC
+    if level is None:
+        level = settings.EXPORT_COMPRESSION_LEVEL
+    members = _export_members(resource_ids)
+    if codec == "zip":
+        return _write_zip(members, outfile, level)
+    return _write_tar(members, outfile, codec, level)
+
+
+def export_path(username, codec):
+    """
+    Path of a user's export within django-storage.
+
+    Args:
+        username (unicode): Name of user
+        codec (unicode): Archive format of the export
+    Returns:
+        unicode: Path of the archive
+    """
+    return '{prefix}{username}_exports{extension}'.format(
+        prefix=EXPORT_PATH_PREFIX,
+        username=username,
+        extension=ARCHIVE_EXTENSIONS[codec],
+    )
+
+
+def export_resources_to_tarball(resource_ids, username, codec=None,
+                                level=None):
+    """
+    Create archive and put LearningResource and StaticAsset contents in it.
+
+    Args:
+        resource_ids (iterable of int):
+            Primary keys of LearningResources to export in tarball
+        username (unicode): Name of user
+        codec (unicode):
+            One of EXPORT_CODECS, defaults to settings.EXPORT_CODEC
+        level (int):
+            Compression level from 0 to 9, defaults to
+            settings.EXPORT_COMPRESSION_LEVEL
+    Returns:
+        (unicode, bool):
+            First item is path of archive within django-storage.
+            Second item is whether a static asset collision was detected.
+    """
+    if codec is None:
+        codec = settings.EXPORT_CODEC
+    output_path = export_path(username, codec)
+    # Storage backends need to know the size of what they save and S3
+    # seeks back to hash it, so the archive is spooled instead of piped.
+    with SpooledTemporaryFile(max_size=TARBALL_SPOOL_MAX_SIZE) as spool:
+        collision = write_archive(resource_ids, spool, codec, level)
+        spool.seek(0)
+
+        # Remove any old paths, including exports in other formats.
+        for old_codec in ARCHIVE_EXTENSIONS:
+            default_storage.delete(export_path(username, old_codec))
+        return default_storage.save(output_path, File(spool)), collision
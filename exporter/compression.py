@@ -0,0 +1,107 @@
+"""
+Compression helpers for exports
+"""
+
+from __future__ import unicode_literals
+
+from collections import deque
+import gzip
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+
+# Uncompressed bytes in each independently compressed gzip member.
+GZIP_BLOCK_SIZE = 1024 * 1024
+
+
+def compress_gzip_block(data, level):
+    """
+    Compress bytes as a complete gzip member.
+
+    Args:
+        data (bytes): Uncompressed data
+        level (int): zlib compression level, 0 stores the data as is
+    Returns:
+        bytes: gzip member
+    """
+    buf = BytesIO()
+    with gzip.GzipFile(
+            fileobj=buf, mode='wb', compresslevel=level, mtime=0) as outfile:
+        outfile.write(data)
+    return buf.getvalue()
+
+
+class ParallelGzipWriter(object):
+    """
+    Write-only file-like object producing a multi-member gzip stream.
+
+    Data is cut into blocks which are compressed on a thread pool, since
+    zlib releases the GIL while it works. Blocks are written to the
+    underlying file in order. Any gzip reader, including the gzip and
+    tarfile modules, reads the members back as a single stream.
+    """
+
+    def __init__(self, fileobj, level, threads, block_size=GZIP_BLOCK_SIZE):
+        """
+        Args:
+            fileobj (file): Writable file-like object for the gzip stream
+            level (int): zlib compression level
+            threads (int): Number of blocks compressed at a time
+            block_size (int): Uncompressed bytes in each block
+        """
+        self.fileobj = fileobj
+        self.level = level
+        self.threads = threads
+        self.block_size = block_size
+        self._buffer = []
+        self._buffered = 0
+        self._window = deque()
+        self._pool = ThreadPool(threads)
+
+    def write(self, data):
+        """
+        Buffer data, compressing it once a block is full.
+
+        Args:
+            data (bytes): Uncompressed data
+        """
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= self.block_size:
+            self._submit()
+
+    def set_level(self, level):
+        """
+        Compress data written from now on with a different level.
+
+        Args:
+            level (int): zlib compression level, 0 stores the data as is
+        """
+        if level != self.level:
+            self._submit()
+            self.level = level
+
+    def _submit(self):
+        """Start compressing the buffered data as a block."""
+        if self._buffered == 0:
+            return
+        data = b"".join(self._buffer)
+        self._buffer = []
+        self._buffered = 0
+        self._window.append(
+            self._pool.apply_async(compress_gzip_block, (data, self.level)))
+        while len(self._window) > self.threads:
+            self.fileobj.write(self._window.popleft().get())
+
+    def close(self):
+        """
+        Compress any buffered data and write all pending blocks. The
+        underlying file is left open.
+        """
+        try:
+            self._submit()
+            while len(self._window) > 0:
+                self.fileobj.write(self._window.popleft().get())
+        finally:
+            self._window.clear()
+            self._pool.terminate()
+            self._pool.join()
@@ -0,0 +1,57 @@
+"""
+Shell command to compare export wall time and archive size across codecs
+"""
+
+from __future__ import unicode_literals
+
+from tempfile import TemporaryFile
+import time
+
+from django.core.management.base import BaseCommand
+
+from exporter.api import EXPORT_CODECS, write_archive
+from learningresources.models import LearningResource
+
+
+class Command(BaseCommand):
+    """
+    Command for benchmark_export
+    """
+    help = "Compares export wall time and archive size across codecs"
+
+    def add_arguments(self, parser):
+        """Command arguments"""
+        parser.add_argument(
+            '--repo', dest='repo_slug',
+            help="Only export resources of this repository")
+        parser.add_argument(
+            '--codec', dest='codecs', action='append', choices=EXPORT_CODECS,
+            help="Codec to benchmark, may be repeated (default: all)")
+        parser.add_argument(
+            '--level', dest='level', type=int,
+            help="Compression level from 0 to 9")
+
+    def handle(self, *args, **options):
+        """Command handler"""
+        resources = LearningResource.objects.all()
+        if options['repo_slug']:
+            resources = resources.filter(
+                course__repository__slug=options['repo_slug'])
+        resource_ids = list(resources.values_list('id', flat=True))
+
+        # Load everything once so each codec starts from a warm export cache.
+        with TemporaryFile() as outfile:
+            write_archive(resource_ids, outfile, "tar", 0)
+
+        self.stdout.write("{count} resources".format(count=len(resource_ids)))
+        self.stdout.write("{codec:<6}{seconds:>10}{size:>16}".format(
+            codec="codec", seconds="seconds", size="bytes"))
+        for codec in options['codecs'] or EXPORT_CODECS:
+            with TemporaryFile() as outfile:
+                start = time.time()
+                write_archive(resource_ids, outfile, codec, options['level'])
+                elapsed = time.time() - start
+                outfile.seek(0, 2)
+                size = outfile.tell()
+            self.stdout.write("{codec:<6}{seconds:>10.2f}{size:>16}".format(
+                codec=codec, seconds=elapsed, size=size))
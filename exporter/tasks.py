@@ -11,21 +11,25 @@ from exporter.api import export_resources_to_tarball
 
 
 @async.task
-def export_resources(learning_resources, username):
+def export_resources(resource_ids, username, codec=None, level=None):
     """
     Asynchronously export learning resources as tarball.
 
     Args:
-        learning_resources (list of learningresources.models.LearningResource):
-            LearningResources to export in tarball
+        resource_ids (list of int):
+            Primary keys of LearningResources to export in tarball
         username (unicode): Name of user
+        codec (unicode): Archive format, defaults to settings.EXPORT_CODEC
+        level (int): Compression level, defaults to
+            settings.EXPORT_COMPRESSION_LEVEL
     Returns:
         dict:
             name is path of tarball.
             url is URL of tarball using django-storage.
             collision is True if a static asset collision was detected.
     """
-    name, collision = export_resources_to_tarball(learning_resources, username)
+    name, collision = export_resources_to_tarball(
+        resource_ids, username, codec, level)
     return {
         "name": name,
         "url": default_storage.url(name),
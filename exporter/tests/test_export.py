@@ -3,16 +3,24 @@ Tests for export
 """
 
 from __future__ import unicode_literals
+import gzip
+from io import BytesIO
 from tempfile import mkdtemp, TemporaryFile
 from shutil import rmtree
 import os
+import tarfile
+import time
+import zipfile
 
 from archive import Archive
+from mock import patch
+from six import StringIO
 from django.core.files import File
 from django.core.files.storage import default_storage
+from django.core.management import call_command
 from django.utils.text import slugify
 
-from learningresources.tests.base import LoreTestCase
+from learningresources.tests.base import LoreTestCase, clear_cache
 from learningresources.models import (
     LearningResource,
     LearningResourceType,
@@ -25,9 +33,19 @@ from learningresources.api import (
     create_course,
 )
 from exporter.api import (
+    _iter_export_members,
+    cache,
+    _load_resources,
+    _prefetch_members,
+    _reserve_cache_bytes,
+    _write_zip_member_from_file,
     export_resources_to_directory,
     export_resources_to_tarball,
+    write_archive,
+    EXPORT_CODECS,
+    TARBALL_SPOOL_MAX_SIZE,
 )
+from exporter.compression import ParallelGzipWriter
 from exporter.tasks import export_resources
 from importer.tasks import import_file
 
@@ -45,7 +63,9 @@ def assert_resource_directory(test_case, resources, tempdir):
         else:
             return "{id}.xml".format(id=resource.id)
 
-    # Key is filename, value is count of filenames encountered.
+    # Key is filename, value maps file contents to the exported filename.
+    # Identical files are exported once, different files with the same
+    # name get a number attached.
     asset_map = {}
 
     # Verify that content XML exists in right place.
@@ -64,25 +84,34 @@ def assert_resource_directory(test_case, resources, tempdir):
                 run=static_asset.course.run
             )
             static_filename = static_asset.asset.name[len(prefix):]
-
-            if static_filename in asset_map:
-                count = asset_map[static_filename]
-                asset_map[static_filename] += 1
-                base, ext = os.path.splitext(static_filename)
-
-                static_filename = "{base}_{count}{ext}".format(
-                    base=base,
-                    ext=ext,
-                    count=count
-                )
-            else:
-                asset_map[static_filename] = 1
-
-            relative_path = os.path.join("static", static_filename)
+            content = static_asset.asset.read()
+
+            exported = asset_map.setdefault(static_filename, {})
+            if content not in exported:
+                if len(exported) > 0:
+                    base, ext = os.path.splitext(static_filename)
+                    exported[content] = "{base}_{count}{ext}".format(
+                        base=base,
+                        ext=ext,
+                        count=len(exported)
+                    )
+                else:
+                    exported[content] = static_filename
+
+            relative_path = os.path.join("static", exported[content])
             abs_path = os.path.join(tempdir, relative_path)
             test_case.assertTrue(os.path.exists(abs_path))
             with open(abs_path, 'rb') as f:
-                test_case.assertEqual(f.read(), static_asset.asset.read())
+                test_case.assertEqual(f.read(), content)
+
+    # Nothing else was exported.
+    exported_assets = []
+    for root, _, files in os.walk(os.path.join(tempdir, "static")):
+        exported_assets.extend(files)
+    test_case.assertEqual(
+        len(exported_assets),
+        sum(len(exported) for exported in asset_map.values())
+    )
 
 
 class TestExport(LoreTestCase):
@@ -133,24 +162,26 @@ class TestExport(LoreTestCase):
     def test_export_resources_to_directory(self):
         """Test exporting learning resources to directory."""
 
-        resources = LearningResource.objects.all()
+        resources = LearningResource.objects.order_by('id')
 
-        tempdir, collision = export_resources_to_directory(resources)
+        tempdir, collision = export_resources_to_directory(
+            [resource.id for resource in resources])
         try:
-            self.assertTrue(collision)
+            # Assets shared by several resources are exported only once.
+            self.assertFalse(collision)
             assert_resource_directory(self, resources, tempdir)
         finally:
             rmtree(tempdir)
 
     def test_export_resources_to_tarball(self):
         """Test exporting learning resources to tarball."""
-        resources = LearningResource.objects.all()
+        resources = LearningResource.objects.order_by('id')
 
         path, collision = export_resources_to_tarball(
-            resources, self.user.username)
+            [resource.id for resource in resources], self.user.username)
         tempdir = mkdtemp()
 
-        self.assertTrue(collision)
+        self.assertFalse(collision)
 
         # HACK: Have to patch in "seekable" attribute for python3 and tar
         # See: https://code.djangoproject.com/ticket/24963#ticket. Remove
@@ -169,17 +200,277 @@ class TestExport(LoreTestCase):
             rmtree(tempdir)
             default_storage.delete(path)
 
+    def test_export_tarball_without_temp_directory(self):
+        """
+        Test that the tarball is built without a temporary directory
+        or changing the working directory.
+        """
+        resources = LearningResource.objects.order_by('id')
+
+        with patch('exporter.api.mkdtemp') as mock_mkdtemp, patch(
+                'os.chdir') as mock_chdir:
+            path, _ = export_resources_to_tarball(
+                [resource.id for resource in resources], self.user.username)
+        try:
+            self.assertFalse(mock_mkdtemp.called)
+            self.assertFalse(mock_chdir.called)
+            with default_storage.open(path) as tarball, tarfile.open(
+                    fileobj=BytesIO(tarball.read()), mode="r:gz") as archive:
+                names = archive.getnames()
+            self.assertEqual(len(names), len(set(names)))
+            for resource in resources:
+                self.assertTrue(any(
+                    name.startswith("{type}/{id}".format(
+                        type=resource.learning_resource_type.name,
+                        id=resource.id,
+                    )) for name in names
+                ))
+        finally:
+            default_storage.delete(path)
+
+    def test_export_prefetch_window(self):
+        """
+        Test that members fetched in parallel come out in order and intact,
+        with a small window and assets spooled out of memory.
+        """
+        resources = LearningResource.objects.order_by('id')
+        resource_ids = [resource.id for resource in resources]
+        expected = [
+            path for path, _, _, _ in _iter_export_members(resource_ids)
+        ]
+
+        with self.settings(EXPORT_ASSET_THREADS=2, EXPORT_ASSET_MAX_MEMORY=1):
+            members = list(_prefetch_members(
+                _iter_export_members(resource_ids)))
+            self.assertEqual([path for path, _, _, _ in members], expected)
+            for _, size, opener, _ in members:
+                with opener() as infile:
+                    self.assertEqual(len(infile.read()), size)
+
+            tempdir, collision = export_resources_to_directory(resource_ids)
+        try:
+            self.assertFalse(collision)
+            assert_resource_directory(self, resources, tempdir)
+        finally:
+            rmtree(tempdir)
+
+    def test_export_num_queries(self):
+        """
+        Test that loading resources for export takes a fixed number of
+        queries regardless of the number of resources and static assets.
+        """
+        resource_ids = list(
+            LearningResource.objects.values_list('id', flat=True))
+        with self.assertNumQueries(2):
+            for resource in _load_resources(resource_ids):
+                self.assertIsNotNone(resource.learning_resource_type.name)
+                for static_asset in resource.static_assets.all():
+                    self.assertIsNotNone(static_asset.course.org)
+
+    def test_export_cache(self):
+        """
+        Test that a repeated export reuses cached resources and static
+        assets and only regenerates what changed.
+        """
+        resources = LearningResource.objects.order_by('id')
+        resource_ids = [resource.id for resource in resources]
+        with self.settings(EXPORT_CACHE_MAX_ITEM_SIZE=TARBALL_SPOOL_MAX_SIZE):
+            tempdir, _ = export_resources_to_directory(resource_ids)
+        rmtree(tempdir)
+
+        with patch(
+            'exporter.api._load_resources', wraps=_load_resources
+        ) as mock_load, patch(
+            'exporter.api.default_storage.open'
+        ) as mock_open:
+            tempdir, collision = export_resources_to_directory(resource_ids)
+        try:
+            mock_load.assert_called_once_with([])
+            self.assertFalse(mock_open.called)
+            self.assertFalse(collision)
+            assert_resource_directory(self, resources, tempdir)
+        finally:
+            rmtree(tempdir)
+
+        # Only the modified resource is loaded again.
+        self.resource.content_xml = "<changed />"
+        self.resource.save()
+        with patch(
+            'exporter.api._load_resources', wraps=_load_resources
+        ) as mock_load:
+            tempdir, _ = export_resources_to_directory(resource_ids)
+        try:
+            mock_load.assert_called_once_with([self.resource.id])
+            assert_resource_directory(
+                self, LearningResource.objects.order_by('id'), tempdir)
+        finally:
+            rmtree(tempdir)
+
+        # Nothing is cached for items over the size limit.
+        clear_cache("lore_export")
+        with self.settings(EXPORT_CACHE_MAX_ITEM_SIZE=0):
+            tempdir, _ = export_resources_to_directory(resource_ids)
+            rmtree(tempdir)
+            with patch(
+                'exporter.api._load_resources', wraps=_load_resources
+            ) as mock_load:
+                tempdir, _ = export_resources_to_directory(resource_ids)
+                rmtree(tempdir)
+        self.assertIn(self.resource.id, mock_load.call_args[0][0])
+
+    def test_export_cache_budget(self):
+        """
+        Test that nothing more is cached once EXPORT_CACHE_MAX_BYTES are
+        in the cache, counting the entries of the previous window too.
+        """
+        now = time.time()
+        with patch('exporter.api.time.time', return_value=now):
+            with self.settings(EXPORT_CACHE_MAX_BYTES=10):
+                self.assertTrue(_reserve_cache_bytes(6))
+                self.assertFalse(_reserve_cache_bytes(6))
+                self.assertTrue(_reserve_cache_bytes(4))
+        with patch(
+            'exporter.api.time.time',
+            return_value=now + cache.default_timeout
+        ):
+            with self.settings(EXPORT_CACHE_MAX_BYTES=12):
+                self.assertTrue(_reserve_cache_bytes(2))
+                self.assertFalse(_reserve_cache_bytes(1))
+
+        clear_cache("lore_export")
+        resource_ids = list(
+            LearningResource.objects.values_list('id', flat=True))
+        with self.settings(EXPORT_CACHE_MAX_BYTES=0):
+            tempdir, _ = export_resources_to_directory(resource_ids)
+            rmtree(tempdir)
+            with patch(
+                'exporter.api._load_resources', wraps=_load_resources
+            ) as mock_load:
+                tempdir, _ = export_resources_to_directory(resource_ids)
+                rmtree(tempdir)
+        self.assertEqual(
+            sorted(mock_load.call_args[0][0]), sorted(resource_ids))
+
+    def test_export_codecs(self):
+        """
+        Test that every codec produces an archive with the same files,
+        and that zip archives store already compressed files.
+        """
+        with TemporaryFile() as temp:
+            temp.write(b"not really a png")
+            asset = create_static_asset(
+                self.resource.course.id, File(temp, name="picture.png"))
+        self.addCleanup(default_storage.delete, asset.asset.name)
+        self.resource.static_assets.add(asset)
+
+        resource_ids = [
+            resource.id for resource in LearningResource.objects.all()]
+        contents = {}
+        for codec in EXPORT_CODECS:
+            outfile = BytesIO()
+            with self.settings(EXPORT_COMPRESSION_THREADS=2):
+                write_archive(resource_ids, outfile, codec, 9)
+            outfile.seek(0)
+            if codec == "zip":
+                with zipfile.ZipFile(outfile) as archive:
+                    contents[codec] = {
+                        info.filename: archive.read(info)
+                        for info in archive.infolist()
+                    }
+                    self.assertEqual(
+                        archive.getinfo("static/picture.png").compress_type,
+                        zipfile.ZIP_STORED
+                    )
+            else:
+                with tarfile.open(fileobj=outfile, mode="r:*") as archive:
+                    contents[codec] = {
+                        info.name: archive.extractfile(info).read()
+                        for info in archive.getmembers()
+                    }
+        self.assertEqual(
+            contents["gz"]["static/picture.png"], b"not really a png")
+        for codec in EXPORT_CODECS:
+            self.assertEqual(contents[codec], contents["gz"])
+
+        path, _ = export_resources_to_tarball(
+            resource_ids, self.user.username, "zip")
+        try:
+            self.assertTrue(path.endswith("{name}_exports.zip".format(
+                name=self.user.username)))
+        finally:
+            default_storage.delete(path)
+
+    def test_zip_without_streaming(self):
+        """
+        Test that zip members are written through temporary files,
+        not read into memory, when ZipFile.open() can't write.
+        """
+        resource_ids = [
+            resource.id for resource in LearningResource.objects.all()]
+        expected = BytesIO()
+        write_archive(resource_ids, expected, "zip", 9)
+        outfile = BytesIO()
+        with patch('exporter.api.ZIP_STREAMING', False), self.settings(
+            EXPORT_ASSET_MAX_MEMORY=0
+        ), patch(
+            'exporter.api._write_zip_member_from_file',
+            wraps=_write_zip_member_from_file
+        ) as mock_write:
+            write_archive(resource_ids, outfile, "zip", 9)
+        self.assertEqual(mock_write.call_count, len(resource_ids))
+        for archive_file in (expected, outfile):
+            archive_file.seek(0)
+        with zipfile.ZipFile(expected) as expected_archive, \
+                zipfile.ZipFile(outfile) as archive:
+            self.assertEqual(
+                sorted(archive.namelist()),
+                sorted(expected_archive.namelist())
+            )
+            for name in archive.namelist():
+                self.assertEqual(
+                    archive.read(name), expected_archive.read(name))
+                self.assertEqual(
+                    archive.getinfo(name).external_attr >> 16 & 0o777, 0o644)
+
+    def test_parallel_gzip_writer(self):
+        """
+        Test that blocks compressed in parallel at different levels read
+        back as one gzip stream.
+        """
+        outfile = BytesIO()
+        writer = ParallelGzipWriter(outfile, 9, 3, block_size=10)
+        expected = b""
+        for i in range(50):
+            data = "line {i}\n".format(i=i).encode('ascii')
+            if i % 7 == 0:
+                writer.set_level(i % 10)
+            writer.write(data)
+            expected += data
+        writer.close()
+        outfile.seek(0)
+        with gzip.GzipFile(fileobj=outfile, mode='rb') as infile:
+            self.assertEqual(infile.read(), expected)
+
+    def test_benchmark_export(self):
+        """Test that the benchmark reports every codec."""
+        out = StringIO()
+        call_command(
+            "benchmark_export", repo_slug=self.repo.slug, stdout=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(
+            [line.split()[0] for line in lines[2:]], list(EXPORT_CODECS))
+
     def test_export_task(self):
         """Test exporting resources task."""
-        resources = LearningResource.objects.all()
+        resources = LearningResource.objects.order_by('id')
 
         result = export_resources.delay(
-            resources, self.user.username).get()
+            [resource.id for resource in resources], self.user.username).get()
         path = result['name']
         collision = result['collision']
         tempdir = mkdtemp()
 
-        self.assertTrue(collision)
+        self.assertFalse(collision)
 
         # HACK: Have to patch in "seekable" attribute for python3 and tar
         # See: https://code.djangoproject.com/ticket/24963#ticket. Remove
@@ -260,7 +551,7 @@ class TestExport(LoreTestCase):
 
                     resources = [self.resource, resource2]
                     tempdir, collision = export_resources_to_directory(
-                        resources)
+                        [resource.id for resource in resources])
                     try:
                         self.assertTrue(collision)
                         assert_resource_directory(self, resources, tempdir)
@@ -269,3 +560,57 @@ class TestExport(LoreTestCase):
                 finally:
                     default_storage.delete(asset1.asset.name)
                     default_storage.delete(asset2.asset.name)
+
+    def test_duplicate_identical_content(self):
+        """
+        Test that static assets with the same file path and the same
+        contents are exported once and not reported as a collision.
+        """
+        static_filename = "iamthesame.txt"
+        course2 = create_course(
+            "org2", self.repo.id, self.resource.course.course_number,
+            self.resource.course.run, self.user.id
+        )
+        resource2 = create_resource(
+            course=course2,
+            parent=None,
+            resource_type=self.resource.learning_resource_type.name,
+            title=self.resource.title,
+            dpath="",
+            mpath="",
+            content_xml="",
+            url_name=self.resource.url_name
+        )
+
+        assets = []
+        for resource in (self.resource, resource2):
+            with TemporaryFile() as temp:
+                temp.write(b"same")
+                asset = create_static_asset(
+                    resource.course.id, File(temp, name=static_filename))
+            self.addCleanup(default_storage.delete, asset.asset.name)
+            resource.static_assets.add(asset)
+            assets.append(asset)
+        # The first asset is also shared by the second resource.
+        resource2.static_assets.add(assets[0])
+
+        resources = [self.resource, resource2]
+        resource_ids = [resource.id for resource in resources]
+        # The shared asset is only read once.
+        self.assertEqual(
+            len([
+                path for path, _, _, _ in _iter_export_members(resource_ids)
+                if path.endswith(static_filename)
+            ]),
+            len(assets)
+        )
+
+        tempdir, collision = export_resources_to_directory(resource_ids)
+        try:
+            self.assertFalse(collision)
+            exported = os.listdir(os.path.join(tempdir, "static"))
+            self.assertIn(static_filename, exported)
+            self.assertNotIn("iamthesame_1.txt", exported)
+            assert_resource_directory(self, resources, tempdir)
+        finally:
+            rmtree(tempdir)
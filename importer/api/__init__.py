@@ -25,8 +25,8 @@ from learningresources.api import (
     get_resources,
     get_video_sub,
     import_static_assets,
-    join_description_paths,
     MissingTitle,
+    update_subtree_description_paths,
 )
 from learningresources.models import (
     LearningResource,
@@ -135,7 +135,10 @@ def import_course(bundle, repo_id, user_id, static_dir):
         user_id=user_id,
     )
     import_static_assets(course, static_dir)
-    import_children(course, src, None, '')
+    root = import_children(course, src, None)
+    # Description paths of the whole course are set at once, the same way
+    # as after any other title or parent change, and indexed below.
+    update_subtree_description_paths([root.id], reindex=False)
     populate_xanalytics_fields.delay(course.id)
     # This triggers a bulk indexing of all LearningResource instances
     # for the course at once.
@@ -158,28 +161,24 @@ def is_leaf_tag(tag):
 
 
 # pylint: disable=too-many-branches
-def import_children(course, element, parent, parent_dpath):
+def import_children(course, element, parent):
     """
     Create LearningResource instances for each element
-    of an XML tree.
+    of an XML tree. Description paths are left empty for
+    update_subtree_description_paths.
 
     Args:
         course (learningresources.models.Course): Course
         element (lxml.etree): XML element within xbundle
         parent (learningresources.models.LearningResource):
             Parent LearningResource
-        parent_dpath (unicode): parent description path
     Returns:
-        None
+        learningresources.models.LearningResource: Resource of the element
     """
     # pylint: disable=too-many-locals
     title = element.attrib.get(
         "display_name", MissingTitle.for_title_field)
-    desc_path = title
-    if desc_path == MissingTitle.for_title_field:
-        desc_path = MissingTitle.for_desc_path_field
     mpath = etree.ElementTree(element).getpath(element)
-    dpath = join_description_paths(parent_dpath, desc_path)
     url_name = element.attrib.get(
         "url_name",
         element.attrib.get("display_name", None)
@@ -190,7 +189,7 @@ def import_children(course, element, parent, parent_dpath):
         content_xml=etree.tostring(element),
         mpath=mpath,
         url_name=url_name,
-        dpath=dpath,
+        dpath='',
     )
     # temp variable to store static assets for bulk insert
     static_assets_to_save = set()
@@ -250,4 +249,5 @@ def import_children(course, element, parent, parent_dpath):
     if not is_leaf_tag(element.tag):
         for child in element.getchildren():
             if child.tag in DESCRIPTOR_TAGS:
-                import_children(course, child, resource, dpath)
+                import_children(course, child, resource)
+    return resource
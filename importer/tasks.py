@@ -3,20 +3,30 @@ Celery tasks for import module.
 """
 from __future__ import unicode_literals
 
-import json
 import logging
+import time
 
 from django.conf import settings
-import requests
+from django.core.cache import caches
 from statsd.defaults.django import statsd
 
 from lore.celery import async
-from learningresources.api import update_xanalytics
-from xanalytics import send_request, get_result
+from learningresources.api import update_xanalytics_records
+from xanalytics import send_request
+from xanalytics.poller import (
+    INITIAL_WAIT,
+    XanalyticsPoller,
+    register_job,
+    seconds_until_next_check,
+)
 
 log = logging.getLogger(__name__)
 
-RETRY_LIMIT = 10
+# Shared by all worker processes, so only one of them polls at a time.
+lock_cache = caches["lore_locks"]
+POLLER_LOCK_KEY = "xanalytics_poller"
+# Seconds the poller lock outlives the poller's next expected check.
+POLLER_LOCK_TIMEOUT = 5 * 60
 
 
 @async.task
@@ -31,37 +41,46 @@ def import_file(path, repo_id, user_id):
 def populate_xanalytics_fields(course_id):
     """
     Initiate request to xanalytics API to get stats for a course,
-    then trigger async job to retrieve results when they become available.
+    then make sure a poller will retrieve results when they become available.
     Args:
         course_id (int): primary key of a Course
     """
     if settings.XANALYTICS_URL != "":
-        token = send_request(settings.XANALYTICS_URL + "/create", course_id)
-        check_for_results.apply_async(
-            kwargs={"token": token, "wait": 5, "attempt": 1}, countdown=5)
+        resp = send_request(settings.XANALYTICS_URL + "/create", course_id)
+        token = resp.get("token")
+        if token is None:
+            log.error("No xanalytics token for course %s: %s", course_id, resp)
+            return
+        register_job(course_id, token)
+        poll_xanalytics.apply_async(countdown=INITIAL_WAIT)
 
 
 @async.task
-def check_for_results(token, wait, attempt):
+def poll_xanalytics():
     """
-    Check for xanalytics results for a course.
-    Args:
-        token (string): Token received from xanalytics server.
-        wait (int): Seconds to wait before repository.
-        attempt (int): Attempt number, so we don't try forever.
+    Check all outstanding xanalytics jobs until none are left, ingesting
+    results as they complete. Only one poller runs at a time, other
+    invocations return immediately.
     """
-    resp = get_result(settings.XANALYTICS_URL + "/status", token)
-    if resp["status"] == "still busy" and attempt < RETRY_LIMIT:
-        attempt += 1
-        wait *= 2
-        check_for_results.apply_async(
-            kwargs={"token": token, "wait": wait, "attempt": attempt},
-            countdown=wait,
-        )
-    if resp["status"] == "complete":
-        content = requests.get(resp["url"]).content
-        try:
-            data = json.loads(content)
-            update_xanalytics(data)
-        except (ValueError, TypeError):
-            log.error("Unable to parse xanalytics response: %s", content)
+    if not lock_cache.add(POLLER_LOCK_KEY, True, POLLER_LOCK_TIMEOUT):
+        return
+    poller = XanalyticsPoller(
+        settings.XANALYTICS_URL,
+        update_xanalytics_records,
+        settings.XANALYTICS_POLL_THREADS,
+    )
+    try:
+        while True:
+            poller.poll()
+            wait = seconds_until_next_check()
+            if wait is None:
+                break
+            lock_cache.set(POLLER_LOCK_KEY, True, wait + POLLER_LOCK_TIMEOUT)
+            time.sleep(wait)
+    finally:
+        poller.close()
+        lock_cache.delete(POLLER_LOCK_KEY)
+        # A job may have been registered while the lock was being
+        # released, or left behind if polling failed.
+        if seconds_until_next_check() is not None:
+            poll_xanalytics.apply_async(countdown=INITIAL_WAIT)
@@ -365,6 +365,42 @@ class TestImportToy(LoreTestCase):
             )
         )
 
+    def test_description_paths(self):
+        """
+        Description paths are set from the titles of the imported
+        resources and of their ancestors.
+        """
+        xml = """
+<course org="DevOps" course="0.002" url_name="2015_Summer"
+    semester="2015_Summer">
+  <chapter display_name="Week 1">
+    <sequential>
+      <vertical display_name="Unit">
+        <html display_name="Page"></html>
+      </vertical>
+    </sequential>
+  </chapter>
+</course>
+"""
+        bundle = XBundle(
+            keep_urls=True, keep_studio_urls=True, preserve_url_name=True
+        )
+        bundle.set_course(etree.fromstring(xml))
+
+        course = import_course(bundle, self.repo.id, self.user.id, "")
+
+        self.assertEqual(
+            dict(LearningResource.objects.filter(course=course).values_list(
+                'learning_resource_type__name', 'description_path')),
+            {
+                "course": "...",
+                "chapter": "... / Week 1",
+                "sequential": "... / Week 1 / ...",
+                "vertical": "... / Week 1 / ... / Unit",
+                "html": "... / Week 1 / ... / Unit / Page",
+            }
+        )
+
     def test_missing_preview_link(self):
         """
         Test that if url_name is blank we try importing each parent
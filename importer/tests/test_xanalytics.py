@@ -1,121 +1,275 @@
 """
-Tests for hitting the xanalytics Celery tasks.
+Tests for the xanalytics Celery tasks, against a local stand-in for the
+xanalytics server.
 """
 
 from __future__ import unicode_literals
 
 import json
 import logging
+from threading import Thread
 
 from django.conf import settings
-import responses
+from django.core.cache import caches
+from django.db import DatabaseError
+from django.utils import timezone
+from mock import patch
+# pylint: disable=import-error
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from six.moves.urllib.parse import parse_qs
 
-from importer.tasks import populate_xanalytics_fields, check_for_results
+from importer.tasks import (
+    populate_xanalytics_fields,
+    poll_xanalytics,
+    lock_cache,
+    POLLER_LOCK_KEY,
+)
+from learningresources.api import update_xanalytics_records
+from learningresources.models import LearningResource
 from learningresources.tests.base import LoreTestCase
+from xanalytics.models import XanalyticsJob
+from xanalytics.poller import register_job
 
 log = logging.getLogger(__name__)
-# pylint: disable=no-self-use
 
 
-class TestAPI(LoreTestCase):
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers like the xanalytics API, from data set by the test."""
+
+    def _send_json(self, data, status=200):
+        """Send a JSON response."""
+        body = data if isinstance(data, bytes) else json.dumps(data).encode(
+            'utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):  # pylint: disable=invalid-name
+        """Create jobs and report their status."""
+        length = int(self.headers["Content-Length"])
+        params = parse_qs(self.rfile.read(length).decode('utf-8'))
+        if self.path == "/create":
+            self._send_json(
+                {"token": "token{0}".format(params["course_id"][0])})
+        elif self.path == "/status":
+            token = params["token"][0]
+            self.server.status_calls.append(token)
+            statuses = self.server.statuses[token]
+            status = statuses.pop(0) if len(statuses) > 1 else statuses[0]
+            if status == "broken":
+                self._send_json(b"Internal Server Error", status=500)
+            elif status == "complete":
+                self._send_json({
+                    "status": status,
+                    "url": "{base}/results/{token}.json".format(
+                        base=self.server.url, token=token),
+                })
+            else:
+                self._send_json({"status": status})
+        else:
+            self._send_json({}, status=404)
+
+    def do_GET(self):  # pylint: disable=invalid-name
+        """Serve job results."""
+        token = self.path[len("/results/"):-len(".json")]
+        self._send_json(self.server.results[token])
+
+    def log_message(self, *args):  # pylint: disable=arguments-differ
+        """Keep test output quiet."""
+        pass
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """Threaded stand-in xanalytics server."""
+    daemon_threads = True
+
+
+class TestXanalyticsTasks(LoreTestCase):
     """
-    Tests using mocks to avoid actual HTTP requests.
+    Tests for requesting and polling xanalytics jobs.
     """
     def setUp(self):
-        """Override setting."""
-        super(TestAPI, self).setUp()
+        """Start the stand-in server and point the settings at it."""
+        super(TestXanalyticsTasks, self).setUp()
+        self.server = StandInServer(("127.0.0.1", 0), StandInHandler)
+        self.server.url = "http://127.0.0.1:{port}".format(
+            port=self.server.server_address[1])
+        self.server.statuses = {}
+        self.server.results = {}
+        self.server.status_calls = []
+        thread = Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
         self.original_url = settings.XANALYTICS_URL
-        settings.XANALYTICS_URL = "http://example.com"
+        settings.XANALYTICS_URL = self.server.url
+        lock_cache.delete(POLLER_LOCK_KEY)
+
+        self.resource.uuid = "module1"
+        self.resource.save()
 
     def tearDown(self):
-        """Restore original setting."""
-        super(TestAPI, self).tearDown()
+        """Stop the server and restore original setting."""
+        super(TestXanalyticsTasks, self).tearDown()
+        self.server.shutdown()
+        self.server.server_close()
         settings.XANALYTICS_URL = self.original_url
 
-    @responses.activate
-    def test_populate_xanalytics_fields(self):
-        """Test kicking off a request."""
-        responses.add(
-            responses.POST,
-            'http://example.com/create',
-            body='{"token": "abcde"}',
-            content_type="application/json"
-        )
-        # We must mock the /status endpoint as well,
-        # because a status check is queued when /create is called.
-        reply = {"status": "still busy"}
-        responses.add(
-            responses.POST,
-            'http://example.com/status',
-            body=json.dumps(reply),
-            content_type="application/json"
-        )
-        populate_xanalytics_fields(1234)
-
-    @responses.activate
-    def test_check_for_results_waiting(self):
-        """Test kicking off a request."""
-        reply = {"status": "still busy"}
-        responses.add(
-            responses.POST,
-            'http://example.com/status',
-            body=json.dumps(reply),
-            content_type="application/json"
-        )
-        check_for_results("abcde", 10, 1)
+    def add_job(self, token, statuses, result):
+        """Register a job the stand-in server knows about."""
+        self.server.statuses[token] = statuses
+        self.server.results[token] = result
+        return register_job(self.course.id, token)
 
-    @responses.activate
-    def test_check_for_results_done(self):
-        """Test kicking off a request."""
-        file_reply = {
-            "course_id": "123",
+    def result(self, views):
+        """xanalytics result for the test resource."""
+        return {
+            "course_id": self.course.course_number,
             "module_medata": [
-                {
-                    "module_id": "1",
-                    "xa_nr_views": "3",
-                    "xa_nr_attempts": "25"
-                },
-                {
-                    "module_id": "2",
-                    "xa_nr_views": "7",
-                    "xa_nr_attempts": "99"
-
-                }
+                {"module_id": "module1", "xa_nr_views": str(views)},
             ]
         }
-        responses.add(
-            responses.GET,
-            'http://example.com/foo.json',
-            body=json.dumps(file_reply),
-            content_type="application/json"
-        )
 
-        reply = {"status": "complete", "url": "http://example.com/foo.json"}
-        responses.add(
-            responses.POST,
-            'http://example.com/status',
-            body=json.dumps(reply),
-            content_type="application/json"
-        )
-        check_for_results("abcde", 10, 1)
-
-    @responses.activate
-    def test_check_for_results_bad(self):
-        """Test kicking off a request."""
-        responses.add(
-            responses.GET,
-            'http://example.com/foo.json',
-            body='{"invalid": "JSON", "because": "developer comma",}',
-            content_type="application/json"
-        )
-        reply = {"status": "complete", "url": "http://example.com/foo.json"}
-        responses.add(
-            responses.POST,
-            'http://example.com/status',
-            body=json.dumps(reply),
-            content_type="application/json"
-        )
-        self.assertRaises(
-            ValueError,
-            check_for_results("abcde", 10, 1)
+    @staticmethod
+    def fake_sleep(_):
+        """Make every outstanding job due instead of sleeping."""
+        XanalyticsJob.objects.update(next_check=timezone.now())
+
+    def test_populate_xanalytics_fields(self):
+        """Requesting stats registers the job and starts a poller."""
+        with patch(
+            'importer.tasks.poll_xanalytics.apply_async'
+        ) as mock_poll:
+            populate_xanalytics_fields(self.course.id)
+        job = XanalyticsJob.objects.get()
+        self.assertEqual(job.course_id, self.course.id)
+        self.assertEqual(job.token, "token{0}".format(self.course.id))
+        self.assertTrue(mock_poll.called)
+
+    def test_poll(self):
+        """
+        All outstanding jobs are checked each round and results are
+        ingested as they complete.
+        """
+        self.add_job("busy", ["still busy", "complete"], self.result(7))
+        self.add_job("done", ["complete"], self.result(3))
+        self.fake_sleep(0)
+
+        with patch('importer.tasks.time.sleep', self.fake_sleep):
+            poll_xanalytics()
+
+        self.assertEqual(
+            sorted(self.server.status_calls), ["busy", "busy", "done"])
+        self.assertEqual(XanalyticsJob.objects.count(), 0)
+        self.assertEqual(
+            LearningResource.objects.get(id=self.resource.id).xa_nr_views, 7)
+        self.assertIsNone(lock_cache.get(POLLER_LOCK_KEY))
+
+    def test_poll_gives_up(self):
+        """Jobs which stay busy are dropped after RETRY_LIMIT checks."""
+        self.add_job("busy", ["still busy"], self.result(7))
+        self.fake_sleep(0)
+
+        with patch('xanalytics.poller.RETRY_LIMIT', 3), patch(
+                'importer.tasks.time.sleep', self.fake_sleep):
+            poll_xanalytics()
+
+        self.assertEqual(self.server.status_calls, ["busy"] * 3)
+        self.assertEqual(XanalyticsJob.objects.count(), 0)
+        self.assertEqual(
+            LearningResource.objects.get(id=self.resource.id).xa_nr_views, 0)
+
+    def test_poll_retries_failed_checks(self):
+        """Status checks which fail are retried like busy jobs."""
+        self.add_job("flaky", ["broken", "complete"], self.result(5))
+        self.fake_sleep(0)
+
+        with patch('importer.tasks.time.sleep', self.fake_sleep):
+            poll_xanalytics()
+
+        self.assertEqual(self.server.status_calls, ["flaky"] * 2)
+        self.assertEqual(XanalyticsJob.objects.count(), 0)
+        self.assertEqual(
+            LearningResource.objects.get(id=self.resource.id).xa_nr_views, 5)
+
+    def test_poll_retries_failed_ingest(self):
+        """Results which fail to be saved are fetched again later."""
+        self.add_job("done", ["complete"], self.result(3))
+        self.fake_sleep(0)
+        calls = []
+
+        def ingest(course_number, records):
+            """Fail the first time."""
+            calls.append(course_number)
+            if len(calls) == 1:
+                raise DatabaseError("connection lost")
+            return update_xanalytics_records(course_number, records)
+
+        with patch('importer.tasks.update_xanalytics_records', ingest), \
+                patch('importer.tasks.time.sleep', self.fake_sleep):
+            poll_xanalytics()
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(XanalyticsJob.objects.count(), 0)
+        self.assertEqual(
+            LearningResource.objects.get(id=self.resource.id).xa_nr_views, 3)
+
+    def test_poll_bad_result(self):
+        """Results which aren't JSON are logged and dropped."""
+        self.add_job(
+            "bad", ["complete"],
+            b'{"invalid": "JSON", "because": "developer comma",}'
         )
+        self.fake_sleep(0)
+
+        poll_xanalytics()
+
+        self.assertEqual(XanalyticsJob.objects.count(), 0)
+        self.assertEqual(
+            LearningResource.objects.get(id=self.resource.id).xa_nr_views, 0)
+
+    def test_single_poller(self):
+        """Only one poller runs at a time."""
+        self.add_job("done", ["complete"], self.result(3))
+        self.fake_sleep(0)
+        self.assertTrue(self.in_other_worker(
+            lambda cache: cache.add(POLLER_LOCK_KEY, True)))
+
+        poll_xanalytics()
+
+        self.assertEqual(self.server.status_calls, [])
+        self.assertEqual(XanalyticsJob.objects.count(), 1)
+        lock_cache.delete(POLLER_LOCK_KEY)
+
+    def in_other_worker(self, func):
+        """
+        Call func with a lock cache client of its own, in another thread,
+        like another worker process would have.
+        """
+        results = []
+
+        def run():
+            """Use the cache client of this thread."""
+            cache = caches["lore_locks"]
+            results.append((cache is lock_cache, func(cache)))
+
+        thread = Thread(target=run)
+        thread.start()
+        thread.join()
+        same_client, result = results[0]
+        self.assertFalse(same_client)
+        return result
+
+    def test_lock_shared(self):
+        """Other cache clients can't take the lock while it's held."""
+        self.assertTrue(lock_cache.add(POLLER_LOCK_KEY, True))
+        self.assertFalse(self.in_other_worker(
+            lambda cache: cache.add(POLLER_LOCK_KEY, True)))
+        lock_cache.delete(POLLER_LOCK_KEY)
+        self.assertTrue(self.in_other_worker(
+            lambda cache: cache.add(POLLER_LOCK_KEY, True)))
+        self.assertFalse(lock_cache.add(POLLER_LOCK_KEY, True))
+        lock_cache.delete(POLLER_LOCK_KEY)
@@ -5,23 +5,58 @@ apps don't tie functionality to internal implementation.
 
 from __future__ import unicode_literals
 
+from collections import defaultdict
+from itertools import islice  # pylint: disable=no-name-in-module
 import logging
+from multiprocessing.pool import ThreadPool
 from os import walk, sep
 from os.path import join
+import time
 
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
 from django.core.files import File
-from django.db import transaction
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+from statsd.defaults.django import statsd
 
-from guardian.shortcuts import get_objects_for_user, get_perms
+from guardian.shortcuts import get_objects_for_user
 
 from learningresources.models import (
     Course, Repository, LearningResource, LearningResourceType, StaticAsset
 )
-from roles.permissions import RepoPermission
+from rest.util import bulk_slugify, slugs_with_prefixes
+from roles.api import (
+    assign_user_to_repos_group,
+    get_cached_repo_ids,
+    get_repo_perms,
+    roles_init_new_repos,
+    set_cached_repo_ids,
+)
+from roles.permissions import GroupTypes, RepoPermission
 
 log = logging.getLogger(__name__)
 
+# Number of LearningResources deleted per transaction when deleting a course.
+DELETE_CHUNK_SIZE = 500
+# Number of threads deleting static asset files in parallel.
+DELETE_ASSET_THREADS = 8
+# LearningResource fields set from xanalytics module records.
+XANALYTICS_FIELDS = (
+    "xa_nr_views",
+    "xa_nr_attempts",
+    "xa_avg_grade",
+    "xa_histogram_grade",
+)
+# xanalytics fields which the analytics rollups total.
+XANALYTICS_ROLLUP_FIELDS = ("xa_nr_views", "xa_nr_attempts", "xa_avg_grade")
+# Number of xanalytics module records applied per UPDATE.
+XANALYTICS_BATCH_SIZE = 1000
+# Number of LearningResources set per UPDATE by bulk_update_resources.
+BULK_UPDATE_CHUNK_SIZE = 500
+
 
 class LearningResourceException(Exception):
     """Base class for our custom exceptions."""
@@ -86,6 +121,57 @@ def create_course(org, repo_id, course_number, run, user_id):
     return course
 
 
+def delete_course(course_id):
+    """
+    Delete a course with all of its LearningResources and StaticAssets,
+    including their search index entries and files.
+
+    LearningResources are deleted in chunks, newest first so that children
+    go before their parents, instead of in one cascade which would hold
+    every row in memory and in a single transaction.
+
+    Args:
+        course_id (int): Primary key of the course
+    Returns:
+        int: Number of LearningResources deleted
+    """
+    from search.signals import suppress_index_signals
+    from search.utils import delete_resources_from_index
+    from xanalytics.rollups import apply_rollup_deltas, course_removal_deltas
+
+    course = Course.objects.get(id=course_id)
+    rollup_deltas = course_removal_deltas([course_id])
+    resource_ids = list(LearningResource.objects.filter(
+        course__id=course_id
+    ).order_by('-id').values_list('id', flat=True))
+    asset_paths = list(StaticAsset.objects.filter(
+        course__id=course_id
+    ).values_list('asset', flat=True))
+
+    with suppress_index_signals():
+        ids = iter(resource_ids)
+        chunk = list(islice(ids, DELETE_CHUNK_SIZE))
+        while len(chunk) > 0:
+            with transaction.atomic():
+                LearningResource.objects.filter(id__in=chunk).delete()
+            chunk = list(islice(ids, DELETE_CHUNK_SIZE))
+        with transaction.atomic():
+            course.delete()
+
+    # Drop the course rollup and take its resources out of the rollups of
+    # their terms and resource types.
+    apply_rollup_deltas(rollup_deltas)
+    delete_resources_from_index(resource_ids)
+
+    pool = ThreadPool(DELETE_ASSET_THREADS)
+    try:
+        pool.map(default_storage.delete, asset_paths)
+    finally:
+        pool.close()
+        pool.join()
+    return len(resource_ids)
+
+
 # pylint: disable=too-many-arguments
 def create_resource(
         course, parent, resource_type, title, content_xml, mpath, url_name,
@@ -147,22 +233,29 @@ def get_repos(user_id):
     """
     Get all repositories a user may access.
 
+    The ids of the repositories are cached until the roles of the user
+    change, so only the repositories themselves are queried.
+
     Args:
         user_id (int): Primary key of user
     Returns:
         repos (query set of learningresource.Repository): Repositories
     """
-    try:
-        user = User.objects.get(id=user_id)
-    except User.DoesNotExist:
-        raise PermissionDenied(
-            "user does not have permission for this repository"
-        )
-    return get_objects_for_user(
-        user,
-        RepoPermission.view_repo[0],
-        klass=Repository
-    )
+    repo_ids = get_cached_repo_ids(user_id)
+    if repo_ids is None:
+        try:
+            user = User.objects.get(id=user_id)
+        except User.DoesNotExist:
+            raise PermissionDenied(
+                "user does not have permission for this repository"
+            )
+        repo_ids = list(get_objects_for_user(
+            user,
+            RepoPermission.view_repo[0],
+            klass=Repository
+        ).values_list('id', flat=True))
+        set_cached_repo_ids(user_id, repo_ids)
+    return Repository.objects.filter(id__in=repo_ids)
 
 
 def get_repo(repo_slug, user_id):
@@ -188,7 +281,7 @@ def get_repo(repo_slug, user_id):
     except Repository.DoesNotExist:
         raise NotFound()
 
-    if RepoPermission.view_repo[0] in get_perms(user, repo):
+    if RepoPermission.view_repo[0] in get_repo_perms(user, repo):
         return repo
     raise PermissionDenied("user does not have permission for this repository")
 
@@ -211,6 +304,50 @@ def create_repo(name, description, user_id):
         )
 
 
+@statsd.timer('lore.create_repos')
+def create_repos(repos, user_id):
+    """
+    Create many repositories at once, with their groups and permissions,
+    in a fixed number of queries.
+
+    Args:
+        repos (list of tuple): (name, description) of each repository
+        user_id (int): User ID of repositories creator
+    Returns:
+        repos (list of learningresources.Repository):
+            Newly-created repositories, in the same order
+    """
+    repos = list(repos)
+    if len(repos) == 0:
+        return []
+
+    with transaction.atomic():
+        user = User.objects.get(id=user_id)
+        slugs = bulk_slugify(
+            [name for name, _ in repos],
+            Repository._meta.model_name,
+            slugs_with_prefixes(Repository)
+        )
+        # bulk_create skips Repository.save and the signal which sets up
+        # the groups, they are set up below for all repositories at once.
+        Repository.objects.bulk_create([
+            Repository(
+                name=name, description=description, slug=slug,
+                created_by_id=user_id,
+            )
+            for (name, description), slug in zip(repos, slugs)
+        ])
+        by_slug = dict(
+            (repo.slug, repo)
+            for repo in Repository.objects.filter(slug__in=slugs)
+        )
+        new_repos = [by_slug[slug] for slug in slugs]
+        roles_init_new_repos(new_repos)
+        assign_user_to_repos_group(
+            user, new_repos, GroupTypes.REPO_ADMINISTRATOR)
+    return new_repos
+
+
 def get_resources(repo_id):
     """
     Get resources from a repository ordered by title.
@@ -316,27 +453,248 @@ def import_static_assets(course, path):
                 create_static_asset(course.id, django_file)
 
 
+def bulk_update_resources(values_by_id, reindex=True):
+    """
+    Set fields of many LearningResources with one UPDATE per chunk of
+    resources setting the same fields. UPDATEs send no signals, so nothing
+    is indexed per resource, the updated resources are then reindexed in
+    bulk.
+
+    Args:
+        values_by_id (dict):
+            Maps LearningResource primary key to a dict of field values
+        reindex (bool):
+            Reindex the resources afterwards, False if the caller updates
+            the index itself
+    Returns:
+        int: Number of LearningResources updated
+    """
+    from search.utils import index_resources
+
+    ids_by_fields = defaultdict(list)
+    for resource_id, values in values_by_id.items():
+        if len(values) > 0:
+            ids_by_fields[tuple(sorted(values))].append(resource_id)
+
+    count = 0
+    now = timezone.now()
+    for fields, ids in ids_by_fields.items():
+        ids.sort()
+        for start in range(0, len(ids), BULK_UPDATE_CHUNK_SIZE):
+            chunk = ids[start:start + BULK_UPDATE_CHUNK_SIZE]
+            updates = {
+                name: Case(
+                    *[
+                        When(id=resource_id, then=Value(
+                            values_by_id[resource_id][name]))
+                        for resource_id in chunk
+                    ],
+                    default=F(name),
+                    output_field=LearningResource._meta.get_field(name)
+                )
+                for name in fields
+            }
+            with transaction.atomic():
+                count += LearningResource.objects.filter(
+                    id__in=chunk).update(date_modified=now, **updates)
+
+    if reindex and len(values_by_id) > 0:
+        index_resources(sorted(values_by_id))
+    return count
+
+
+def _coerce_xanalytics_record(record):
+    """
+    Convert the values of an xanalytics module record to field types.
+
+    Args:
+        record (dict): Record with module_id and xa_* values
+    Returns:
+        tuple: (module_id, {field name: value}) for known fields
+    Raises:
+        django.core.exceptions.ValidationError: A value has the wrong type
+    """
+    values = {}
+    for name in XANALYTICS_FIELDS:
+        if name in record:
+            field = LearningResource._meta.get_field(name)
+            values[name] = field.to_python(record[name])
+    return record["module_id"], values
+
+
+def _apply_xanalytics_sql(course_number, fields, rows):
+    """
+    Update xanalytics fields of many LearningResources with one UPDATE
+    joined against a VALUES list. The old values are read from a join of
+    the table with itself, which sees the rows as they were before.
+
+    Args:
+        course_number (unicode): Course number of the resources
+        fields (tuple of unicode): Names of the fields being set
+        rows (list of tuple): (uuid, value for each field)
+    Returns:
+        list of tuple: Changes of the updated LearningResources, for
+            xanalytics.rollups.resource_deltas
+    """
+    resource_table = LearningResource._meta.db_table
+    course_table = Course._meta.db_table
+    quote = connection.ops.quote_name
+    assignments = ", ".join(
+        "{column} = CAST(v.{column} AS {db_type})".format(
+            column=quote(name),
+            db_type=LearningResource._meta.get_field(name).db_type(
+                connection),
+        ) for name in fields
+    )
+    values = ", ".join(
+        "({placeholders})".format(placeholders=", ".join(
+            ["%s"] * (len(fields) + 1)))
+        for _ in rows
+    )
+    sql = (
+        "UPDATE {resource_table} AS lr SET {assignments}, date_modified = %s "
+        "FROM (VALUES {values}) AS v ({columns}), {course_table} AS c, "
+        "{resource_table} AS old "
+        "WHERE lr.uuid = v.uuid AND lr.course_id = c.id "
+        "AND c.course_number = %s AND old.id = lr.id "
+        "RETURNING lr.id, lr.course_id, lr.learning_resource_type_id, "
+        "{old_values}, {new_values}"
+    ).format(
+        resource_table=quote(resource_table),
+        course_table=quote(course_table),
+        assignments=assignments,
+        values=values,
+        columns=", ".join(
+            ["uuid"] + [quote(name) for name in fields]),
+        old_values=", ".join(
+            "old." + quote(name) for name in XANALYTICS_ROLLUP_FIELDS),
+        new_values=", ".join(
+            "lr." + quote(name) for name in XANALYTICS_ROLLUP_FIELDS),
+    )
+    params = (
+        [timezone.now()] + [value for row in rows for value in row] +
+        [course_number]
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            (row[0], row[1], row[2], tuple(row[3:6]), tuple(row[6:9]))
+            for row in cursor.fetchall()
+        ]
+
+
+def _apply_xanalytics_orm(course_number, fields, rows):
+    """
+    Update xanalytics fields of many LearningResources with CASE updates,
+    for databases without UPDATE ... FROM.
+
+    Args:
+        course_number (unicode): Course number of the resources
+        fields (tuple of unicode): Names of the fields being set
+        rows (list of tuple): (uuid, value for each field)
+    Returns:
+        list of tuple: Changes of the updated LearningResources, for
+            xanalytics.rollups.resource_deltas
+    """
+    values_by_uuid = {
+        row[0]: dict(zip(fields, row[1:])) for row in rows
+    }
+    values_by_id = {}
+    changes = []
+    for row in LearningResource.objects.filter(
+            uuid__in=list(values_by_uuid),
+            course__course_number=course_number,
+    ).values_list(
+        'id', 'uuid', 'course_id', 'learning_resource_type_id',
+        *XANALYTICS_ROLLUP_FIELDS
+    ):
+        values = values_by_uuid[row[1]]
+        values_by_id[row[0]] = values
+        old = tuple(row[4:])
+        new = tuple(
+            values.get(name, value)
+            for name, value in zip(XANALYTICS_ROLLUP_FIELDS, old)
+        )
+        changes.append((row[0], row[2], row[3], old, new))
+    bulk_update_resources(values_by_id, reindex=False)
+    return changes
+
+
 def update_xanalytics(data):
     """
-    Update xanalytics fields for a LearningResource.
+    Update xanalytics fields for LearningResources of a course.
+
     Args:
         data (dict): dict from JSON file from xanalytics
     Returns:
         count (int): number of records updated
     """
-    vals = data.get("module_medata", [])
-    course_number = data.get("course_id", "")
-    count = 0
-    for rec in vals:
-        resource_key = rec.pop("module_id")
-        count = LearningResource.objects.filter(
-            uuid=resource_key,
-            course__course_number=course_number,
+    return update_xanalytics_records(
+        data.get("course_id", ""), data.get("module_medata", []))
 
-        ).update(**rec)
-        if count is None:
-            count = 0
-    return count
+
+@statsd.timer('lore.update_xanalytics')
+def update_xanalytics_records(course_number, records):
+    """
+    Update xanalytics fields for LearningResources of a course from a
+    stream of module records.
+
+    Records are applied in batches of XANALYTICS_BATCH_SIZE with one
+    UPDATE each as they are read. The updated resources are reindexed and
+    the differences between their old and new values are added to the
+    analytics rollups afterwards.
+
+    Args:
+        course_number (unicode): Course number the records belong to
+        records (iterable of dict): xanalytics module records
+    Returns:
+        count (int): number of records updated
+    """
+    from search.tasks import update_index_fields
+    from xanalytics.rollups import apply_rollup_deltas, resource_deltas
+
+    if course_number == "":
+        return 0
+    apply_batch = _apply_xanalytics_orm
+    if connection.vendor == "postgresql":
+        apply_batch = _apply_xanalytics_sql
+
+    start = time.time()
+    # Records setting the same fields can share an UPDATE.
+    batches = defaultdict(list)
+    changes = []
+    record_count = 0
+    for rec in records:
+        record_count += 1
+        try:
+            module_id, values = _coerce_xanalytics_record(rec)
+        except (KeyError, TypeError, ValidationError):
+            log.warning("Skipping bad xanalytics record %s", rec)
+            continue
+        if len(values) == 0:
+            continue
+        fields = tuple(sorted(values))
+        batch = batches[fields]
+        batch.append(
+            tuple([module_id] + [values[name] for name in fields]))
+        if len(batch) >= XANALYTICS_BATCH_SIZE:
+            changes.extend(apply_batch(course_number, fields, batch))
+            del batch[:]
+    for fields, batch in batches.items():
+        if len(batch) > 0:
+            changes.extend(apply_batch(course_number, fields, batch))
+
+    elapsed = time.time() - start
+    if elapsed > 0:
+        statsd.gauge(
+            'lore.update_xanalytics.rows_per_second',
+            int(record_count / elapsed)
+        )
+    updated_ids = set(change[0] for change in changes)
+    if len(updated_ids) > 0:
+        update_index_fields.delay(sorted(updated_ids), XANALYTICS_FIELDS)
+        apply_rollup_deltas(resource_deltas(changes))
+    return len(updated_ids)
 
 
 def join_description_paths(*args):
@@ -350,31 +708,174 @@ def join_description_paths(*args):
     return ' / '.join([dpath for dpath in args if dpath != ''])
 
 
+def _title_description_path(title):
+    """
+    Part of the description path for a title.
+
+    Args:
+        title (unicode): Title of a LearningResource
+    Returns:
+        unicode: Title, or the missing title placeholder
+    """
+    if title == MissingTitle.for_title_field:
+        return MissingTitle.for_desc_path_field
+    return title
+
+
 def update_description_path(resource, force_parent_update=False):
     """
     Updates the specified learning resource description path
-    based on the current title and the parent's description path
+    based on the saved title and the parent's description path,
+    along with the description paths of its descendants.
     Args:
         resource (learningresources.models.LearningResource): LearningResource
         force_parent_update (boolean): force parent update
     Returns:
         None
     """
-    description_path = ''
-    title_desc_path = resource.title
-    if title_desc_path == MissingTitle.for_title_field:
-        title_desc_path = MissingTitle.for_desc_path_field
-    if resource.parent is None:
-        description_path = join_description_paths(title_desc_path)
-    else:
-        # if the parent doesn't have a description_path update first the parent
-        if resource.parent.description_path == '' or force_parent_update:
-            update_description_path(resource.parent, force_parent_update)
-        # the current description path is
-        # the parent's one plus the current title
-        description_path = join_description_paths(
-            resource.parent.description_path,
-            title_desc_path
-        )
-    resource.description_path = description_path
-    resource.save()
+    # Start from the highest ancestor which needs its path updated too,
+    # the parent's path is updated first if it doesn't have one yet.
+    chain = [resource]
+    while chain[-1].parent is not None and (
+            chain[-1].parent.description_path == '' or force_parent_update):
+        chain.append(chain[-1].parent)
+    update_subtree_description_paths([chain[-1].id])
+    paths = dict(LearningResource.objects.filter(
+        id__in=[item.id for item in chain]
+    ).values_list('id', 'description_path'))
+    for item in chain:
+        item.description_path = paths[item.id]
+
+
+def _update_subtree_description_paths_sql(resource_ids):
+    """
+    Rewrite the description paths of resources and their descendants with
+    a single UPDATE from a recursive query.
+
+    Args:
+        resource_ids (list of int): Primary keys of the subtree roots
+    Returns:
+        list of int: Primary keys of the LearningResources changed
+    """
+    quote = connection.ops.quote_name
+    title = "CASE WHEN lr.title = %s THEN %s ELSE lr.title END"
+    # A resource below two of the roots is reached twice, the path from
+    # the higher root is the one built from up to date parents.
+    sql = (
+        "WITH RECURSIVE subtree (id, description_path, depth) AS ("
+        "SELECT lr.id, concat_ws(%s, NULLIF(parent.description_path, ''), "
+        "NULLIF({title}, '')), 0 "
+        "FROM {table} AS lr LEFT JOIN {table} AS parent "
+        "ON parent.id = lr.parent_id "
+        "WHERE lr.id IN ({ids}) "
+        "UNION ALL "
+        "SELECT lr.id, concat_ws(%s, NULLIF(subtree.description_path, ''), "
+        "NULLIF({title}, '')), subtree.depth + 1 "
+        "FROM {table} AS lr JOIN subtree ON lr.parent_id = subtree.id"
+        ") "
+        "UPDATE {table} AS lr "
+        "SET description_path = paths.description_path, "
+        "date_modified = %s "
+        "FROM (SELECT DISTINCT ON (id) id, description_path FROM subtree "
+        "ORDER BY id, depth DESC) AS paths "
+        "WHERE lr.id = paths.id "
+        "AND lr.description_path <> paths.description_path "
+        "RETURNING lr.id"
+    ).format(
+        table=quote(LearningResource._meta.db_table),
+        title=title,
+        ids=", ".join(["%s"] * len(resource_ids)),
+    )
+    title_params = [
+        ' / ', MissingTitle.for_title_field, MissingTitle.for_desc_path_field
+    ]
+    params = (
+        title_params + list(resource_ids) + title_params + [timezone.now()]
+    )
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return sorted(row[0] for row in cursor.fetchall())
+
+
+def _update_subtree_description_paths_orm(resource_ids):
+    """
+    Rewrite the description paths of resources and their descendants
+    one tree level at a time, for databases without recursive UPDATEs.
+
+    Args:
+        resource_ids (list of int): Primary keys of the subtree roots
+    Returns:
+        list of int: Primary keys of the LearningResources changed
+    """
+    paths = {}
+    changed = {}
+    for start in range(0, len(resource_ids), BULK_UPDATE_CHUNK_SIZE):
+        for resource_id, title, parent_path, old_path in (
+                LearningResource.objects.filter(
+                    id__in=resource_ids[start:start + BULK_UPDATE_CHUNK_SIZE]
+                ).values_list(
+                    'id', 'title', 'parent__description_path',
+                    'description_path')):
+            paths[resource_id] = join_description_paths(
+                parent_path or '', _title_description_path(title))
+            if paths[resource_id] != old_path:
+                changed[resource_id] = {
+                    "description_path": paths[resource_id]
+                }
+
+    parent_ids = sorted(paths)
+    while len(parent_ids) > 0:
+        child_ids = []
+        for start in range(0, len(parent_ids), BULK_UPDATE_CHUNK_SIZE):
+            for resource_id, parent_id, title, old_path in (
+                    LearningResource.objects.filter(
+                        parent_id__in=parent_ids[
+                            start:start + BULK_UPDATE_CHUNK_SIZE]
+                    ).values_list(
+                        'id', 'parent_id', 'title', 'description_path')):
+                paths[resource_id] = join_description_paths(
+                    paths[parent_id], _title_description_path(title))
+                if paths[resource_id] != old_path:
+                    changed[resource_id] = {
+                        "description_path": paths[resource_id]
+                    }
+                child_ids.append(resource_id)
+        parent_ids = sorted(child_ids)
+
+    bulk_update_resources(changed, reindex=False)
+    return sorted(changed)
+
+
+@statsd.timer('lore.update_subtree_description_paths')
+def update_subtree_description_paths(resource_ids, reindex=True):
+    """
+    Recompute the description path of resources and of all their
+    descendants, from the description paths of the resources' parents.
+
+    Only the changed resources are written, without per-resource index
+    updates, and their description paths are then updated in the index
+    in bulk.
+
+    Args:
+        resource_ids (iterable of int):
+            Primary keys of the LearningResources whose title or parent
+            changed
+        reindex (bool):
+            Update the index afterwards, False if the caller updates
+            the index itself
+    Returns:
+        list of int: Primary keys of the LearningResources changed
+    """
+    from search.tasks import update_index_fields
+
+    resource_ids = sorted(set(resource_ids))
+    if len(resource_ids) == 0:
+        return []
+    update_paths = _update_subtree_description_paths_orm
+    if connection.vendor == "postgresql":
+        update_paths = _update_subtree_description_paths_sql
+    updated_ids = update_paths(resource_ids)
+    if reindex and len(updated_ids) > 0:
+        update_index_fields.delay(updated_ids, ["description_path"])
+    return updated_ids
@@ -0,0 +1,66 @@
+"""
+Shell command to create many repositories at once
+"""
+
+from __future__ import unicode_literals
+
+import io
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from learningresources.api import create_repos
+from rest.util import csv_rows
+
+
+def read_repos(path):
+    """
+    Read a CSV file with the name and description of a repository on
+    each row.
+
+    Args:
+        path (unicode): Path of the file
+    Returns:
+        list of tuple: (name, description) of each repository
+    """
+    with io.open(path, encoding='utf-8') as infile:
+        text = infile.read()
+    repos = []
+    for row in csv_rows(text):
+        if not any(cell.strip() for cell in row):
+            continue
+        if len(row) != 2 or not row[0].strip():
+            raise CommandError(
+                "Expected a name and a description: {row}".format(row=row))
+        repos.append((row[0].strip(), row[1].strip()))
+    return repos
+
+
+class Command(BaseCommand):
+    """
+    Command for create_repositories
+    """
+    help = "Creates the repositories listed in a CSV file of name,description"
+
+    def add_arguments(self, parser):
+        """Command arguments"""
+        parser.add_argument('path', help="CSV file of name,description rows")
+        parser.add_argument(
+            '--user', dest='username', required=True,
+            help="Username of the creator and administrator")
+
+    def handle(self, *args, **options):
+        """Command handler"""
+        try:
+            user = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError("invalid username")
+        repos = read_repos(options['path'])
+        try:
+            created = create_repos(repos, user.id)
+        except IntegrityError as ex:
+            raise CommandError(
+                "Unable to create repositories: {ex}".format(ex=ex))
+        for repo in created:
+            self.stdout.write(repo.slug)
@@ -5,9 +5,8 @@ Shell command to synchronize permissions and apply the latest to all groups
 from __future__ import unicode_literals
 
 from django.core.management.base import BaseCommand
-from django.db import transaction
 
-from learningresources.api import update_description_path
+from learningresources.api import update_subtree_description_paths
 from learningresources.models import LearningResource
 
 
@@ -19,9 +18,8 @@ class Command(BaseCommand):
 
     def handle(self, *args, **options):
         """Command handler"""
-        # updating the learning resources in the order they were
-        # added to the database: this is  to process parents before children
-        with transaction.atomic():
-            all_learning_resources = LearningResource.objects.order_by('id')
-            for learning_resource in all_learning_resources.iterator():
-                update_description_path(learning_resource)
+        # recomputing the trees from the top level resources
+        # processes parents before children
+        root_ids = LearningResource.objects.filter(
+            parent__isnull=True).values_list('id', flat=True)
+        update_subtree_description_paths(root_ids)
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+# pylint: skip-file
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learningresources', '0019_static_asset_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='learningresource',
+            name='uuid',
+            field=models.TextField(db_index=True),
+        ),
+    ]
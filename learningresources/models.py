@@ -96,7 +96,8 @@ class StaticAsset(BaseModel):
     course = models.ForeignKey(Course)
     asset = models.FileField(
         upload_to=static_asset_basepath,
-        max_length=FILE_PATH_MAX_LENGTH
+        max_length=FILE_PATH_MAX_LENGTH,
+        db_index=True
     )
 
     def save(self, *args, **kwargs):
@@ -121,7 +122,7 @@ class LearningResource(BaseModel):
     course = models.ForeignKey(Course, related_name="resources")
     learning_resource_type = models.ForeignKey('LearningResourceType')
     static_assets = models.ManyToManyField(StaticAsset, blank=True)
-    uuid = models.TextField()
+    uuid = models.TextField(db_index=True)
     title = models.TextField()
     description = models.TextField(blank=True)
     content_xml = models.TextField()
@@ -165,12 +166,13 @@ class Repository(BaseModel):
         Handle slugs and groups.
         """
         is_update = False
-        if self.id is None or self.name != get_object_or_404(
-                Repository, id=self.id).name:
+        old_name, old_slug = None, None
+        if self.id is not None:
+            old_name, old_slug = get_object_or_404(
+                Repository.objects.values_list('name', 'slug'), id=self.id)
+        if self.id is None or self.name != old_name:
             # if it is an update of the repository, need the old slug
-            if self.id is not None:
-                is_update = True
-                old_slug = get_object_or_404(Repository, id=self.id).slug
+            is_update = self.id is not None
             self.slug = default_slugify(
                 self.name,
                 Repository._meta.model_name,
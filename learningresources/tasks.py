@@ -0,0 +1,25 @@
+"""
+Celery tasks for learningresources.
+"""
+
+from __future__ import unicode_literals
+
+from statsd.defaults.django import statsd
+
+from lore.celery import async
+from learningresources.api import delete_course as _delete_course
+
+
+@async.task
+@statsd.timer('lore.delete_course')
+def delete_course(course_id):
+    """
+    Asynchronously delete a course with its LearningResources and
+    StaticAssets.
+
+    Args:
+        course_id (int): Primary key of the course
+    Returns:
+        dict: count is the number of LearningResources deleted.
+    """
+    return {"count": _delete_course(course_id)}
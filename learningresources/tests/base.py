@@ -14,6 +14,7 @@ import uuid
 
 from django.conf import settings
 from django.contrib.auth.models import User, Permission
+from django.core.cache import caches
 from django.core.files.storage import default_storage
 from django.test import Client
 from django.test.testcases import TestCase
@@ -31,6 +32,24 @@ from search.utils import recreate_index, refresh_index, remove_index
 log = logging.getLogger(__name__)
 # Using the md5 hasher speeds up tests.
 hashers = ('django.contrib.auth.hashers.MD5PasswordHasher',)
+# Caches emptied before each test.
+TEST_CACHES = ("lore_permissions", "lore_export")
+
+
+def clear_cache(alias):
+    """
+    Remove the entries of a cache. Entries of a redis cache are deleted by
+    key prefix, since clear() would flush the whole redis database which
+    other caches may share.
+
+    Args:
+        alias (unicode): Name of the cache in CACHES
+    """
+    cache = caches[alias]
+    if hasattr(cache, "delete_pattern"):
+        cache.delete_pattern("*")
+    else:
+        cache.clear()
 
 
 @override_settings(PASSWORD_HASHERS=hashers)
@@ -86,6 +105,8 @@ class LoreTestCase(TestCase):
         """set up"""
         super(LoreTestCase, self).setUp()
         recreate_index()
+        for alias in TEST_CACHES:
+            clear_cache(alias)
         self.user = User.objects.create_user(
             username=self.USERNAME, password=self.PASSWORD
         )
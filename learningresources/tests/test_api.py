@@ -10,7 +10,10 @@ import tempfile
 from django.core.files import File
 from django.core.files.storage import default_storage
 from django.core.management import call_command
+from django.db import connection
 from django.db.utils import IntegrityError
+from django.test.utils import CaptureQueriesContext
+from guardian.shortcuts import get_perms
 
 from mock import patch
 
@@ -19,8 +22,11 @@ from learningresources import api
 from learningresources.models import (
     Course,
     LearningResource,
+    Repository,
     static_asset_basepath,
 )
+from roles.api import assign_user_to_repo_group, remove_user_from_repo_group
+from roles.permissions import GroupTypes, RepoPermission
 from .base import LoreTestCase
 
 log = logging.getLogger(__name__)
@@ -141,6 +147,89 @@ class TestRepoAPI(LoreTestCase):
         with self.assertRaises(api.PermissionDenied):
             api.get_repos(-1)
 
+    def test_get_repos_cache(self):
+        """
+        Repository ids are cached until the roles of the user change.
+        """
+        self.assertEqual([self.repo], list(api.get_repos(self.user.id)))
+        with patch.object(
+            api, 'get_objects_for_user', wraps=api.get_objects_for_user
+        ) as mock_objects:
+            with self.assertNumQueries(1):
+                self.assertEqual(
+                    [self.repo], list(api.get_repos(self.user.id)))
+            self.assertEqual(mock_objects.call_count, 0)
+
+            repo2 = api.create_repo("other repo", "description", self.user.id)
+            self.assertEqual(
+                sorted(repo.id for repo in api.get_repos(self.user.id)),
+                [self.repo.id, repo2.id]
+            )
+            self.assertEqual(mock_objects.call_count, 1)
+
+            assign_user_to_repo_group(
+                self.user_norepo, repo2, GroupTypes.REPO_AUTHOR)
+            self.assertEqual(
+                [repo2], list(api.get_repos(self.user_norepo.id)))
+            remove_user_from_repo_group(
+                self.user_norepo, repo2, GroupTypes.REPO_AUTHOR)
+            self.assertEqual([], list(api.get_repos(self.user_norepo.id)))
+
+    def test_create_repos(self):
+        """Create many repositories with their groups at once"""
+        repos = api.create_repos(
+            [("New repo", "first"), ("New repo!", "second"),
+             (self.repo.name + " 2", "third")],
+            self.user.id
+        )
+        self.assertEqual(
+            [repo.slug for repo in repos],
+            ["new-repo", "new-repo1", self.repo.slug + "-2"]
+        )
+        self.assertEqual(
+            [repo.description for repo in repos],
+            ["first", "second", "third"]
+        )
+        for repo in repos:
+            self.assertEqual(
+                sorted(get_perms(self.user, repo)),
+                sorted(RepoPermission.administrator_permissions())
+            )
+            self.assertEqual(get_perms(self.user_norepo, repo), [])
+        self.assertEqual(
+            sorted(repo.id for repo in api.get_repos(self.user.id)),
+            sorted([self.repo.id] + [repo.id for repo in repos])
+        )
+        self.assertEqual(api.create_repos([], self.user.id), [])
+
+    def test_create_repos_queries(self):
+        """The number of queries doesn't grow with the repositories"""
+        with CaptureQueriesContext(connection) as few:
+            api.create_repos([("a", "a"), ("b", "b")], self.user.id)
+        with CaptureQueriesContext(connection) as many:
+            api.create_repos(
+                [("repo {0}".format(i), "") for i in range(10)], self.user.id)
+        self.assertEqual(len(few), len(many))
+
+    def test_create_repositories_command(self):
+        """Create repositories from a CSV file via manage.py"""
+        with tempfile.NamedTemporaryFile(suffix=".csv") as csv_file:
+            csv_file.write('\n'.join([
+                'First,"A, description"',
+                '',
+                'Second,"other',
+                'lines"',
+            ]).encode('utf-8'))
+            csv_file.flush()
+            call_command(
+                'create_repositories', csv_file.name,
+                user=self.user.username)
+        first = Repository.objects.get(slug="first")
+        self.assertEqual(first.description, "A, description")
+        self.assertEqual(first.created_by, self.user)
+        self.assertEqual(
+            Repository.objects.get(slug="second").description, "other\nlines")
+
     def test_invalid_create_repo(self):
         """Create a repository with empty name and description"""
         with self.assertRaises(IntegrityError) as ex:
@@ -323,12 +412,120 @@ class TestDescriptionPath(LoreTestCase):
             )
         )
 
+    def test_update_description_path_descendants(self):
+        """update_description_path also updates the descendants"""
+        child_res = self.create_resource(parent=self.resource)
+        self.resource.title = 'renamed'
+        self.resource.save()
+        api.update_description_path(self.resource)
+        self.assertEqual(self.resource.description_path, 'renamed')
+        child_res.refresh_from_db()
+        self.assertEqual(
+            child_res.description_path,
+            api.join_description_paths('renamed', child_res.title)
+        )
+
     def test_update_description_path_command(self):
         """
         test the update_description_paths via manage.py
         """
         # pylint: disable=invalid-name, no-self-use
-        with patch.object(api, 'update_description_path') as mock_method:
+        with patch.object(
+            api, 'update_subtree_description_paths'
+        ) as mock_method:
             mock_method.return_value = None
             call_command('update_description_paths')
-            mock_method.assert_called_with(self.resource)
+            self.assertEqual(
+                list(mock_method.call_args[0][0]), [self.resource.id])
+
+    def assert_subtree_paths(self, update_paths):
+        """
+        Retitle the root and a middle node of a tree and
+        recompute the description paths of both subtrees.
+        """
+        chapter = self.create_resource(parent=self.resource, title="ch")
+        sequential = self.create_resource(parent=chapter, title="seq")
+        verticals = [
+            self.create_resource(parent=sequential, title="v{0}".format(i))
+            for i in range(3)
+        ]
+        other = self.create_resource(title="other")
+        LearningResource.objects.filter(id=self.resource.id).update(
+            title="root")
+        LearningResource.objects.filter(id=chapter.id).update(
+            title=api.MissingTitle.for_title_field)
+
+        updated_ids = update_paths([chapter.id, self.resource.id])
+        self.assertEqual(
+            sorted(updated_ids),
+            sorted([self.resource.id, chapter.id, sequential.id] +
+                   [vertical.id for vertical in verticals])
+        )
+        paths = dict(LearningResource.objects.values_list(
+            'id', 'description_path'))
+        self.assertEqual(paths[self.resource.id], "root")
+        self.assertEqual(paths[chapter.id], "root / ...")
+        self.assertEqual(paths[sequential.id], "root / ... / seq")
+        for i, vertical in enumerate(verticals):
+            self.assertEqual(
+                paths[vertical.id], "root / ... / seq / v{0}".format(i))
+        self.assertEqual(paths[other.id], "other")
+        # Nothing changed the second time.
+        self.assertEqual(update_paths([self.resource.id]), [])
+
+    def test_update_subtree_description_paths(self):
+        """Descendants get the new paths and are reindexed in bulk"""
+        with patch(
+            'search.tasks.update_index_fields.delay'
+        ) as mock_update:
+            self.assert_subtree_paths(api.update_subtree_description_paths)
+        self.assertEqual(mock_update.call_count, 1)
+        self.assertEqual(mock_update.call_args[0][1], ["description_path"])
+        self.assertEqual(api.update_subtree_description_paths([]), [])
+
+    def test_update_subtree_description_paths_orm(self):
+        """The level by level fallback gives the same paths"""
+        # pylint: disable=protected-access
+        self.assert_subtree_paths(api._update_subtree_description_paths_orm)
+
+
+class TestBulkUpdateResources(LoreTestCase):
+    """
+    Test bulk updates of LearningResources.
+    """
+    def test_bulk_update(self):
+        """Fields are written without per-resource reindexing."""
+        other = self.create_resource(title="other")
+        with patch('search.utils.index_resources') as mock_index:
+            count = api.bulk_update_resources({
+                self.resource.id: {"xa_nr_views": 3, "xa_avg_grade": 70.5},
+                other.id: {"xa_nr_views": 4},
+            })
+        self.assertEqual(count, 2)
+        mock_index.assert_called_once_with(
+            sorted([self.resource.id, other.id]))
+
+        self.resource.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual(self.resource.xa_nr_views, 3)
+        self.assertEqual(self.resource.xa_avg_grade, 70.5)
+        self.assertEqual(other.xa_nr_views, 4)
+        self.assertEqual(other.xa_avg_grade, 0)
+
+    def test_chunks(self):
+        """Large updates are split into several statements."""
+        other = self.create_resource(title="other")
+        with patch.object(api, 'BULK_UPDATE_CHUNK_SIZE', 1), \
+                patch('search.utils.index_resources') as mock_index:
+            count = api.bulk_update_resources({
+                self.resource.id: {"xa_nr_attempts": 5},
+                other.id: {"xa_nr_attempts": 6},
+            }, reindex=False)
+        self.assertEqual(count, 2)
+        self.assertFalse(mock_index.called)
+        self.assertEqual(
+            sorted(LearningResource.objects.filter(
+                id__in=[self.resource.id, other.id]
+            ).values_list('xa_nr_attempts', flat=True)),
+            [5, 6]
+        )
@@ -4,10 +4,17 @@ Tests for utilities within the API.
 
 import logging
 
+from mock import patch
+
 from learningresources.tests.base import LoreTestCase
 
-from learningresources.api import update_xanalytics
+from learningresources.api import (
+    _apply_xanalytics_orm,
+    create_resource,
+    update_xanalytics,
+)
 from learningresources.models import LearningResource
+from search.utils import get_conn, INDEX_NAME, DOC_TYPE
 
 log = logging.getLogger(__name__)
 
@@ -40,6 +47,8 @@ class TestXanalyticsData(LoreTestCase):
         resource = LearningResource.objects.get(id=self.resource.id)
         self.assertEqual(resource.xa_nr_views, 3)
         self.assertEqual(resource.xa_nr_attempts, 25)
+        self.assertGreater(
+            resource.date_modified, self.resource.date_modified)
 
     def test_empty(self):
         """Empty dict."""
@@ -57,3 +66,83 @@ class TestXanalyticsData(LoreTestCase):
             ]
         }
         self.assertEqual(update_xanalytics(data), 0)
+
+    def test_batches(self):
+        """
+        Many records are applied in batches, bad records are skipped and
+        the updated fields are copied to the search index.
+        """
+        resources = [self.resource]
+        for _ in range(4):
+            resources.append(create_resource(
+                course=self.course,
+                parent=None,
+                resource_type=self.resource.learning_resource_type.name,
+                title="other",
+                content_xml="",
+                mpath="",
+                url_name=None,
+                dpath="",
+            ))
+        for index, resource in enumerate(resources):
+            resource.uuid = "uuid{0}".format(index)
+            resource.save()
+
+        data = {
+            "course_id": self.course.course_number,
+            "module_medata": [
+                {
+                    "module_id": "uuid{0}".format(index),
+                    "xa_nr_views": str(index + 10),
+                    "xa_avg_grade": "0.5",
+                } for index in range(4)
+            ] + [
+                {"module_id": "uuid4", "xa_nr_attempts": "7"},
+                {"module_id": "uuid3", "xa_nr_views": "not a number"},
+                {"module_id": "missing", "xa_nr_views": "1"},
+                {"xa_nr_views": "1"},
+            ]
+        }
+        with patch('learningresources.api.XANALYTICS_BATCH_SIZE', 2):
+            self.assertEqual(update_xanalytics(data), 5)
+
+        conn = get_conn()
+        for index, resource in enumerate(resources):
+            resource = LearningResource.objects.get(id=resource.id)
+            source = conn.get(
+                index=INDEX_NAME, doc_type=DOC_TYPE, id=resource.id
+            )["_source"]
+            if index < 4:
+                self.assertEqual(resource.xa_nr_views, index + 10)
+                self.assertEqual(resource.xa_avg_grade, 0.5)
+                self.assertEqual(source["xa_nr_views"], index + 10)
+            else:
+                self.assertEqual(resource.xa_nr_views, 0)
+                self.assertEqual(resource.xa_nr_attempts, 7)
+                self.assertEqual(source["xa_nr_attempts"], 7)
+
+    def test_orm_fallback(self):
+        """Databases without UPDATE ... FROM use CASE expressions."""
+        self.resource.uuid = "1"
+        self.resource.save()
+        changes = _apply_xanalytics_orm(
+            self.course.course_number,
+            ("xa_nr_attempts", "xa_nr_views"),
+            [("1", 4, 5), ("2", 6, 7)],
+        )
+        self.assertEqual(changes, [(
+            self.resource.id,
+            self.course.id,
+            self.resource.learning_resource_type_id,
+            (0, 0, 0),
+            (5, 4, 0),
+        )])
+        resource = LearningResource.objects.get(id=self.resource.id)
+        self.assertEqual(resource.xa_nr_attempts, 4)
+        self.assertEqual(resource.xa_nr_views, 5)
+        self.assertGreater(
+            resource.date_modified, self.resource.date_modified)
+        self.assertEqual(
+            _apply_xanalytics_orm("missing", ("xa_nr_views",), [("1", 1)]),
+            []
+        )
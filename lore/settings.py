@@ -167,6 +167,12 @@ DATABASES = {
     'default': DEFAULT_DATABASE_CONFIG
 }
 
+# Caches which every web and worker process must agree on live in redis.
+REDIS_CACHE_URL = get_var(
+    "LORE_REDIS_CACHE_URL",
+    get_var("REDISCLOUD_URL", "redis://localhost:6379/5")
+)
+
 CACHES = {
     "default": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
@@ -178,6 +184,40 @@ CACHES = {
     "compressor": {
         "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
     },
+    # Shared by all processes, so role changes are seen everywhere at once.
+    "lore_permissions": {
+        "BACKEND": get_var(
+            "LORE_PERMISSIONS_CACHE_BACKEND",
+            "django_redis.cache.RedisCache"
+        ),
+        "LOCATION": get_var(
+            "LORE_PERMISSIONS_CACHE_LOCATION", REDIS_CACHE_URL),
+        "TIMEOUT": get_var("LORE_PERMISSIONS_CACHE_TIMEOUT", 60),
+        "KEY_PREFIX": "lore_permissions",
+    },
+    # Locks which must hold across every worker process, like the one
+    # which keeps a single xanalytics poller running.
+    "lore_locks": {
+        "BACKEND": get_var(
+            "LORE_LOCK_CACHE_BACKEND",
+            "django_redis.cache.RedisCache"
+        ),
+        "LOCATION": get_var("LORE_LOCK_CACHE_LOCATION", REDIS_CACHE_URL),
+        "KEY_PREFIX": "lore_locks",
+    },
+    # Shared by all workers, so an export reuses members prepared by any of
+    # them. Entries expire after the timeout and exporter.api stops adding
+    # entries once EXPORT_CACHE_MAX_BYTES are cached, so the cache can't
+    # crowd out the broker when both live in the same redis.
+    "lore_export": {
+        "BACKEND": get_var(
+            "LORE_EXPORT_CACHE_BACKEND",
+            "django_redis.cache.RedisCache"
+        ),
+        "LOCATION": get_var("LORE_EXPORT_CACHE_LOCATION", REDIS_CACHE_URL),
+        "TIMEOUT": get_var("LORE_EXPORT_CACHE_TIMEOUT", 24 * 60 * 60),
+        "KEY_PREFIX": "lore_export",
+    },
 }
 
 # Internationalization
@@ -224,8 +264,31 @@ COMPRESS_CACHE_BACKEND = 'compressor'
 # Media and storage settings
 IMPORT_PATH_PREFIX = get_var('LORE_IMPORT_PATH_PREFIX', 'course_archives/')
 EXPORT_PATH_PREFIX = get_var('LORE_EXPORT_PATH_PREFIX', 'resource_exports/')
+# Number of static assets fetched in parallel during export, and how many
+# bytes of each are held in memory before spooling to a temporary file.
+EXPORT_ASSET_THREADS = get_var('LORE_EXPORT_ASSET_THREADS', 8)
+EXPORT_ASSET_MAX_MEMORY = get_var(
+    'LORE_EXPORT_ASSET_MAX_MEMORY', 8 * 1024 * 1024)
+# Largest resource XML or static asset kept in the export cache, in bytes.
+EXPORT_CACHE_MAX_ITEM_SIZE = get_var(
+    'LORE_EXPORT_CACHE_MAX_ITEM_SIZE', 512 * 1024)
+# Most bytes of resource XML and static assets in the export cache at once.
+EXPORT_CACHE_MAX_BYTES = get_var(
+    'LORE_EXPORT_CACHE_MAX_BYTES', 64 * 1024 * 1024)
+# Default archive format (gz, bz2, xz, tar or zip) and compression level
+# of exports, and how many threads compress gzip exports.
+EXPORT_CODEC = get_var('LORE_EXPORT_CODEC', 'gz')
+EXPORT_COMPRESSION_LEVEL = get_var('LORE_EXPORT_COMPRESSION_LEVEL', 6)
+EXPORT_COMPRESSION_THREADS = get_var('LORE_EXPORT_COMPRESSION_THREADS', 4)
 MEDIA_ROOT = get_var('MEDIA_ROOT', '/tmp/')
 MEDIA_URL = '/media/'
+# Downloads served from MEDIA_ROOT can be handed to the front web server
+# after the permission check: "x-sendfile" sends the absolute file path,
+# "x-accel-redirect" sends the path under DOWNLOAD_OFFLOAD_PREFIX, and an
+# empty value streams the file from Django.
+DOWNLOAD_OFFLOAD = get_var('LORE_DOWNLOAD_OFFLOAD', '')
+DOWNLOAD_OFFLOAD_PREFIX = get_var(
+    'LORE_DOWNLOAD_OFFLOAD_PREFIX', '/protected/')
 LORE_USE_S3 = get_var('LORE_USE_S3', False)
 AWS_ACCESS_KEY_ID = get_var('AWS_ACCESS_KEY_ID', False)
 AWS_SECRET_ACCESS_KEY = get_var('AWS_SECRET_ACCESS_KEY', False)
@@ -397,6 +460,8 @@ HAYSTACK_CONNECTIONS = {
 }
 
 XANALYTICS_URL = get_var('XANALYTICS_URL', "")
+# Number of xanalytics jobs checked and downloaded concurrently.
+XANALYTICS_POLL_THREADS = get_var('LORE_XANALYTICS_POLL_THREADS', 8)
 
 # server-status
 HEALTH_CHECK = ['CELERY', 'REDIS', 'POSTGRES', 'ELASTIC_SEARCH']
@@ -5,7 +5,6 @@ Permission classes for REST views
 from __future__ import unicode_literals
 
 from django.http import Http404
-from guardian.shortcuts import get_perms
 from rest_framework.permissions import (
     BasePermission,
     SAFE_METHODS,
@@ -21,6 +20,7 @@ from learningresources.api import (
     PermissionDenied,
     NotFound,
 )
+from roles.api import get_repo_perms
 from roles.permissions import RepoPermission
 from taxonomy.api import (
     get_vocabulary,
@@ -116,7 +116,7 @@ class ManageTaxonomyPermission(BasePermission):
 
             return (
                 RepoPermission.manage_taxonomy[0]
-                in get_perms(request.user, repo)
+                in get_repo_perms(request.user, repo)
             )
 
 
@@ -132,7 +132,7 @@ class ManageRepoMembersPermission(BasePermission):
             return False
         if request.method in SAFE_METHODS:
             return True
-        return RepoPermission.manage_repo_users[0] in get_perms(
+        return RepoPermission.manage_repo_users[0] in get_repo_perms(
             request.user, repo)
 
 
@@ -152,7 +152,7 @@ class AddEditMetadataPermission(BasePermission):
 
         return (
             RepoPermission.add_edit_metadata[0]
-            in get_perms(request.user, repo)
+            in get_repo_perms(request.user, repo)
         )
 
 
@@ -229,4 +229,5 @@ class ImportCoursePermission(BasePermission):
             return False
         if request.method in SAFE_METHODS:
             return True
-        return RepoPermission.import_course[0] in get_perms(request.user, repo)
+        return RepoPermission.import_course[0] in get_repo_perms(
+            request.user, repo)
@@ -4,8 +4,11 @@ REST serializers for taxonomy models
 
 from __future__ import unicode_literals
 
+import json
+
 from django.contrib.auth.models import User
 from rest_framework.generics import get_object_or_404
+from rest_framework.reverse import reverse
 from rest_framework.serializers import (
     Serializer,
     ModelSerializer,
@@ -23,6 +26,7 @@ from rest_framework.serializers import (
     FloatField,
     DictField,
     BooleanField,
+    ListField,
 )
 
 from rest.util import LambdaDefault, RequiredBooleanField
@@ -37,6 +41,7 @@ from learningresources.models import (
     STATIC_ASSET_BASEPATH,
     get_preview_url as resource_preview_url,
 )
+from xanalytics.models import AnalyticsRollup
 
 
 class RepositorySerializer(ModelSerializer):
@@ -122,10 +127,39 @@ class VocabularySerializer(ModelSerializer):
             'slug',
         )
 
+    def __init__(self, *args, **kwargs):
+        """Drop terms from the output if the view asked to leave them out."""
+        super(VocabularySerializer, self).__init__(*args, **kwargs)
+        if not self.context.get('include_terms', True):
+            self.fields.pop('terms')
+
     @staticmethod
     def get_terms(obj):
         """List of terms for vocabulary."""
-        return [TermSerializer(term).data for term in obj.term_set.all()]
+        terms = getattr(obj, 'capped_terms', None)
+        if terms is None:
+            terms = obj.term_set.all()
+        return [TermSerializer(term).data for term in terms]
+
+    def to_representation(self, instance):
+        """
+        If terms were capped, trim the extra term fetched to detect
+        a following page and link to that page in TermList.
+        """
+        data = super(VocabularySerializer, self).to_representation(instance)
+        terms_limit = self.context.get('terms_limit')
+        if terms_limit is not None and 'terms' in data:
+            data['terms_next'] = None
+            if len(data['terms']) > terms_limit:
+                data['terms'] = data['terms'][:terms_limit]
+                url = reverse('term-list', kwargs={
+                    'repo_slug': self.context['view'].kwargs['repo_slug'],
+                    'vocab_slug': instance.slug,
+                }, request=self.context.get('request'))
+                data['terms_next'] = "{url}?page=2&page_size={limit}".format(
+                    url=url, limit=terms_limit
+                )
+        return data
 
 
 class TermSerializer(ModelSerializer):
@@ -269,6 +303,44 @@ class LearningResourceSerializer(ModelSerializer):
         return resource_preview_url(obj)
 
 
+class LearningResourceBulkTermsSerializer(Serializer):
+    """
+    Serializer for adding and removing terms on many LearningResources.
+    Resources are selected either by id or by a search query.
+    """
+    ids = ListField(child=IntegerField(), required=False)
+    query = CharField(required=False, allow_blank=True)
+    selected_facets = ListField(child=CharField(), required=False)
+    add = ListField(child=CharField(), required=False, default=list)
+    remove = ListField(child=CharField(), required=False, default=list)
+
+    def validate(self, attrs):
+        """Validate that resources are selected and terms are given."""
+        # pylint: disable=no-self-use
+        if ('ids' not in attrs and 'query' not in attrs and
+                'selected_facets' not in attrs):
+            raise ValidationError("Missing ids or query")
+        if not attrs['add'] and not attrs['remove']:
+            raise ValidationError("Missing terms to add or remove")
+        return attrs
+
+
+class TaxonomyImportSerializer(Serializer):
+    """
+    Serializer for importing many vocabularies and terms at once, either
+    from a JSON or CSV file or as a list of vocabularies.
+    """
+    file = FileField(required=False)
+    vocabularies = ListField(child=DictField(), required=False)
+
+    def validate(self, attrs):
+        """Validate that exactly one source is given."""
+        # pylint: disable=no-self-use
+        if ('file' in attrs) == ('vocabularies' in attrs):
+            raise ValidationError("Missing file or vocabularies")
+        return attrs
+
+
 class StaticAssetSerializer(ModelSerializer):
     """Serializer for StaticAsset."""
 
@@ -300,6 +372,40 @@ class StaticAssetSerializer(ModelSerializer):
         return static_asset_obj.asset.name.replace(basepath, '')
 
 
+class AnalyticsRollupSerializer(ModelSerializer):
+    """Serializer for AnalyticsRollup."""
+
+    avg_grade = SerializerMethodField()
+    grade_histogram = SerializerMethodField()
+
+    class Meta:
+        # pylint: disable=missing-docstring
+        model = AnalyticsRollup
+        fields = (
+            'dimension',
+            'key',
+            'label',
+            'resource_count',
+            'views',
+            'attempts',
+            'avg_grade',
+            'grade_histogram',
+        )
+        read_only_fields = fields
+
+    @staticmethod
+    def get_avg_grade(rollup):
+        """Average of the average grades of the resources."""
+        if rollup.resource_count == 0:
+            return 0
+        return rollup.grade_sum / rollup.resource_count
+
+    @staticmethod
+    def get_grade_histogram(rollup):
+        """Resource counts per average grade bucket."""
+        return json.loads(rollup.grade_histogram)
+
+
 class LearningResourceExportSerializer(Serializer):
     """Serializer for exporting id for LearningResource."""
     id = IntegerField()
@@ -4,20 +4,27 @@ Functions to manipulate tasks via REST API.
 
 from __future__ import unicode_literals
 
+from celery import current_app
 from celery.result import AsyncResult
 from celery.states import FAILURE, SUCCESS, REVOKED
 from django.contrib.auth.models import User
 from django.http.response import Http404
 from rest_framework.exceptions import ValidationError
 
+from exporter.api import EXPORT_CODECS
 from exporter.tasks import export_resources
-from learningresources.api import get_repo
-from learningresources.models import LearningResource
+from learningresources.api import get_repo, NotFound, PermissionDenied
+from learningresources.models import Course
+from learningresources.tasks import delete_course
+from roles.api import get_repo_perms
+from roles.permissions import RepoPermission
 
 TASK_KEY = 'tasks'
 EXPORT_TASK_TYPE = 'resource_export'
 EXPORTS_KEY = 'learning_resource_exports'
 IMPORT_TASK_TYPE = 'import_course'
+DELETE_COURSE_TASK_TYPE = 'delete_course'
+TERMINAL_STATES = (SUCCESS, FAILURE, REVOKED)
 
 
 def create_initial_task_dict(task, task_type, task_info):
@@ -47,48 +54,125 @@ def create_initial_task_dict(task, task_type, task_info):
     }
 
 
-def create_task_result_dict(initial_data):
+def _get_task_metas(task_ids):
+    """
+    Fetch result metadata for many tasks from the result backend.
+    Key/value backends like Redis are read with a single multi-get,
+    other backends are asked once per task.
+
+    Args:
+        task_ids (list of unicode): Ids of tasks to look up.
+    Returns:
+        dict:
+            Task ids mapped to result metadata. Tasks the backend
+            knows nothing about yet are left out.
+    """
+    if len(task_ids) == 0:
+        return {}
+
+    backend = current_app.backend
+    if hasattr(backend, 'mget') and hasattr(backend, 'get_key_for_task'):
+        values = backend.mget(
+            [backend.get_key_for_task(task_id) for task_id in task_ids]
+        )
+        return dict(
+            (task_id, backend.decode_result(value))
+            for task_id, value in zip(task_ids, values)
+            if value is not None
+        )
+    return dict(
+        (task_id, backend.get_task_meta(task_id)) for task_id in task_ids
+    )
+
+
+def _store_terminal_state(session, initial_data, meta):
+    """
+    Record a finished task's state and result in its initial data so
+    the result backend isn't asked about it again.
+
+    Args:
+        session (SessionStore): The request session, or None.
+        initial_data (dict): Initial data about task stored in session.
+        meta (dict): Result metadata from the result backend.
+    """
+    if meta['status'] == SUCCESS:
+        result = meta['result']
+    elif meta['status'] == FAILURE:
+        result = {'error': str(meta['result'])}
+    else:
+        return
+
+    initial_data['initial_state'] = meta['status']
+    initial_data['result'] = result
+    if session is not None and initial_data['id'] in session.get(
+            TASK_KEY, {}):
+        session[TASK_KEY][initial_data['id']] = initial_data
+        session.modified = True
+
+
+def create_task_result_dicts(session, tasks):
+    """
+    Convert initial data we put in session to dicts for REST API.
+    States of unfinished tasks are fetched from the result backend in one
+    batch. Finished tasks are updated in the session so later calls don't
+    look them up again.
+
+    Args:
+        session (SessionStore): The request session.
+        tasks (list of dict): Initial data about tasks stored in session.
+    Returns:
+        list of dict: Updated data about tasks.
+    """
+    pending_ids = [
+        task['id'] for task in tasks
+        if task['initial_state'] not in TERMINAL_STATES
+    ]
+    metas = _get_task_metas(pending_ids)
+
+    results = []
+    for initial_data in tasks:
+        meta = metas.get(initial_data['id'])
+        if meta is not None:
+            _store_terminal_state(session, initial_data, meta)
+
+        # initial_state is a workaround for EagerResult used in testing.
+        # In production initial_state should usually be pending until
+        # the task finishes.
+        initial_state = initial_data['initial_state']
+        state = "processing"
+        result = None
+        if initial_state == SUCCESS:
+            state = "success"
+            result = initial_data['result']
+        elif initial_state in (FAILURE, REVOKED):
+            state = "failure"
+            result = initial_data['result']
+
+        results.append({
+            "id": initial_data['id'],
+            "status": state,
+            "result": result,
+            "task_type": initial_data['task_type'],
+            "task_info": initial_data['task_info']
+        })
+    return results
+
+
+def create_task_result_dict(initial_data, session=None):
     """
     Convert initial data we put in session to dict for REST API.
     This will use the id to look up current data about task to return
     to user.
 
     Args:
-        task (dict): Initial data about task stored in session.
+        initial_data (dict): Initial data about task stored in session.
+        session (SessionStore):
+            The request session. If given, a finished task's result is
+            saved there.
     Returns:
         dict: Updated data about task.
     """
-    initial_state = initial_data['initial_state']
-    task_id = initial_data['id']
-    task_type = initial_data['task_type']
-    task_info = initial_data['task_info']
-
-    state = "processing"
-    result = None
-    # initial_state is a workaround for EagerResult used in testing.
-    # In production initial_state should usually be pending.
-    async_result = AsyncResult(task_id)
-
-    if initial_state == SUCCESS:
-        state = "success"
-        result = initial_data['result']
-    elif initial_state in (FAILURE, REVOKED):
-        state = "failure"
-        result = initial_data['result']
-    elif async_result.successful():
-        state = "success"
-        result = async_result.get()
-    elif async_result.failed():
-        state = "failure"
-        result = {'error': str(async_result.result)}
-
-    return {
-        "id": task_id,
-        "status": state,
-        "result": result,
-        "task_type": task_type,
-        "task_info": task_info
-    }
+    return create_task_result_dicts(session, [initial_data])[0]
 
 
 def get_tasks(session):
@@ -181,14 +265,53 @@ def create_task(session, user_id, task_type, task_info):
                     id=resource_id
                 ))
 
-        learning_resources = LearningResource.objects.filter(id__in=ids).all()
+        codec = task_info.get('codec')
+        if codec is not None and codec not in EXPORT_CODECS:
+            raise ValidationError("Unknown codec {codec}".format(
+                codec=codec
+            ))
+        level = task_info.get('level')
+        if level is not None:
+            try:
+                level = int(level)
+            except (TypeError, ValueError):
+                raise ValidationError("level is not a number")
+            if not 0 <= level <= 9:
+                raise ValidationError("level must be between 0 and 9")
+
         user = User.objects.get(id=user_id)
-        result = export_resources.delay(learning_resources, user.username)
+        result = export_resources.delay(
+            list(ids), user.username, codec, level)
 
         # Put new task in session.
         initial_data = track_task(session, result, task_type, task_info)
 
         return initial_data
+    elif task_type == DELETE_COURSE_TASK_TYPE:
+        try:
+            repo_slug = task_info['repo_slug']
+        except KeyError:
+            raise ValidationError("Missing repo_slug")
+        try:
+            course_id = int(task_info['course_id'])
+        except KeyError:
+            raise ValidationError("Missing course_id")
+        except (TypeError, ValueError):
+            raise ValidationError("course_id is not a number")
+
+        # Verify repository ownership and permission to manage courses.
+        repo = get_repo(repo_slug, user_id)
+        user = User.objects.get(id=user_id)
+        if (RepoPermission.import_course[0] not in
+                get_repo_perms(user, repo)):
+            raise PermissionDenied(
+                "user does not have permission to delete courses")
+        if not Course.objects.filter(
+                id=course_id, repository__id=repo.id).exists():
+            raise NotFound()
+
+        result = delete_course.delay(course_id)
+        return track_task(session, result, task_type, task_info)
     else:
         raise ValidationError("Unknown task_type {task_type}".format(
             task_type=task_type
@@ -10,6 +10,7 @@ from six.moves import urllib_parse
 from rest_framework.status import (
     HTTP_200_OK,
     HTTP_201_CREATED,
+    HTTP_202_ACCEPTED,
     HTTP_204_NO_CONTENT,
 )
 from rest_framework.reverse import reverse
@@ -209,8 +210,8 @@ class RESTTestCase(LoreTestCase):
             return as_json(resp)
 
     def delete_course(self, repo_slug, course_id,
-                      expected_status=HTTP_204_NO_CONTENT):
-        """Delete a course."""
+                      expected_status=HTTP_202_ACCEPTED):
+        """Start a task to delete a course."""
         resp = self.client.delete(
             '{repo_base}{slug}/courses/{course_id}/'.format(
                 slug=repo_slug,
@@ -219,6 +220,8 @@ class RESTTestCase(LoreTestCase):
             )
         )
         self.assertEqual(expected_status, resp.status_code)
+        if expected_status == HTTP_202_ACCEPTED:
+            return as_json(resp)
 
     def get_vocabularies(self, repo_slug, expected_status=HTTP_200_OK):
         """Get list of vocabularies."""
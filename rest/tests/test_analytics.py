@@ -0,0 +1,80 @@
+"""
+REST tests for repository analytics
+"""
+from __future__ import unicode_literals
+
+from rest_framework.status import (
+    HTTP_200_OK,
+    HTTP_400_BAD_REQUEST,
+    HTTP_403_FORBIDDEN,
+)
+
+from rest.tests.base import REPO_BASE, RESTTestCase, as_json
+from taxonomy.models import Term, Vocabulary
+from xanalytics.rollups import refresh_rollups
+
+
+class TestAnalytics(RESTTestCase):
+    """
+    REST tests for the analytics rollups of a repository.
+    """
+
+    def get_analytics(self, query="", expected_status=HTTP_200_OK):
+        """Get analytics of the test repository."""
+        url = '{repo_base}{slug}/analytics/{query}'.format(
+            repo_base=REPO_BASE,
+            slug=self.repo.slug,
+            query=query,
+        )
+        resp = self.client.get(url)
+        self.assertEqual(expected_status, resp.status_code)
+        if expected_status == HTTP_200_OK:
+            return as_json(resp)
+
+    def test_list(self):
+        """Rollups are listed with averages and histograms."""
+        self.resource.xa_nr_views = 7
+        self.resource.xa_avg_grade = 80
+        self.resource.save()
+        refresh_rollups(self.repo.id)
+
+        resp = self.get_analytics("?dimension=course")
+        self.assertEqual(resp['count'], 1)
+        self.assertEqual(resp['results'][0], {
+            'dimension': 'course',
+            'key': self.course.id,
+            'label': 'test-org/infinity/Febtober',
+            'resource_count': 1,
+            'views': 7,
+            'attempts': 0,
+            'avg_grade': 80,
+            'grade_histogram': [0, 0, 0, 0, 0, 0, 0, 0, 1, 0],
+        })
+        self.assertEqual(self.get_analytics()['count'], 2)
+        self.get_analytics(
+            "?dimension=other", expected_status=HTTP_400_BAD_REQUEST)
+
+    def test_permission(self):
+        """Users without access to the repository can't see analytics."""
+        self.logout()
+        self.login(self.user_norepo.username)
+        self.get_analytics(expected_status=HTTP_403_FORBIDDEN)
+
+    def test_term_changes(self):
+        """Term rollups are refreshed when terms are edited or deleted."""
+        vocab = Vocabulary.objects.create(
+            repository=self.repo, required=False, weight=1, name="vocab",
+        )
+        term = Term.objects.create(vocabulary=vocab, label="term", weight=1)
+        self.resource.terms.add(term)
+        refresh_rollups(self.repo.id)
+
+        self.patch_term(
+            self.repo.slug, vocab.slug, term.slug, {"label": "renamed"})
+        resp = self.get_analytics("?dimension=term")
+        self.assertEqual(resp['count'], 1)
+        self.assertEqual(resp['results'][0]['label'], 'renamed')
+
+        self.delete_term(
+            self.repo.slug, vocab.slug, Term.objects.get(id=term.id).slug)
+        self.assertEqual(self.get_analytics("?dimension=term")['count'], 0)
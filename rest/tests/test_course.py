@@ -3,6 +3,8 @@ REST tests for courses
 """
 from __future__ import unicode_literals
 
+from django.core.files.storage import default_storage
+
 from rest.tests.base import (
     REPO_BASE,
     RESTAuthTestCase,
@@ -187,7 +189,17 @@ class TestCourse(RESTTestCase):
         )
 
         # delete the course
-        self.delete_course(self.repo.slug, courses[1].id)
+        asset_paths = [
+            asset.asset.name for asset in
+            StaticAsset.objects.filter(course__id=courses[1].id)
+        ]
+        task_id = self.delete_course(self.repo.slug, courses[1].id)['id']
+        task = self.get_task(task_id)
+        self.assertEqual(task['status'], 'success')
+        self.assertEqual(task['task_type'], 'delete_course')
+        self.assertEqual(task['result'], {'count': 18})
+        for path in asset_paths:
+            self.assertFalse(default_storage.exists(path))
 
         # environment after deleting the course
         self.count_resources(
@@ -3,8 +3,10 @@ REST tests for LearningResources and static assets
 """
 
 from __future__ import unicode_literals
+import json
 import os
 
+import mock
 from rest_framework.status import (
     HTTP_200_OK,
     HTTP_400_BAD_REQUEST,
@@ -13,6 +15,7 @@ from rest_framework.status import (
     HTTP_405_METHOD_NOT_ALLOWED,
 )
 
+from rest.views import LearningResourceStream
 from rest.tests.base import (
     RESTTestCase,
     RESTAuthTestCase,
@@ -518,6 +521,117 @@ class TestLearningResource(RESTTestCase):
         self.assertEqual(self.resource.terms.count(), 0)
         self.assertEqual(resource2.terms.count(), 1)
 
+    def test_bulk_terms(self):
+        """
+        Test adding and removing terms on many LearningResources at once.
+        """
+        url = "{repo_base}{repo_slug}/learning_resources/terms/".format(
+            repo_base=REPO_BASE,
+            repo_slug=self.repo.slug,
+        )
+        resource2 = self.create_resource(title="another example")
+        vocab_dict = dict(self.DEFAULT_VOCAB_DICT)
+        vocab_dict['learning_resource_types'] = [
+            self.resource.learning_resource_type.name
+        ]
+        vocab_slug = self.create_vocabulary(
+            self.repo.slug, vocab_dict)['slug']
+        term1_slug = self.create_term(self.repo.slug, vocab_slug)['slug']
+        term2_slug = self.create_term(self.repo.slug, vocab_slug, {
+            'label': 'other label',
+            'weight': 1000,
+        })['slug']
+
+        def post(data, expected_status=HTTP_200_OK):
+            """Post a bulk terms request"""
+            resp = self.client.post(
+                url, json.dumps(data), content_type='application/json')
+            self.assertEqual(resp.status_code, expected_status)
+            return as_json(resp)
+
+        result = post({
+            "ids": [self.resource.id, resource2.id],
+            "add": [term1_slug],
+        })
+        self.assertEqual(result['count'], 2)
+        for resource in (self.resource, resource2):
+            self.assertEqual(
+                [term.slug for term in resource.terms.all()], [term1_slug])
+
+        # Vocabulary doesn't allow multiple terms, so the old term is
+        # replaced.
+        post({"ids": [self.resource.id], "add": [term2_slug]})
+        self.assertEqual(
+            [term.slug for term in self.resource.terms.all()], [term2_slug])
+        self.assertEqual(
+            [term.slug for term in resource2.terms.all()], [term1_slug])
+
+        # Select resources by search query instead of by ids.
+        result = post({"query": "", "remove": [term1_slug, term2_slug]})
+        self.assertEqual(result['count'], 2)
+        self.assertEqual(self.resource.terms.count(), 0)
+        self.assertEqual(resource2.terms.count(), 0)
+
+        # Invalid requests leave terms untouched.
+        post({"ids": [self.resource.id]}, HTTP_400_BAD_REQUEST)
+        post({"add": [term1_slug]}, HTTP_400_BAD_REQUEST)
+        post({"ids": [self.resource.id], "add": ["missing"]},
+             HTTP_400_BAD_REQUEST)
+        post({"ids": [self.resource.id, 1234567], "add": [term1_slug]},
+             HTTP_400_BAD_REQUEST)
+        post({"ids": [self.resource.id], "add": [term1_slug, term2_slug]},
+             HTTP_400_BAD_REQUEST)
+        post({"ids": [self.resource.id], "add": [term1_slug],
+              "remove": [term1_slug]}, HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.resource.terms.count(), 0)
+
+    def test_learning_resource_stream(self):
+        """
+        Test streaming all LearningResources as newline delimited JSON.
+        """
+        self.import_course_tarball(self.repo)
+        url = "{repo_base}{repo_slug}/learning_resources/stream/".format(
+            repo_base=REPO_BASE,
+            repo_slug=self.repo.slug,
+        )
+        expected = self.get_learning_resources(
+            self.repo.slug)['results']
+
+        # Use small chunks so that several keyset queries are made.
+        with mock.patch.object(LearningResourceStream, 'chunk_size', 7):
+            resp = self.client.get(url)
+            self.assertEqual(resp.status_code, HTTP_200_OK)
+            self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+            content = b''.join(resp.streaming_content).decode('utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(
+            [row['id'] for row in rows],
+            sorted(row['id'] for row in rows)
+        )
+        self.assertEqual(len(rows), self.toy_resource_count + 1)
+        expected_by_id = dict((row['id'], row) for row in expected)
+        for row in rows:
+            if row['id'] not in expected_by_id:
+                continue
+            expected_row = expected_by_id[row['id']]
+            self.assertEqual(sorted(row.keys()), sorted(expected_row.keys()))
+            for key, value in row.items():
+                if key in ('terms', 'static_assets'):
+                    self.assertEqual(sorted(value), sorted(expected_row[key]))
+                else:
+                    self.assertEqual(value, expected_row[key])
+
+        resp = self.client.get(url + "?fields=id,title")
+        self.assertEqual(resp.status_code, HTTP_200_OK)
+        content = b''.join(resp.streaming_content).decode('utf-8')
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual(len(rows), self.toy_resource_count + 1)
+        for row in rows:
+            self.assertEqual(sorted(row.keys()), ['id', 'title'])
+
+        resp = self.client.get(url + "?fields=id,missing")
+        self.assertEqual(resp.status_code, HTTP_400_BAD_REQUEST)
+
     def test_remove_content_xml(self):
         """
         Test behavior of remove_content_xml flag.
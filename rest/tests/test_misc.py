@@ -8,14 +8,19 @@ from rest_framework.status import (
     HTTP_404_NOT_FOUND,
 )
 
-from learningresources.models import LearningResourceType
+from learningresources.models import LearningResourceType, Repository
 from rest.tests.base import (
     RESTTestCase,
     API_BASE,
     as_json,
 )
 from rest.pagination import LorePagination
-from rest.util import default_slugify
+from rest.util import (
+    bulk_slugify,
+    csv_rows,
+    default_slugify,
+    slugs_with_prefixes,
+)
 
 
 class TestMisc(RESTTestCase):
@@ -148,3 +153,67 @@ class TestMisc(RESTTestCase):
             ),
             'bar-slug1'
         )
+
+    def test_bulk_slugify(self):
+        """
+        Test for allocating slugs for many labels at once.
+        """
+        calls = []
+        in_use = ['foo', 'foo1', 'foo3', 'bar-slug', 'baz1', 'qux1']
+
+        def existing(slugs, prefixes):
+            """Slugs in use."""
+            calls.append((slugs, prefixes))
+            return [
+                slug for slug in in_use
+                if slug in slugs or
+                any(slug.startswith(prefix) for prefix in prefixes)
+            ]
+
+        self.assertEqual(
+            bulk_slugify(
+                ['foo', 'Foo', 'baz', '%^%$', 'foo', 'qux', 'qux'],
+                'bar', existing),
+            ['foo2', 'foo4', 'baz', 'bar-slug1', 'foo5', 'qux', 'qux2']
+        )
+        self.assertEqual(calls, [
+            (set(['foo', 'baz', 'bar-slug', 'qux']), set()),
+            (set(), set(['foo', 'bar-slug', 'qux'])),
+        ])
+        self.assertEqual(bulk_slugify([], 'bar', existing), [])
+        self.assertEqual(len(calls), 2)
+
+        # Nothing taken and nothing repeated needs only one lookup.
+        del calls[:]
+        self.assertEqual(
+            bulk_slugify(['new', 'other'], 'bar', existing), ['new', 'other'])
+        self.assertEqual(len(calls), 1)
+
+    def test_slugs_with_prefixes(self):
+        """
+        Test loading slugs in use for bulk_slugify.
+        """
+        existing = slugs_with_prefixes(Repository)
+        self.assertEqual(
+            list(existing(set([self.repo.slug, 'missing']), set())),
+            [self.repo.slug]
+        )
+        self.assertEqual(
+            list(existing(set(), set([self.repo.slug[:4]]))),
+            [self.repo.slug]
+        )
+        self.assertEqual(list(existing(set(), set())), [])
+
+    def test_csv_rows(self):
+        """
+        Test splitting CSV text into unicode rows.
+        """
+        self.assertEqual(
+            list(csv_rows('a,"b, c"\n\u00e9t\u00e9,\n')),
+            [['a', 'b, c'], ['\u00e9t\u00e9', '']]
+        )
+        # Quoted cells can span lines, with any line ending.
+        self.assertEqual(
+            list(csv_rows('name,"first line\r\nsecond line"\r\nb,c\n')),
+            [['name', 'first line\r\nsecond line'], ['b', 'c']]
+        )
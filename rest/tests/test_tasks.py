@@ -10,10 +10,13 @@ import os
 import json
 import mock
 
+from celery.states import FAILURE, PENDING, SUCCESS
+from django.contrib.sessions.backends.db import SessionStore
 from django.utils.text import slugify
 from django.test import override_settings, Client
 from rest_framework.status import (
     HTTP_200_OK,
+    HTTP_206_PARTIAL_CONTENT,
     HTTP_400_BAD_REQUEST,
     HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
@@ -27,7 +30,12 @@ from rest.tests.base import (
     API_BASE,
     as_json,
 )
-from rest.tasks import EXPORT_TASK_TYPE
+from rest.tasks import (
+    create_task_result_dicts,
+    get_tasks,
+    EXPORT_TASK_TYPE,
+    TASK_KEY,
+)
 from learningresources.models import LearningResource
 from exporter.tests.test_export import assert_resource_directory
 
@@ -42,7 +50,7 @@ class TestTasks(RESTTestCase):
         """Test a basic export."""
         self.import_course_tarball(self.repo)
         resources = LearningResource.objects.filter(
-            course__repository__id=self.repo.id).all()
+            course__repository__id=self.repo.id).order_by('id')
         for resource in resources:
             self.create_learning_resource_export(self.repo.slug, {
                 "id": resource.id
@@ -116,6 +124,21 @@ class TestTasks(RESTTestCase):
             expected_status=HTTP_404_NOT_FOUND
         )
 
+        # Invalid codec and compression level.
+        for options in ({"codec": "rar"}, {"level": 10}, {"level": "x"}):
+            task_info = {
+                "repo_slug": self.repo.slug,
+                "ids": resource_ids,
+            }
+            task_info.update(options)
+            self.create_task(
+                {
+                    "task_type": EXPORT_TASK_TYPE,
+                    "task_info": task_info,
+                },
+                expected_status=HTTP_400_BAD_REQUEST
+            )
+
         # User doesn't own repo.
         client2 = Client()
         client2.login(
@@ -159,8 +182,8 @@ class TestTasks(RESTTestCase):
         self.assertEqual(result['task_type'], EXPORT_TASK_TYPE)
         self.assertTrue(result['result']['url'].startswith(
             "/media/resource_exports/test_exports.tar"))
-        # webGLDemo.css shows up twice
-        self.assertTrue(result['result']['collision'])
+        # webGLDemo.css is used by two resources but is exported once
+        self.assertFalse(result['result']['collision'])
 
         with self.settings(
             DEFAULT_FILE_STORAGE='storages.backends.s3boto.S3BotoStorage'
@@ -177,6 +200,16 @@ class TestTasks(RESTTestCase):
         resp = self.client.get(result['result']['url'])
         self.assertEqual(HTTP_200_OK, resp.status_code)
 
+        # An interrupted download can resume from where it stopped.
+        content = b"".join(resp.streaming_content)
+        resp = self.client.get(
+            result['result']['url'],
+            HTTP_RANGE='bytes=10-',
+            HTTP_IF_RANGE=resp['ETag'],
+        )
+        self.assertEqual(HTTP_206_PARTIAL_CONTENT, resp.status_code)
+        self.assertEqual(b"".join(resp.streaming_content), content[10:])
+
         tempdir = mkdtemp()
 
         def make_path(resource):
@@ -189,7 +222,7 @@ class TestTasks(RESTTestCase):
                 )
             )
         try:
-            fakefile = BytesIO(b"".join(resp.streaming_content))
+            fakefile = BytesIO(content)
             with tarfile.open(fileobj=fakefile, mode="r:gz") as tar:
                 def is_within_directory(directory, target):
                     
@@ -272,6 +305,60 @@ class TestTasks(RESTTestCase):
         self.get_task(task_id, expected_status=HTTP_404_NOT_FOUND)
         self.assertEqual(self.get_tasks()['count'], 0)
 
+    def test_batched_task_states(self):
+        """
+        Test that task states are fetched from the result backend in one
+        multi-get, and finished tasks are not fetched again.
+        """
+        session = SessionStore()
+        session[TASK_KEY] = dict(
+            (task_id, {
+                "id": task_id,
+                "initial_state": PENDING,
+                "task_type": EXPORT_TASK_TYPE,
+                "task_info": {},
+                "result": None,
+            }) for task_id in ("a", "b", "c")
+        )
+        metas = {
+            "success": {"status": SUCCESS, "result": {"name": "x"}},
+            "failure": {"status": FAILURE, "result": Exception("Failure")},
+        }
+        backend = mock.MagicMock()
+        backend.get_key_for_task.side_effect = lambda task_id: task_id
+        backend.decode_result.side_effect = lambda value: metas[value]
+
+        def get_results():
+            """Get task results sorted by id."""
+            tasks = sorted(
+                get_tasks(session).values(), key=lambda task: task['id'])
+            with mock.patch('rest.tasks.current_app') as app:
+                app.backend = backend
+                return create_task_result_dicts(session, tasks)
+
+        backend.mget.return_value = ["success", None, "failure"]
+        results = get_results()
+        backend.mget.assert_called_once_with(["a", "b", "c"])
+        self.assertEqual(
+            [(result['status'], result['result']) for result in results],
+            [
+                ("success", {"name": "x"}),
+                ("processing", None),
+                ("failure", {"error": "Failure"}),
+            ]
+        )
+        self.assertEqual(session[TASK_KEY]["a"]["initial_state"], SUCCESS)
+
+        # Only the unfinished task is looked up again.
+        backend.mget.reset_mock()
+        backend.mget.return_value = [None]
+        results = get_results()
+        backend.mget.assert_called_once_with(["b"])
+        self.assertEqual(
+            [result['status'] for result in results],
+            ["success", "processing", "failure"]
+        )
+
     @override_settings(
         CELERY_EAGER_PROPAGATES_EXCEPTIONS=False
     )
@@ -305,7 +392,7 @@ class TestTasks(RESTTestCase):
         """
         self.import_course_tarball(self.repo)
         resources = LearningResource.objects.filter(
-            course__repository__id=self.repo.id).all()
+            course__repository__id=self.repo.id).order_by('id')
         for resource in resources:
             self.create_learning_resource_export(self.repo.slug, {
                 "id": resource.id
@@ -0,0 +1,113 @@
+"""
+REST tests for taxonomy imports
+"""
+from __future__ import unicode_literals
+
+import json
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError
+import mock
+from rest_framework.status import (
+    HTTP_201_CREATED,
+    HTTP_400_BAD_REQUEST,
+    HTTP_403_FORBIDDEN,
+    HTTP_409_CONFLICT,
+)
+
+from rest.tests.base import REPO_BASE, RESTAuthTestCase, as_json
+from taxonomy.models import Term, Vocabulary
+
+
+class TestTaxonomyImport(RESTAuthTestCase):
+    """
+    REST tests for importing vocabularies and terms.
+    """
+
+    def post_import(self, data, content_type='application/json',
+                    expected_status=HTTP_201_CREATED):
+        """Post a taxonomy import to the test repository."""
+        url = '{repo_base}{slug}/taxonomy_imports/'.format(
+            repo_base=REPO_BASE,
+            slug=self.repo.slug,
+        )
+        if content_type == 'application/json':
+            resp = self.client.post(
+                url, json.dumps(data), content_type=content_type)
+        else:
+            resp = self.client.post(url, data)
+        self.assertEqual(expected_status, resp.status_code)
+        if expected_status == HTTP_201_CREATED:
+            return as_json(resp)
+
+    def test_json(self):
+        """Import vocabularies from the request body."""
+        summary = self.post_import({"vocabularies": [
+            {"name": "difficulty", "terms": ["Easy", "Hard"]},
+        ]})
+        self.assertEqual(summary, {
+            "vocabularies_created": 1,
+            "terms_created": 2,
+            "terms_skipped": 0,
+        })
+        vocab = Vocabulary.objects.get(repository=self.repo)
+        self.assertEqual(vocab.name, "difficulty")
+        self.assertEqual(vocab.term_set.count(), 2)
+
+    def test_files(self):
+        """Import vocabularies from CSV and JSON files."""
+        summary = self.post_import({"file": SimpleUploadedFile(
+            "terms.csv", "vocabulary,label\ndifficulty,Éasy\n".encode(
+                'utf-8')
+        )}, content_type=None)
+        self.assertEqual(summary["terms_created"], 1)
+        summary = self.post_import({"file": SimpleUploadedFile(
+            "terms.json",
+            b'[{"name": "difficulty", "terms": ["\\u00c9asy", "Hard"]}]'
+        )}, content_type=None)
+        self.assertEqual(summary, {
+            "vocabularies_created": 0,
+            "terms_created": 1,
+            "terms_skipped": 1,
+        })
+        self.assertEqual(
+            sorted(Term.objects.values_list('label', flat=True)),
+            ["Hard", "Éasy"]
+        )
+
+    def test_invalid(self):
+        """Invalid imports are rejected as a whole."""
+        self.post_import({}, expected_status=HTTP_400_BAD_REQUEST)
+        self.post_import(
+            {"vocabularies": [{"name": "ok"}, {"name": ""}]},
+            expected_status=HTTP_400_BAD_REQUEST
+        )
+        self.post_import(
+            {"file": SimpleUploadedFile("terms.json", b'{"x": ')},
+            content_type=None, expected_status=HTTP_400_BAD_REQUEST
+        )
+        self.post_import(
+            {"file": SimpleUploadedFile("terms.csv", b'\xff\xfe')},
+            content_type=None, expected_status=HTTP_400_BAD_REQUEST
+        )
+        self.assertEqual(Vocabulary.objects.count(), 0)
+
+    def test_conflict(self):
+        """A concurrent import taking the same slugs is a conflict."""
+        with mock.patch(
+            "rest.views.import_taxonomy", side_effect=IntegrityError
+        ):
+            self.post_import(
+                {"vocabularies": [{"name": "difficulty"}]},
+                expected_status=HTTP_409_CONFLICT
+            )
+
+    def test_permission(self):
+        """Only users who manage the taxonomy can import."""
+        self.logout()
+        self.login(self.author_user.username)
+        self.post_import(
+            {"vocabularies": [{"name": "difficulty"}]},
+            expected_status=HTTP_403_FORBIDDEN
+        )
+        self.assertEqual(Vocabulary.objects.count(), 0)
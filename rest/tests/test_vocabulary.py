@@ -7,6 +7,8 @@ from __future__ import unicode_literals
 import logging
 from copy import deepcopy
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework.status import (
     HTTP_200_OK,
     HTTP_400_BAD_REQUEST,
@@ -551,6 +553,99 @@ class TestVocabulary(RESTTestCase):
         self.assertEqual([TermSerializer(x).data
                           for x in expected[20:40]], terms['results'])
 
+    def test_vocabulary_list_terms(self):
+        """Test include_terms and terms_limit for the vocabulary list"""
+        vocab_slug = self.create_vocabulary(self.repo.slug)['slug']
+        other_slug = self.create_vocabulary(self.repo.slug, {
+            'name': 'other name',
+            'description': 'description',
+            'required': True,
+            'weight': 1000,
+            'vocabulary_type': 'f',
+            'learning_resource_types': [],
+            'multi_terms': False,
+        })['slug']
+        expected = [
+            self.create_term(
+                self.repo.slug,
+                vocab_slug,
+                {
+                    "label": "name{i}".format(i=i),
+                    "weight": 1000,
+                }
+            ) for i in range(5)]
+        other_term = self.create_term(self.repo.slug, other_slug)
+        url = '{repo_base}{repo_slug}/vocabularies/'.format(
+            repo_slug=self.repo.slug,
+            repo_base=REPO_BASE,
+        )
+
+        def get_vocabs(query):
+            """Get vocabularies keyed by slug."""
+            resp = self.client.get(url + query)
+            self.assertEqual(HTTP_200_OK, resp.status_code)
+            return dict(
+                (vocab['slug'], vocab) for vocab in as_json(resp)['results']
+            )
+
+        vocabs = get_vocabs('')
+        self.assertEqual(vocabs[vocab_slug]['terms'], expected)
+        self.assertEqual(vocabs[other_slug]['terms'], [other_term])
+        self.assertNotIn('terms_next', vocabs[vocab_slug])
+
+        vocabs = get_vocabs('?include_terms=false')
+        self.assertNotIn('terms', vocabs[vocab_slug])
+        self.assertNotIn('terms', vocabs[other_slug])
+
+        vocabs = get_vocabs('?terms_limit=2')
+        self.assertEqual(vocabs[vocab_slug]['terms'], expected[:2])
+        self.assertEqual(vocabs[other_slug]['terms'], [other_term])
+        self.assertIsNone(vocabs[other_slug]['terms_next'])
+
+        # The cursor points at the next page of the term list.
+        resp = self.client.get(vocabs[vocab_slug]['terms_next'])
+        self.assertEqual(HTTP_200_OK, resp.status_code)
+        self.assertEqual(as_json(resp)['results'], expected[2:4])
+
+        for value in ('0', 'x'):
+            resp = self.client.get(url + '?terms_limit=' + value)
+            self.assertEqual(HTTP_400_BAD_REQUEST, resp.status_code)
+
+    def test_vocabulary_list_num_queries(self):
+        """The vocabulary list should not query once per vocabulary"""
+        url = '{repo_base}{repo_slug}/vocabularies/'.format(
+            repo_slug=self.repo.slug,
+            repo_base=REPO_BASE,
+        )
+
+        def count_queries():
+            """Count queries for the vocabulary list with each option."""
+            counts = []
+            for query in ('', '?terms_limit=1'):
+                with CaptureQueriesContext(connection) as context:
+                    resp = self.client.get(url + query)
+                self.assertEqual(HTTP_200_OK, resp.status_code)
+                counts.append(len(context.captured_queries))
+            return counts
+
+        counts = None
+        for i in range(10):
+            vocab_slug = self.create_vocabulary(self.repo.slug, {
+                'name': 'name{i}'.format(i=i),
+                'description': 'description',
+                'required': True,
+                'weight': 1000,
+                'vocabulary_type': 'f',
+                'learning_resource_types': [
+                    self.resource.learning_resource_type.name
+                ],
+                'multi_terms': False,
+            })['slug']
+            self.create_term(self.repo.slug, vocab_slug)
+            if counts is None:
+                counts = count_queries()
+        self.assertEqual(counts, count_queries())
+
     def test_immutable_fields_vocabulary(self):
         """Test immutable fields for vocabulary"""
 
@@ -909,11 +1004,11 @@ class TestVocabulary(RESTTestCase):
         vocab_dict['learning_resource_types'] = [
             self.resource.learning_resource_type.name
         ]
-        with self.assertNumQueries(25):
+        with self.assertNumQueries(21):
             vocab_slug = self.create_vocabulary(
                 self.repo.slug, vocab_dict)['slug']
 
-        with self.assertNumQueries(20):
+        with self.assertNumQueries(14):
             term_slug = self.create_term(
                 self.repo.slug, vocab_slug
             )['slug']
@@ -922,7 +1017,7 @@ class TestVocabulary(RESTTestCase):
             "terms": [term_slug]
         })
 
-        with self.assertNumQueries(39):
+        with self.assertNumQueries(38):
             # Remove the types which will require a reindex.
             self.patch_vocabulary(self.repo.slug, vocab_slug, {
                 "learning_resource_types": []
@@ -938,7 +1033,7 @@ class TestVocabulary(RESTTestCase):
             "terms": [term_slug]
         })
 
-        with self.assertNumQueries(31):
+        with self.assertNumQueries(30):
             self.delete_term(self.repo.slug, vocab_slug, term_slug)
 
         # Add back term, reassign the term, then delete the vocabulary.
@@ -9,6 +9,7 @@ from django.conf.urls import url, include
 from .views import (
     CourseDetail,
     CourseList,
+    LearningResourceBulkTerms,
     LearningResourceDetail,
     LearningResourceExportDetail,
     LearningResourceExportList,
@@ -17,17 +18,20 @@ from .views import (
     TaskDetail,
     TaskList,
     LearningResourceList,
+    LearningResourceStream,
     LearningResourceTypeList,
     RepoMemberGroupList,
     RepoMemberGroupUserDetail,
     RepoMemberList,
     RepoMemberUserGroupDetail,
     RepoMemberUserList,
+    RepositoryAnalyticsList,
     RepositoryDetail,
     RepositoryList,
     RepositorySearchList,
     StaticAssetDetail,
     StaticAssetList,
+    TaxonomyImport,
     TermDetail,
     TermList,
     VocabularyDetail,
@@ -63,6 +67,12 @@ urlpatterns = [
     url(r'^repositories/(?P<repo_slug>[-\w]+)/courses/(?P<course_id>\d+)/$',
         CourseDetail.as_view(),
         name='course-detail'),
+    url(r'^repositories/(?P<repo_slug>[-\w]+)/analytics/$',
+        RepositoryAnalyticsList.as_view(),
+        name='repository-analytics'),
+    url(r'^repositories/(?P<repo_slug>[-\w]+)/taxonomy_imports/$',
+        TaxonomyImport.as_view(),
+        name='taxonomy-import'),
     url(REPOSITORY_VOCAB_URL + r'$',
         VocabularyList.as_view(),
         name='vocabulary-list'),
@@ -109,6 +119,12 @@ urlpatterns = [
     url(REPOSITORY_RESOURCE_URL + r'$',
         LearningResourceList.as_view(),
         name='learning-resource-list'),
+    url(REPOSITORY_RESOURCE_URL + r'stream/$',
+        LearningResourceStream.as_view(),
+        name='learning-resource-stream'),
+    url(REPOSITORY_RESOURCE_URL + r'terms/$',
+        LearningResourceBulkTerms.as_view(),
+        name='learning-resource-bulk-terms'),
     url(REPOSITORY_RESOURCE_URL + r'(?P<lr_id>\d+)/$',
         LearningResourceDetail.as_view(),
         name='learning-resource-detail'),
@@ -4,14 +4,25 @@ Utility functions and classes for REST app
 
 from __future__ import unicode_literals
 
+from collections import Counter
+import csv
+from functools import reduce  # pylint: disable=redefined-builtin
+import io
+from operator import or_
+
 from django.contrib.auth.models import User
+from django.db.models import Q
 from django.http.response import Http404
 from django.shortcuts import get_object_or_404
 from django.utils.text import slugify
 from rest_framework.fields import BooleanField, empty
+import six
 
 from roles.permissions import BaseGroupTypes
 
+# Number of slugs or slug prefixes looked up per query.
+SLUG_LOOKUP_CHUNK_SIZE = 100
+
 
 class LambdaDefault(object):
     """
@@ -86,3 +97,94 @@ def default_slugify(label, default_name, exists_func):
         slug = "{0}{1}".format(slugified_str, count)
         count += 1
     return slug
+
+
+def bulk_slugify(labels, default_name, existing_func):
+    """
+    Compute unique slugs for many labels at once, the same way
+    `default_slugify` would when saving them one after another.
+    NOTE: the `existing_func` is called at most twice, first to find which
+    base slugs are taken and then to find the numbered slugs in use for
+    the bases which are taken or repeated, ideally with indexed queries.
+
+    Args:
+        labels (list of unicode): labels to be slugified
+        default_name (unicode): default base slug to be used if the slugified
+            label is an empty string
+        existing_func (function): function which takes a set of slugs and
+            a set of prefixes and returns an iterable of the slugs in use
+            equal to any of the slugs or starting with any of the prefixes
+    Returns:
+        slugs (list of unicode): slug for each label, in the same order
+    """
+    bases = [
+        slugify(label) or '{}-slug'.format(default_name) for label in labels
+    ]
+    if len(bases) == 0:
+        return []
+    taken = set(existing_func(set(bases), set()))
+    counts = Counter(bases)
+    suffixed = set(
+        base for base, count in counts.items() if base in taken or count > 1)
+    if len(suffixed) > 0:
+        taken.update(existing_func(set(), suffixed))
+    next_suffix = {}
+    slugs = []
+    for base in bases:
+        slug = base
+        count = next_suffix.get(base, 1)
+        while slug in taken:
+            slug = "{0}{1}".format(base, count)
+            count += 1
+        next_suffix[base] = count
+        taken.add(slug)
+        slugs.append(slug)
+    return slugs
+
+
+def slugs_with_prefixes(model):
+    """
+    Make a function which loads the slugs of a model equal to some slugs
+    or starting with some prefixes, for `bulk_slugify`. Lookups are chunked
+    so no query gets more than SLUG_LOOKUP_CHUNK_SIZE conditions.
+
+    Args:
+        model (class): model with a unique `slug` field
+    Returns:
+        function: Takes a set of slugs and a set of prefixes,
+            returns a list of slugs
+    """
+    def existing(slugs, prefixes):
+        """Slugs in use equal to any of slugs or starting with prefixes."""
+        found = []
+        slugs = list(slugs)
+        for start in range(0, len(slugs), SLUG_LOOKUP_CHUNK_SIZE):
+            found.extend(model.objects.filter(
+                slug__in=slugs[start:start + SLUG_LOOKUP_CHUNK_SIZE]
+            ).values_list('slug', flat=True))
+        prefixes = list(prefixes)
+        for start in range(0, len(prefixes), SLUG_LOOKUP_CHUNK_SIZE):
+            found.extend(model.objects.filter(reduce(or_, [
+                Q(slug__startswith=prefix)
+                for prefix in prefixes[start:start + SLUG_LOOKUP_CHUNK_SIZE]
+            ])).values_list('slug', flat=True))
+        return found
+    return existing
+
+
+def csv_rows(text):
+    """
+    Split CSV text into rows of unicode cells, on Python 2 and 3.
+    Quoted cells may span several lines.
+
+    Args:
+        text (unicode): CSV
+    Returns:
+        iterator of list of unicode: Cells of each row
+    """
+    if six.PY2:
+        return (
+            [cell.decode('utf-8') for cell in row]
+            for row in csv.reader(io.BytesIO(text.encode('utf-8')))
+        )
+    return csv.reader(io.StringIO(text, newline=''))
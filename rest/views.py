@@ -4,14 +4,19 @@ Controllers for REST app
 
 from __future__ import unicode_literals
 
-from django.http.response import Http404
+from collections import defaultdict
+import json
+
+from django.http.response import Http404, StreamingHttpResponse
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied as DjangoPermissionDenied
-from django.db import transaction
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
 from django.db.models.functions import Lower
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
 from rest_framework.generics import (
+    CreateAPIView,
     ListAPIView,
     ListCreateAPIView,
     RetrieveAPIView,
@@ -33,8 +38,10 @@ from roles.api import (
     remove_user_from_repo_group,
 )
 from rest.serializers import (
+    AnalyticsRollupSerializer,
     CourseSerializer,
     GroupSerializer,
+    LearningResourceBulkTermsSerializer,
     LearningResourceExportSerializer,
     LearningResourceExportTaskSerializer,
     TaskSerializer,
@@ -43,6 +50,7 @@ from rest.serializers import (
     RepositorySearchSerializer,
     RepositorySerializer,
     StaticAssetSerializer,
+    TaxonomyImportSerializer,
     TermSerializer,
     UserGroupSerializer,
     UserSerializer,
@@ -64,16 +72,26 @@ from rest.permissions import (
 from rest.tasks import (
     create_task,
     create_task_result_dict,
+    create_task_result_dicts,
     get_task,
     get_tasks,
     remove_task,
+    DELETE_COURSE_TASK_TYPE,
     EXPORTS_KEY,
     EXPORT_TASK_TYPE,
 )
+from rest.pagination import LorePagination
 from rest.util import CheckValidMemberParamMixin
 from search.api import construct_queryset
 from search.tasks import index_resources
-from taxonomy.models import Vocabulary
+from taxonomy.api import (
+    capped_terms,
+    import_taxonomy,
+    parse_taxonomy_csv,
+    parse_taxonomy_json,
+    update_resource_terms,
+)
+from taxonomy.models import Term, Vocabulary
 
 from learningresources.api import (
     PermissionDenied,
@@ -85,11 +103,14 @@ from learningresources.models import (
     LearningResourceType,
     LearningResource,
     StaticAsset,
+    get_preview_url,
 )
 from learningresources.api import (
     get_repos,
     get_resource,
 )
+from xanalytics.models import AnalyticsRollup
+from xanalytics.rollups import refresh_term_rollups
 
 
 # pylint: disable=too-many-lines
@@ -108,9 +129,9 @@ class RepositoryList(ListCreateAPIView):
 
     def get_queryset(self):
         """Filter to these repositories."""
-
-        repo_ids = [repo.id for repo in get_repos(self.request.user.id)]
-        return Repository.objects.filter(id__in=repo_ids).order_by('id')
+        return get_repos(self.request.user.id).only(
+            'id', 'slug', 'name', 'description', 'date_created'
+        ).order_by('id')
 
 
 class RepositoryDetail(RetrieveAPIView):
@@ -169,10 +190,29 @@ class CourseDetail(RetrieveDestroyAPIView):
     @statsd.timer('lore.rest.course_detail_delete')
     def delete(self, request, *args, **kwargs):
         """
-        Deletes a course in a repo with all the related learning resources and
-        static assets
+        Start a task which deletes a course in a repo with all the related
+        learning resources and static assets
         """
-        return super(CourseDetail, self).delete(request, *args, **kwargs)
+        course = self.get_object()
+        try:
+            result = create_task(
+                self.request.session,
+                self.request.user.id,
+                DELETE_COURSE_TASK_TYPE,
+                {
+                    "repo_slug": self.kwargs['repo_slug'],
+                    "course_id": course.id,
+                }
+            )
+        except PermissionDenied:
+            raise DjangoPermissionDenied
+        except NotFound:
+            raise Http404
+
+        return Response(
+            {"id": result['id']},
+            status=status.HTTP_202_ACCEPTED
+        )
 
 
 class VocabularyList(ListCreateAPIView):
@@ -195,8 +235,46 @@ class VocabularyList(ListCreateAPIView):
         if learning_resource_type is not None:
             queryset = queryset.filter(
                 learning_resource_types__name=learning_resource_type)
+
+        queryset = queryset.prefetch_related('learning_resource_types')
+        context = self.get_serializer_context()
+        if context['include_terms'] and context['terms_limit'] is None:
+            queryset = queryset.prefetch_related(Prefetch(
+                'term_set', queryset=Term.objects.order_by('id')
+            ))
         return queryset.order_by(Lower('name'))
 
+    def paginate_queryset(self, queryset):
+        """Load the capped terms of the vocabularies on the page."""
+        page = super(VocabularyList, self).paginate_queryset(queryset)
+        context = self.get_serializer_context()
+        if (page is not None and context['include_terms'] and
+                context['terms_limit'] is not None):
+            # Fetch one extra term to tell whether there is a next page.
+            page = capped_terms(page, context['terms_limit'] + 1)
+        return page
+
+    def get_serializer_context(self):
+        """
+        Read include_terms and terms_limit from the query string
+        for the serializer.
+        """
+        context = super(VocabularyList, self).get_serializer_context()
+        context['include_terms'] = (
+            self.request.query_params.get('include_terms') != 'false'
+        )
+        terms_limit = self.request.query_params.get('terms_limit', None)
+        if terms_limit is not None:
+            try:
+                terms_limit = int(terms_limit)
+            except ValueError:
+                raise ValidationError("terms_limit is not a number")
+            if terms_limit < 1:
+                raise ValidationError("terms_limit must be positive")
+            terms_limit = min(terms_limit, LorePagination.max_page_size)
+        context['terms_limit'] = terms_limit
+        return context
+
     def get_success_headers(self, data):
         """Add Location header for model create."""
         url = reverse('vocabulary-detail', kwargs={
@@ -241,15 +319,18 @@ class VocabularyDetail(RetrieveUpdateDestroyAPIView):
             removed_types = old_types - set(new_types)
 
             resource_ids_to_reindex = []
+            term_ids_to_refresh = set()
             with transaction.atomic():
                 for term in vocab.term_set.all():
                     for resource in term.learning_resources.all():
                         if (resource.learning_resource_type.name in
                                 removed_types):
                             resource_ids_to_reindex.append(resource.id)
+                            term_ids_to_refresh.add(term.id)
                             term.learning_resources.remove(resource)
             if len(resource_ids_to_reindex) > 0:
                 index_resources.delay(resource_ids_to_reindex)
+                refresh_term_rollups(vocab.repository_id, term_ids_to_refresh)
 
         return super(VocabularyDetail, self).update(
             request, *args, **kwargs)
@@ -262,8 +343,10 @@ class VocabularyDetail(RetrieveUpdateDestroyAPIView):
         resource_ids = list(LearningResource.objects.filter(
             terms__vocabulary__id=vocab.id
         ).values_list("id", flat=True))
+        term_ids = list(vocab.term_set.values_list("id", flat=True))
         ret = super(VocabularyDetail, self).delete(request, *args, **kwargs)
         index_resources.delay(resource_ids)
+        refresh_term_rollups(vocab.repository_id, term_ids)
         return ret
 
 
@@ -330,10 +413,66 @@ class TermDetail(RetrieveUpdateDestroyAPIView):
         resource_ids = list(LearningResource.objects.filter(
             terms__id=term.id
         ).values_list("id", flat=True))
+        term_id = term.id
         ret = super(TermDetail, self).delete(request, *args, **kwargs)
         index_resources.delay(resource_ids)
+        refresh_term_rollups(term.vocabulary.repository_id, [term_id])
         return ret
 
+    def perform_update(self, serializer):
+        """Refresh the analytics rollup which has the term label."""
+        term = serializer.save()
+        refresh_term_rollups(term.vocabulary.repository_id, [term.id])
+
+
+class TaxonomyImport(CreateAPIView):
+    """
+    REST view to create many vocabularies and terms at once.
+    """
+    serializer_class = TaxonomyImportSerializer
+    permission_classes = (
+        ViewRepoPermission,
+        ManageTaxonomyPermission,
+        IsAuthenticated,
+    )
+
+    @statsd.timer('lore.rest.taxonomy_import')
+    def create(self, request, *args, **kwargs):
+        """
+        Import vocabularies and terms from a JSON or CSV file
+        or from the request body.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        try:
+            if 'file' in data:
+                try:
+                    text = data['file'].read().decode('utf-8-sig')
+                except UnicodeDecodeError:
+                    raise ValueError("File is not UTF-8 encoded")
+                if data['file'].name.lower().endswith('.csv'):
+                    vocabularies = parse_taxonomy_csv(text)
+                else:
+                    vocabularies = parse_taxonomy_json(text)
+            else:
+                vocabularies = data['vocabularies']
+            repo = Repository.objects.get(slug=self.kwargs['repo_slug'])
+            summary = import_taxonomy(repo, vocabularies)
+        except ValueError as ex:
+            raise ValidationError(ex.args[0])
+        except IntegrityError:
+            return Response(
+                data={
+                    "detail": ("Another import to this repository is in "
+                               "progress, please try again")
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+
+        return Response(summary, status=status.HTTP_201_CREATED)
+
 
 class RepoMemberList(ListAPIView):
     """
@@ -418,12 +557,7 @@ class RepoMemberUserList(CheckValidMemberParamMixin, ListCreateAPIView):
         """
         repo = Repository.objects.get(slug=self.kwargs['repo_slug'])
         username = self.kwargs.get('username')
-        return list(
-            set(
-                user_group for user_group in list_users_in_repo(repo)
-                if user_group.username == username
-            )
-        )
+        return list_users_in_repo(repo, username=username)
 
     def perform_create(self, serializer):
         """Add a group for a user."""
@@ -473,12 +607,11 @@ class RepoMemberUserGroupDetail(CheckValidMemberParamMixin,
         repo = Repository.objects.get(slug=self.kwargs['repo_slug'])
         username = self.kwargs.get('username')
         group_type = self.kwargs.get('group_type')
-        user_groups = list_users_in_repo(repo, group_type)
+        user_groups = list_users_in_repo(repo, group_type, username)
         # There can be max only one user with the specified username in a group
-        for user_group in user_groups:
-            if user_group.username == username:
-                return user_group
-        raise Http404()
+        if len(user_groups) == 0:
+            raise Http404()
+        return user_groups[0]
 
     def delete(self, request, *args, **kwargs):
         """
@@ -514,6 +647,29 @@ class RepoMemberGroupUserDetail(RepoMemberUserGroupDetail):
     serializer_class = UserSerializer
 
 
+class RepositoryAnalyticsList(ListAPIView):
+    """
+    REST list view for the precomputed analytics rollups of a repository.
+    """
+    serializer_class = AnalyticsRollupSerializer
+    permission_classes = (
+        ViewRepoPermission,
+        IsAuthenticated,
+    )
+
+    def get_queryset(self):
+        """Filter rollups by repository and optionally dimension."""
+        queryset = AnalyticsRollup.objects.filter(
+            repository__slug=self.kwargs['repo_slug'])
+        dimension = self.request.query_params.get('dimension', None)
+        if dimension is not None:
+            if dimension not in dict(AnalyticsRollup.DIMENSION_CHOICES):
+                raise ValidationError("Unknown dimension {dimension}".format(
+                    dimension=dimension))
+            queryset = queryset.filter(dimension=dimension)
+        return queryset.order_by('dimension', 'key')
+
+
 class LearningResourceTypeList(ListAPIView):
     """REST list view for LearningResourceType."""
     serializer_class = LearningResourceTypeSerializer
@@ -556,6 +712,120 @@ class LearningResourceList(ListAPIView):
         return queryset
 
 
+class LearningResourceStream(LearningResourceList):
+    """
+    REST view which streams all LearningResources of a repository as
+    newline delimited JSON. Rows are read in keyset ordered chunks so memory
+    use doesn't depend on the size of the repository.
+    """
+    chunk_size = 1000
+    # Fields which map directly to a column of LearningResource.
+    column_fields = {
+        'id': 'id',
+        'learning_resource_type': 'learning_resource_type__name',
+        'title': 'title',
+        'description': 'description',
+        'content_xml': 'content_xml',
+        'materialized_path': 'materialized_path',
+        'url_path': 'url_path',
+        'parent': 'parent_id',
+        'copyright': 'copyright',
+        'xa_nr_views': 'xa_nr_views',
+        'xa_nr_attempts': 'xa_nr_attempts',
+        'xa_avg_grade': 'xa_avg_grade',
+        'xa_histogram_grade': 'xa_histogram_grade',
+    }
+    preview_url_columns = (
+        'url_name', 'course__org', 'course__course_number', 'course__run',
+    )
+
+    def get_fields(self):
+        """Parse the fields query parameter."""
+        all_fields = LearningResourceSerializer.Meta.fields
+        fields_value = self.request.query_params.get('fields', None)
+        if fields_value is None:
+            return all_fields
+        fields = [x for x in fields_value.split(',') if len(x) > 0]
+        for field in fields:
+            if field not in all_fields:
+                raise ValidationError("Unknown field {field}".format(
+                    field=field
+                ))
+        return fields
+
+    def iter_rows(self, queryset, fields):
+        """
+        Yield a dict for each LearningResource in the queryset.
+
+        Args:
+            queryset (QuerySet): LearningResources to read
+            fields (list of unicode): Fields to include in each dict
+        Returns:
+            generator: dicts with the fields for each LearningResource
+        """
+        columns = set(
+            self.column_fields[field] for field in fields
+            if field in self.column_fields
+        )
+        columns.add('id')
+        if 'preview_url' in fields:
+            columns.update(self.preview_url_columns)
+
+        queryset = queryset.order_by('id')
+        last_id = 0
+        while True:
+            rows = list(queryset.filter(id__gt=last_id).values(
+                *columns)[:self.chunk_size])
+            if len(rows) == 0:
+                return
+            last_id = rows[-1]['id']
+
+            ids = [row['id'] for row in rows]
+            terms = defaultdict(list)
+            if 'terms' in fields:
+                term_rels = Term.learning_resources.through.objects.filter(
+                    learningresource__id__in=ids
+                ).values_list('learningresource_id', 'term__slug')
+                for resource_id, slug in term_rels:
+                    terms[resource_id].append(slug)
+            assets = defaultdict(list)
+            if 'static_assets' in fields:
+                through = LearningResource.static_assets.through
+                asset_rels = through.objects.filter(
+                    learningresource__id__in=ids
+                ).values_list('learningresource_id', 'staticasset_id')
+                for resource_id, asset_id in asset_rels:
+                    assets[resource_id].append(asset_id)
+
+            for row in rows:
+                data = {}
+                for field in fields:
+                    if field in self.column_fields:
+                        data[field] = row[self.column_fields[field]]
+                    elif field == 'terms':
+                        data[field] = terms[row['id']]
+                    elif field == 'static_assets':
+                        data[field] = assets[row['id']]
+                    elif field == 'preview_url':
+                        data[field] = get_preview_url(
+                            LearningResource(url_name=row['url_name']),
+                            org=row['course__org'],
+                            course_number=row['course__course_number'],
+                            run=row['course__run'],
+                        )
+                yield data
+
+    @statsd.timer('lore.rest.learning_resource_stream')
+    def list(self, request, *args, **kwargs):
+        """Stream LearningResources as newline delimited JSON."""
+        fields = self.get_fields()
+        rows = self.iter_rows(self.get_queryset().distinct(), fields)
+        return StreamingHttpResponse(
+            ("{row}\n".format(row=json.dumps(row)) for row in rows),
+            content_type='application/x-ndjson',
+        )
+
+
 class LearningResourceDetail(RetrieveUpdateAPIView):
     """REST detail view for LearningResource."""
     serializer_class = LearningResourceSerializer
@@ -585,6 +855,18 @@ class LearningResourceDetail(RetrieveUpdateAPIView):
             data = serializer.data
         return Response(data)
 
+    def perform_update(self, serializer):
+        """Refresh the analytics rollups of terms added or removed."""
+        if 'terms' not in serializer.validated_data:
+            serializer.save()
+            return
+        old_term_ids = set(
+            serializer.instance.terms.values_list('id', flat=True))
+        resource = serializer.save()
+        new_term_ids = set(resource.terms.values_list('id', flat=True))
+        refresh_term_rollups(
+            resource.course.repository_id, old_term_ids ^ new_term_ids)
+
     def update(self, request, *args, **kwargs):
         """Override update to remove response."""
         super(LearningResourceDetail, self).update(request, *args, **kwargs)
@@ -603,6 +885,50 @@ class LearningResourceDetail(RetrieveUpdateAPIView):
         return Response(status=status.HTTP_200_OK)
 
 
+class LearningResourceBulkTerms(CreateAPIView):
+    """
+    REST view to add and remove terms on many LearningResources at once.
+    """
+    serializer_class = LearningResourceBulkTermsSerializer
+    permission_classes = (
+        ViewRepoPermission,
+        AddEditMetadataPermission,
+        IsAuthenticated,
+    )
+
+    @statsd.timer('lore.rest.learning_resource_bulk_terms')
+    def create(self, request, *args, **kwargs):
+        """
+        Update terms for the LearningResources selected by id or by
+        search query and facets.
+        """
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        repo_slug = self.kwargs['repo_slug']
+
+        if 'ids' in data:
+            resource_ids = data['ids']
+        else:
+            resource_ids = construct_queryset(
+                repo_slug,
+                query=data.get('query', ''),
+                selected_facets=data.get('selected_facets', []),
+            ).all_ids()
+
+        repo = Repository.objects.get(slug=repo_slug)
+        try:
+            updated_ids = update_resource_terms(
+                repo, resource_ids, data['add'], data['remove'])
+        except ValueError as ex:
+            raise ValidationError(ex.args[0])
+
+        return Response(
+            {"count": len(updated_ids)},
+            status=status.HTTP_200_OK
+        )
+
+
 class StaticAssetList(ListAPIView):
     """REST list view for StaticAsset."""
     serializer_class = StaticAssetSerializer
@@ -770,7 +1096,8 @@ class LearningResourceExportTaskList(ListCreateAPIView):
             task['task_info']['repo_slug'] == repo_slug
         ]
 
-        task_results = [create_task_result_dict(task) for task in export_tasks]
+        task_results = create_task_result_dicts(
+            self.request.session, export_tasks)
 
         return [
             {
@@ -807,14 +1134,19 @@ class LearningResourceExportTaskList(ListCreateAPIView):
         except KeyError:
             raise ValidationError("Missing ids")
 
+        task_info = {
+            'repo_slug': repo_slug,
+            'ids': ids
+        }
+        for option in ('codec', 'level'):
+            if option in self.request.data:
+                task_info[option] = self.request.data[option]
+
         task = create_task(
             self.request.session,
             self.request.user.id,
             EXPORT_TASK_TYPE,
-            {
-                'repo_slug': repo_slug,
-                'ids': ids
-            }
+            task_info
         )
 
         return Response(
@@ -842,7 +1174,7 @@ class LearningResourceExportTaskDetail(RetrieveAPIView):
         if initial_dict is None:
             raise Http404
 
-        result = create_task_result_dict(initial_dict)
+        result = create_task_result_dict(initial_dict, self.request.session)
         return {
             "id": result['id'],
             "status": result['status'],
@@ -864,7 +1196,8 @@ class TaskList(ListCreateAPIView):
         """Get tasks for this user."""
         tasks = get_tasks(self.request.session)
 
-        return [create_task_result_dict(task) for task in tasks.values()]
+        return create_task_result_dicts(
+            self.request.session, list(tasks.values()))
 
     def post(self, request, *args, **kwargs):
         """
@@ -915,7 +1248,7 @@ class TaskDetail(RetrieveDestroyAPIView):
         if initial_dict is None:
             raise Http404
 
-        return create_task_result_dict(initial_dict)
+        return create_task_result_dict(initial_dict, self.request.session)
 
     def delete(self, request, *args, **kwargs):
         """
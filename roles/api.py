@@ -4,15 +4,151 @@ Functions for handling roles.
 
 from __future__ import unicode_literals
 
-from django.contrib.auth.models import Group, Permission
+from uuid import uuid4
+
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
 from django.db import transaction
-from guardian.shortcuts import assign_perm, get_perms, remove_perm
+from guardian.models import GroupObjectPermission
+from guardian.shortcuts import get_perms, remove_perm
+import six
 
 from roles.permissions import (
     RepoPermission, GroupTypes, BaseGroupTypes, InvalidGroupType
 )
 from roles.user_models import UserGroup
 
+permissions_cache = caches["lore_permissions"]
+
+REPO_PERMS_VERSION_KEY = "repo_perms_version_{repo_id}"
+REPO_PERMS_KEY = "repo_perms_{repo_id}_{version}_{user_id}"
+USER_REPOS_VERSION_KEY = "user_repos_version"
+USER_REPOS_KEY = "user_repos_{version}_{user_id}"
+
+
+def _repo_perms_version(repo_id):
+    """
+    Get the version of the cached permissions of a repository,
+    starting a new version if there is none.
+
+    Args:
+        repo_id (int): Primary key of the repository
+    Returns:
+        unicode: version
+    """
+    key = REPO_PERMS_VERSION_KEY.format(repo_id=repo_id)
+    version = permissions_cache.get(key)
+    if version is None:
+        # A random version, so a version evicted from the cache never
+        # brings back permissions cached under it.
+        permissions_cache.add(key, uuid4().hex, None)
+        version = permissions_cache.get(key)
+    return version
+
+
+def _user_repos_version():
+    """
+    Get the version of the cached repository ids of all users,
+    starting a new version if there is none.
+
+    Returns:
+        unicode: version
+    """
+    version = permissions_cache.get(USER_REPOS_VERSION_KEY)
+    if version is None:
+        permissions_cache.add(USER_REPOS_VERSION_KEY, uuid4().hex, None)
+        version = permissions_cache.get(USER_REPOS_VERSION_KEY)
+    return version
+
+
+def _user_repos_key(user_id):
+    """Cache key of the repository ids a user may access."""
+    return USER_REPOS_KEY.format(
+        version=_user_repos_version(),
+        user_id=user_id,
+    )
+
+
+def get_cached_repo_ids(user_id):
+    """
+    Get the cached ids of the repositories a user may access.
+
+    Args:
+        user_id (int): Primary key of the user
+    Returns:
+        list (list of int): repository ids, or None if they aren't cached
+    """
+    return permissions_cache.get(_user_repos_key(user_id))
+
+
+def set_cached_repo_ids(user_id, repo_ids):
+    """
+    Cache the ids of the repositories a user may access.
+
+    Args:
+        user_id (int): Primary key of the user
+        repo_ids (list of int): repository ids
+    Returns:
+        None
+    """
+    permissions_cache.set(_user_repos_key(user_id), list(repo_ids))
+
+
+def get_repo_perms(user, repo):
+    """
+    Get the permissions of a user on a repository, from the cache if they
+    were loaded before.
+
+    Args:
+        user (django.contrib.auth.models.User): user
+        repo (learningresources.models.Repository): repository
+    Returns:
+        list (list of unicode): permission codenames
+    """
+    if user.pk is None:
+        return get_perms(user, repo)
+    key = REPO_PERMS_KEY.format(
+        repo_id=repo.id,
+        version=_repo_perms_version(repo.id),
+        user_id=user.pk,
+    )
+    perms = permissions_cache.get(key)
+    if perms is None:
+        perms = get_perms(user, repo)
+        permissions_cache.set(key, perms)
+    return perms
+
+
+def invalidate_repo_perms(repo, user=None):
+    """
+    Forget cached permissions on a repository, and the cached
+    repository ids of the users they may affect.
+
+    Args:
+        repo (learningresources.models.Repository): repository
+        user (django.contrib.auth.models.User): if set, only forget the
+            permissions of this user
+    Returns:
+        None
+    """
+    if user is None:
+        permissions_cache.set(
+            REPO_PERMS_VERSION_KEY.format(repo_id=repo.id),
+            uuid4().hex,
+            None
+        )
+        # Repository wide changes may affect any user, superusers see
+        # new repositories without joining them.
+        permissions_cache.set(USER_REPOS_VERSION_KEY, uuid4().hex, None)
+    else:
+        permissions_cache.delete(REPO_PERMS_KEY.format(
+            repo_id=repo.id,
+            version=_repo_perms_version(repo.id),
+            user_id=user.pk,
+        ))
+        permissions_cache.delete(_user_repos_key(user.pk))
+
 
 def roles_init_new_repo(repo):
     """
@@ -29,39 +165,97 @@ def roles_init_new_repo(repo):
     Returns:
         None
     """
-    with transaction.atomic():
-        administrator_group, _ = Group.objects.get_or_create(
-            name=GroupTypes.REPO_ADMINISTRATOR.format(repo.slug)
-        )
-        curator_group, _ = Group.objects.get_or_create(
-            name=GroupTypes.REPO_CURATOR.format(repo.slug)
-        )
-        author_group, _ = Group.objects.get_or_create(
-            name=GroupTypes.REPO_AUTHOR.format(repo.slug)
-        )
+    roles_init_new_repos([repo])
+
+
+def roles_init_new_repos(repos):
+    """
+    Create the groups of many repositories and assign permissions to them,
+    with the same number of queries however many repositories there are.
+
+    Args:
+        repos (list of learningresources.models.Repository): repositories
+            used to create groups and assign permissions to them
+    Returns:
+        None
+    """
+    repos = list(repos)
+    if len(repos) == 0:
+        return
+    group_permissions = (
+        (GroupTypes.REPO_ADMINISTRATOR,
+         RepoPermission.administrator_permissions()),
+        (GroupTypes.REPO_CURATOR, RepoPermission.curator_permissions()),
+        (GroupTypes.REPO_AUTHOR, RepoPermission.author_permissions()),
+    )
+    content_type = ContentType.objects.get_for_model(repos[0])
+    group_names = [
+        group_type.format(repo.slug)
+        for repo in repos
+        for group_type, _ in group_permissions
+    ]
 
     with transaction.atomic():
-        # administrator permissions
-        for permission in RepoPermission.administrator_permissions():
-            try:
-                Permission.objects.get(codename=permission)
-                assign_perm(permission, administrator_group, repo)
-            except Permission.DoesNotExist:
-                pass
-        # curator permissions
-        for permission in RepoPermission.curator_permissions():
-            try:
-                Permission.objects.get(codename=permission)
-                assign_perm(permission, curator_group, repo)
-            except Permission.DoesNotExist:
-                pass
-        # author permissions
-        for permission in RepoPermission.author_permissions():
-            try:
-                Permission.objects.get(codename=permission)
-                assign_perm(permission, author_group, repo)
-            except Permission.DoesNotExist:
-                pass
+        existing_names = set(Group.objects.filter(
+            name__in=group_names).values_list('name', flat=True))
+        Group.objects.bulk_create([
+            Group(name=name) for name in sorted(set(group_names))
+            if name not in existing_names
+        ])
+        group_ids = dict(Group.objects.filter(
+            name__in=group_names).values_list('name', 'id'))
+        permission_ids = dict(Permission.objects.filter(
+            content_type=content_type,
+            codename__in=set(
+                codename
+                for _, codenames in group_permissions
+                for codename in codenames
+            ),
+        ).values_list('codename', 'id'))
+        # Permissions which don't exist at all are skipped, but one which
+        # exists for another model is a mistake, as it was for assign_perm.
+        other_model = Permission.objects.filter(
+            codename__in=set(
+                codename
+                for _, codenames in group_permissions
+                for codename in codenames
+                if codename not in permission_ids
+            ),
+        ).values_list('codename', flat=True)
+        if len(other_model) > 0:
+            raise Permission.DoesNotExist(
+                "Permissions {codenames} don't exist for {model}".format(
+                    codenames=", ".join(sorted(set(other_model))),
+                    model=content_type.model,
+                )
+            )
+
+        wanted = set()
+        for repo in repos:
+            for group_type, codenames in group_permissions:
+                for codename in codenames:
+                    if codename in permission_ids:
+                        wanted.add((
+                            group_ids[group_type.format(repo.slug)],
+                            permission_ids[codename],
+                            six.text_type(repo.id),
+                        ))
+        existing = set(GroupObjectPermission.objects.filter(
+            content_type=content_type,
+            object_pk__in=[six.text_type(repo.id) for repo in repos],
+            group_id__in=list(group_ids.values()),
+        ).values_list('group_id', 'permission_id', 'object_pk'))
+        GroupObjectPermission.objects.bulk_create([
+            GroupObjectPermission(
+                group_id=group_id,
+                permission_id=permission_id,
+                content_type=content_type,
+                object_pk=object_pk,
+            )
+            for group_id, permission_id, object_pk in sorted(wanted - existing)
+        ])
+    for repo in repos:
+        invalidate_repo_perms(repo)
 
 
 def roles_clear_repo_permissions(repo):
@@ -87,6 +281,7 @@ def roles_clear_repo_permissions(repo):
             perms = get_perms(group, repo)
             for perm in perms:
                 remove_perm(perm, group, repo)
+    invalidate_repo_perms(repo)
 
 
 def roles_update_repo(repo, old_slug):
@@ -121,6 +316,7 @@ def roles_update_repo(repo, old_slug):
         administrator_group.save()
         curator_group.save()
         author_group.save()
+    invalidate_repo_perms(repo)
 
 
 def assign_user_to_repo_group(
@@ -143,6 +339,31 @@ def assign_user_to_repo_group(
         repo_group = Group.objects.get(name=group_type.format(repo.slug))
         user.groups.add(repo_group)
         user.save()
+    invalidate_repo_perms(repo, user)
+
+
+def assign_user_to_repos_group(
+        user,
+        repos,
+        group_type):
+    """
+    Assign an user to the group type of many repositories at once.
+
+    Args:
+        user (django.contrib.auth.models.User): user
+        repos (list of learningresources.models.Repository): repositories
+            used to extract the right groups to use
+        group_type (roles.permissions.GroupTypes): group string to be used to
+            construct the group names
+    Returns:
+        None
+    """
+    repos = list(repos)
+    with transaction.atomic():
+        user.groups.add(*Group.objects.filter(
+            name__in=[group_type.format(repo.slug) for repo in repos]))
+    for repo in repos:
+        invalidate_repo_perms(repo, user)
 
 
 def remove_user_from_repo_group(
@@ -165,40 +386,69 @@ def remove_user_from_repo_group(
         repo_group = Group.objects.get(name=group_type.format(repo.slug))
         user.groups.remove(repo_group)
         user.save()
+    invalidate_repo_perms(repo, user)
+
+
+def _repo_group_names(repo, base_group_types):
+    """
+    Map the names of repository groups to their base group types.
+
+    Args:
+        repo (learningresources.models.Repository): repository
+        base_group_types (list of unicode): group types from
+            roles.permissions.BaseGroupTypes
+    Returns:
+        dict: group name mapped to base group type
+    """
+    return dict(
+        (
+            GroupTypes.get_repo_groupname_by_base(
+                base_group_type).format(repo.slug),
+            base_group_type
+        )
+        for base_group_type in base_group_types
+    )
 
 
-def list_users_in_repo(repo, base_group_type=None):
+def list_users_in_repo(repo, base_group_type=None, username=None):
     """
     List all the users in the repository groups.
     If the group type is specified, the list is limited to that group.
+    If the username is specified, the list is limited to that user.
+    Memberships are read with one query.
 
     Args:
         repo (learningresources.models.Repository): repository used to extract
             the right group to use
         base_group_type (unicode): group type from
             roles.permissions.BaseGroupTypes
+        username (unicode): username of a user
     Returns:
         list (list of roles.user_models.UserGroup): list of users in one or
         all the repository groups
     """
-    users_groups = []
     if base_group_type is not None:
         if not BaseGroupTypes.is_base_group_type(base_group_type):
             raise InvalidGroupType
         base_group_types = [base_group_type]
     else:
         base_group_types = BaseGroupTypes.all_base_groups()
-    for base_group_type in base_group_types:
-        group = Group.objects.get(
-            name=GroupTypes.get_repo_groupname_by_base(
-                base_group_type
-            ).format(repo.slug)
-        )
-        users_groups += [
-            UserGroup(user.username, base_group_type)
-            for user in group.user_set.all()
-        ]
-    return users_groups
+    group_names = _repo_group_names(repo, base_group_types)
+
+    memberships = User.groups.through.objects.filter(
+        group__name__in=list(group_names)
+    )
+    if username is not None:
+        memberships = memberships.filter(user__username=username)
+    order = BaseGroupTypes.all_base_groups()
+    rows = sorted(
+        memberships.values_list('group__name', 'user_id', 'user__username'),
+        key=lambda row: (order.index(group_names[row[0]]), row[1])
+    )
+    return [
+        UserGroup(member_username, group_names[group_name])
+        for group_name, _, member_username in rows
+    ]
 
 
 def is_last_admin_in_repo(user, repo):
@@ -214,13 +464,8 @@ def is_last_admin_in_repo(user, repo):
     Returns:
         bool
     """
-    admins_in_repo = list_users_in_repo(
-        repo,
-        base_group_type=BaseGroupTypes.ADMINISTRATORS
-    )
-    return (
-        UserGroup(
-            user.username,
-            BaseGroupTypes.ADMINISTRATORS
-        ) in admins_in_repo
-    ) and len(admins_in_repo) == 1
+    # Two administrators are enough to know the user isn't the last one.
+    admin_ids = list(User.groups.through.objects.filter(
+        group__name=GroupTypes.REPO_ADMINISTRATOR.format(repo.slug)
+    ).values_list('user_id', flat=True)[:2])
+    return admin_ids == [user.id]
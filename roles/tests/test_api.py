@@ -4,7 +4,7 @@ Test the roles APIs
 
 from __future__ import unicode_literals
 
-from django.contrib.auth.models import Group
+from django.contrib.auth.models import Group, Permission
 from django.utils.text import slugify
 from guardian.core import ObjectPermissionChecker
 from guardian.shortcuts import get_perms
@@ -92,6 +92,37 @@ class TestRoleApi(LoreTestCase):
             sorted(RepoPermission.author_permissions())
         )
 
+    def test_roles_init_new_repos(self):
+        """
+        Groups and permissions of many repositories, set up twice
+        """
+        repos = [self.repo, Repository.objects.create(
+            name=self.repo_name,
+            description=self.repo_desc,
+            created_by=self.user
+        )]
+        api.roles_clear_repo_permissions(self.repo)
+        Group.objects.filter(name__in=[
+            self.group_curator, self.group_author]).delete()
+        for _ in range(2):
+            api.roles_init_new_repos(repos)
+            for repo in repos:
+                for group_type, perms in (
+                        (GroupTypes.REPO_ADMINISTRATOR,
+                         RepoPermission.administrator_permissions()),
+                        (GroupTypes.REPO_CURATOR,
+                         RepoPermission.curator_permissions()),
+                        (GroupTypes.REPO_AUTHOR,
+                         RepoPermission.author_permissions())):
+                    group = Group.objects.get(
+                        name=group_type.format(repo.slug))
+                    self.assertListEqual(
+                        sorted(get_perms(group, repo)), sorted(perms))
+        self.assertEqual(
+            sorted(api.get_repo_perms(self.user, self.repo)),
+            sorted(RepoPermission.administrator_permissions())
+        )
+
     def test_roles_init_new_repo_fake_permission_curator(self):
         """
         Non existing permissions for curator
@@ -128,6 +159,20 @@ class TestRoleApi(LoreTestCase):
                 []
             )
 
+    def test_roles_init_new_repo_other_model_permission(self):
+        """
+        Permissions of another model are not silently skipped
+        """
+        with patch.object(api.RepoPermission,
+                          'author_permissions') as mock_method:
+            mock_method.return_value = ['add_user']
+            with self.assertRaises(Permission.DoesNotExist):
+                create_repo(
+                    name=self.repo_name,
+                    description=self.repo_desc,
+                    user_id=self.user.id,
+                )
+
     def test_roles_update_repo_1(self):
         """
         Test update repo name
@@ -247,6 +292,58 @@ class TestRoleApi(LoreTestCase):
             []
         )
 
+    def test_repo_perms_cache(self):
+        """
+        Test that get_repo_perms caches permissions until roles change
+        """
+        admin_perms = sorted(RepoPermission.administrator_permissions())
+        with patch.object(api, 'get_perms', wraps=get_perms) as mock_perms:
+            for _ in range(3):
+                self.assertEqual(
+                    sorted(api.get_repo_perms(self.user, self.repo)),
+                    admin_perms
+                )
+            self.assertEqual(mock_perms.call_count, 1)
+            with self.assertNumQueries(0):
+                api.get_repo_perms(self.user, self.repo)
+
+            # Other users are cached separately.
+            self.assertEqual(
+                api.get_repo_perms(self.user_norepo, self.repo), [])
+            self.assertEqual(mock_perms.call_count, 2)
+
+            api.assign_user_to_repo_group(
+                self.user_norepo, self.repo, GroupTypes.REPO_AUTHOR)
+            self.assertEqual(
+                sorted(api.get_repo_perms(self.user_norepo, self.repo)),
+                sorted(RepoPermission.author_permissions())
+            )
+            api.remove_user_from_repo_group(
+                self.user_norepo, self.repo, GroupTypes.REPO_AUTHOR)
+            self.assertEqual(
+                api.get_repo_perms(self.user_norepo, self.repo), [])
+            # Changing one user's roles keeps the cache of other users.
+            self.assertEqual(mock_perms.call_count, 4)
+            api.get_repo_perms(self.user, self.repo)
+            self.assertEqual(mock_perms.call_count, 4)
+
+            api.roles_clear_repo_permissions(self.repo)
+            self.assertEqual(api.get_repo_perms(self.user, self.repo), [])
+
+    def test_repo_perms_cache_eviction(self):
+        """
+        Test that losing the version of a repository from the cache
+        doesn't bring back permissions cached before
+        """
+        api.get_repo_perms(self.user, self.repo)
+        version_key = api.REPO_PERMS_VERSION_KEY.format(repo_id=self.repo.id)
+        old_version = api.permissions_cache.get(version_key)
+        api.roles_clear_repo_permissions(self.repo)
+        api.permissions_cache.delete(version_key)
+        self.assertEqual(api.get_repo_perms(self.user, self.repo), [])
+        self.assertNotEqual(
+            api.permissions_cache.get(version_key), old_version)
+
     def test_list_users_in_repo_no_base_group_type_specified(self):
         """
         Test for list_users_in_repo
@@ -384,6 +481,53 @@ class TestRoleApi(LoreTestCase):
             []
         )
 
+    def test_list_users_in_repo_username_specified(self):
+        """
+        Test for list_users_in_repo limited to one user
+        """
+        api.assign_user_to_repo_group(
+            self.user,
+            self.repo,
+            GroupTypes.REPO_AUTHOR
+        )
+        api.assign_user_to_repo_group(
+            self.user_norepo,
+            self.repo,
+            GroupTypes.REPO_CURATOR
+        )
+        with self.assertNumQueries(1):
+            self.assertListEqual(
+                api.list_users_in_repo(self.repo),
+                [
+                    UserGroup(
+                        self.user.username,
+                        BaseGroupTypes.ADMINISTRATORS
+                    ),
+                    UserGroup(
+                        self.user_norepo.username,
+                        BaseGroupTypes.CURATORS
+                    ),
+                    UserGroup(self.user.username, BaseGroupTypes.AUTHORS),
+                ]
+            )
+        with self.assertNumQueries(1):
+            self.assertListEqual(
+                api.list_users_in_repo(
+                    self.repo, username=self.user.username),
+                [
+                    UserGroup(
+                        self.user.username,
+                        BaseGroupTypes.ADMINISTRATORS
+                    ),
+                    UserGroup(self.user.username, BaseGroupTypes.AUTHORS),
+                ]
+            )
+        self.assertListEqual(
+            api.list_users_in_repo(
+                self.repo, BaseGroupTypes.CURATORS, self.user.username),
+            []
+        )
+
     def test_list_users_in_repo_invalid_group_type_specified(self):
         """
         Test for list_users_in_repo
@@ -398,9 +542,10 @@ class TestRoleApi(LoreTestCase):
         Test for is_last_admin_in_repo
         """
         # By default the repo creator is also administrator
-        self.assertTrue(
-            api.is_last_admin_in_repo(self.user, self.repo)
-        )
+        with self.assertNumQueries(1):
+            self.assertTrue(
+                api.is_last_admin_in_repo(self.user, self.repo)
+            )
         # Add another user to the administrators.
         api.assign_user_to_repo_group(
             self.user_norepo,
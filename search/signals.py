@@ -6,7 +6,9 @@ in settings.py handles the save of a LearningResource, but not
 many-to-many fields.
 """
 
+from contextlib import contextmanager
 import logging
+import threading
 
 from django.db.models.signals import m2m_changed, post_save, post_delete
 from django.dispatch import receiver
@@ -14,6 +16,28 @@ from statsd.defaults.django import statsd
 
 log = logging.getLogger(__name__)
 
+_state = threading.local()
+
+
+@contextmanager
+def suppress_index_signals():
+    """
+    Skip per-instance index updates for LearningResources saved or deleted
+    in this thread inside the block. The caller is responsible for updating
+    the index afterwards, usually in bulk.
+    """
+    previous = getattr(_state, "suppressed", False)
+    _state.suppressed = True
+    try:
+        yield
+    finally:
+        _state.suppressed = previous
+
+
+def _index_signals_suppressed():
+    """Return True if index updates are suppressed for this thread."""
+    return getattr(_state, "suppressed", False)
+
 
 # pylint: disable=unused-argument
 @statsd.timer('lore.haystack.taxonomy_update')
@@ -24,6 +48,8 @@ def handle_m2m_save(sender, **kwargs):
     instance = kwargs.pop("instance")
     if instance.__class__.__name__ != "LearningResource":
         return
+    if _index_signals_suppressed():
+        return
     # Update cache for the LearningResource if it's already set.
     get_vocabs(instance.id)
     # Update Elasticsearch index:
@@ -42,6 +68,8 @@ def handle_resource_update(sender, **kwargs):
     instance = kwargs.pop("instance")
     if instance.__class__.__name__ != "LearningResource":
         return
+    if _index_signals_suppressed():
+        return
     from search.utils import index_resources
     index_resources([instance.id])
 
@@ -55,5 +83,7 @@ def handle_resource_deletion(sender, **kwargs):
     instance = kwargs.pop("instance")
     if instance.__class__.__name__ != "LearningResource":
         return
+    if _index_signals_suppressed():
+        return
     from search.utils import delete_resource_from_index
     delete_resource_from_index(instance)
@@ -27,3 +27,13 @@ def index_resources(resource_ids):
     """
     from search.utils import index_resources as _index_resources
     _index_resources(resource_ids)
+
+
+@async.task
+@statsd.timer('lore.search.tasks.update_index_fields')
+def update_index_fields(resource_ids, fields):
+    """
+    Update some fields of the given resources in the index.
+    """
+    from search.utils import update_index_fields as _update_index_fields
+    _update_index_fields(resource_ids, fields)
@@ -262,6 +262,53 @@ def index_resources(resource_ids, chunk_size=100):
     refresh_index()
 
 
+@statsd.timer('lore.elasticsearch.bulk_update_fields')
+def update_index_fields(resource_ids, fields, chunk_size=1000):
+    """
+    Copy some fields of LearningResources from the database to their
+    search index records without rebuilding the whole records.
+
+    Args:
+        resource_ids (iterable of int): Primary keys of LearningResources
+        fields (iterable of unicode): Names of LearningResource fields
+        chunk_size (int): Number of records loaded and sent at a time
+    Raises:
+        ReindexException: Elasticsearch failed to update a record
+    """
+    conn = get_conn()
+    fields = list(fields)
+    resource_ids = iter(resource_ids)
+    chunk = list(islice(resource_ids, chunk_size))
+    while len(chunk) > 0:
+        rows = LearningResource.objects.filter(
+            id__in=chunk).values('id', *fields)
+        _, errors = bulk(
+            conn,
+            (
+                {
+                    "_op_type": "update",
+                    "_index": INDEX_NAME,
+                    "_type": DOC_TYPE,
+                    "_id": row.pop("id"),
+                    "doc": row,
+                }
+                for row in rows
+            ),
+            raise_on_error=False,
+        )
+        # Records missing from the index get these fields when indexed.
+        errors = [
+            error for error in errors
+            if error.get("update", {}).get("status") != 404
+        ]
+        if errors != []:
+            raise ReindexException("Error during bulk update: {errors}".format(
+                errors=errors
+            ))
+        chunk = list(islice(resource_ids, chunk_size))
+    refresh_index()
+
+
 @statsd.timer('lore.elasticsearch.delete_index')
 def delete_resource_from_index(resource):
     """Delete a record from Elasticsearch."""
@@ -276,6 +323,42 @@ def delete_resource_from_index(resource):
         pass
 
 
+@statsd.timer('lore.elasticsearch.bulk_delete_index')
+def delete_resources_from_index(resource_ids):
+    """
+    Delete many records from Elasticsearch in one bulk operation.
+
+    Args:
+        resource_ids (iterable of int): Primary keys of LearningResources
+    Raises:
+        ReindexException: Elasticsearch failed to delete a record
+    """
+    conn = get_conn()
+    _, errors = bulk(
+        conn,
+        (
+            {
+                "_op_type": "delete",
+                "_index": INDEX_NAME,
+                "_type": DOC_TYPE,
+                "_id": resource_id,
+            }
+            for resource_id in resource_ids
+        ),
+        raise_on_error=False,
+    )
+    # Records missing from the index are already in the desired state.
+    errors = [
+        error for error in errors
+        if error.get("delete", {}).get("status") != 404
+    ]
+    if errors != []:
+        raise ReindexException("Error during bulk delete: {errors}".format(
+            errors=errors
+        ))
+    refresh_index()
+
+
 def resource_to_dict(resource, term_info):
     """
     Retrieve important values from a LearningResource to index.
@@ -410,6 +493,11 @@ class SearchResults(object):
             for hit in self.get_page(i+1):
                 yield hit
 
+    def all_ids(self):
+        """Return ids of all results in a generator, without paging."""
+        for hit in self._search.fields(['id']).scan():
+            yield int(hit.meta.id)
+
     def aggregations(self):
         """Return aggregations."""
         if self._cached_agg is None:
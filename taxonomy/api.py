@@ -1,6 +1,15 @@
 """APIs for lore taxonomy application"""
 from __future__ import unicode_literals
 
+from collections import defaultdict
+import logging
+from itertools import islice  # pylint: disable=no-name-in-module
+import json
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+import six
+
 from taxonomy.models import (
     Vocabulary,
     Term,
@@ -9,6 +18,22 @@ from learningresources.api import (
     get_repo,
     NotFound,
 )
+from learningresources.models import LearningResource, LearningResourceType
+from rest.util import bulk_slugify, csv_rows, slugs_with_prefixes
+from search.tasks import index_resources
+from xanalytics.rollups import refresh_term_rollups
+
+log = logging.getLogger(__name__)
+
+# Number of LearningResources validated and written per batch.
+BULK_TERMS_CHUNK_SIZE = 500
+# Number of Terms inserted per INSERT by import_taxonomy.
+IMPORT_TERMS_CHUNK_SIZE = 1000
+# Number of times import_taxonomy is attempted when a concurrent import
+# takes the same slugs.
+IMPORT_ATTEMPTS = 3
+# Longest vocabulary name or term label.
+MAX_LABEL_LENGTH = 256
 
 
 def get_vocabulary(repo_slug, user_id, vocab_slug):
@@ -52,3 +77,441 @@ def get_term(repo_slug, user_id, vocab_slug, term_slug):
         raise NotFound()
     except Term.DoesNotExist:
         raise NotFound()
+
+
+def capped_terms(vocabularies, limit):
+    """
+    Load at most ``limit`` terms per vocabulary, ordered by id, into the
+    ``capped_terms`` attribute of each vocabulary, so that large
+    vocabularies can be listed without loading all of their terms.
+
+    Each vocabulary gets its own LIMITed select, all sent as one query.
+
+    Args:
+        vocabularies (iterable of taxonomy.models.Vocabulary): Vocabularies
+        limit (int): Maximum number of terms per vocabulary
+    Returns:
+        list of taxonomy.models.Vocabulary: The vocabularies
+    """
+    vocabularies = list(vocabularies)
+    by_id = {}
+    for vocabulary in vocabularies:
+        vocabulary.capped_terms = []
+        by_id[vocabulary.id] = vocabulary
+    if len(by_id) == 0:
+        return vocabularies
+
+    quote = connection.ops.quote_name
+    table = quote(Term._meta.db_table)  # pylint: disable=protected-access
+    select = (
+        "SELECT * FROM (SELECT * FROM {table} WHERE vocabulary_id = %s "
+        "ORDER BY id LIMIT %s) AS capped{index}"
+    )
+    vocab_ids = sorted(by_id)
+    sql = " UNION ALL ".join(
+        select.format(table=table, index=index)
+        for index in range(len(vocab_ids))
+    )
+    params = []
+    for vocab_id in vocab_ids:
+        params.extend([vocab_id, limit])
+    for term in Term.objects.raw(sql, params):
+        by_id[term.vocabulary_id].capped_terms.append(term)
+    for vocabulary in vocabularies:
+        vocabulary.capped_terms.sort(key=lambda term: term.id)
+    return vocabularies
+
+
+def _supported_types(vocab_ids):
+    """
+    Load which LearningResourceTypes each vocabulary supports.
+
+    Args:
+        vocab_ids (iterable of int): Vocabulary ids
+    Returns:
+        dict: Vocabulary id mapped to a set of LearningResourceType ids
+    """
+    supported = defaultdict(set)
+    rels = Vocabulary.learning_resource_types.through.objects.filter(
+        vocabulary__id__in=vocab_ids
+    ).values_list("vocabulary_id", "learningresourcetype_id")
+    for vocab_id, type_id in rels:
+        supported[vocab_id].add(type_id)
+    return supported
+
+
+# pylint: disable=too-many-locals
+def update_resource_terms(repo, resource_ids, add_slugs=(), remove_slugs=()):
+    """
+    Add and remove terms on many LearningResources at once.
+
+    Vocabularies which don't allow multiple terms keep only the added
+    term, replacing any other term of that vocabulary on the resources.
+    All LearningResources are validated before anything is saved and
+    the touched resources are reindexed as one batch.
+
+    Args:
+        repo (learningresources.models.Repository): Repository which owns
+            both the LearningResources and the terms
+        resource_ids (iterable of int): Primary keys of LearningResources
+        add_slugs (iterable of unicode): Slugs of terms to assign
+        remove_slugs (iterable of unicode): Slugs of terms to unassign
+    Raises:
+        ValueError: Unknown term or LearningResource, or a term not
+            supported for a LearningResource
+    Returns:
+        list of int: Primary keys of updated LearningResources
+    """
+    add_slugs = set(add_slugs)
+    remove_slugs = set(remove_slugs)
+    if add_slugs & remove_slugs:
+        raise ValueError("Terms cannot be both added and removed")
+
+    terms = dict(
+        (term.slug, term) for term in Term.objects.select_related(
+            "vocabulary"
+        ).filter(
+            vocabulary__repository__id=repo.id,
+            slug__in=add_slugs | remove_slugs,
+        )
+    )
+    missing = (add_slugs | remove_slugs) - set(terms.keys())
+    if missing:
+        raise ValueError("Unknown terms: {slugs}".format(
+            slugs=", ".join(sorted(missing))
+        ))
+    add_terms = [terms[slug] for slug in add_slugs]
+    add_term_ids = [term.id for term in add_terms]
+    remove_term_ids = [terms[slug].id for slug in remove_slugs]
+
+    single_vocab_ids = set()
+    for term in add_terms:
+        if term.vocabulary.multi_terms:
+            continue
+        if term.vocabulary_id in single_vocab_ids:
+            raise ValueError(
+                "Vocabulary {0} can have only one term "
+                "assigned to the same LearningResource".format(
+                    term.vocabulary.name
+                )
+            )
+        single_vocab_ids.add(term.vocabulary_id)
+    supported_types = _supported_types(
+        set(term.vocabulary_id for term in add_terms))
+
+    remove_query = Q(term__id__in=remove_term_ids)
+    if single_vocab_ids:
+        remove_query |= (
+            Q(term__vocabulary__id__in=single_vocab_ids) &
+            ~Q(term__id__in=add_term_ids)
+        )
+
+    through = Term.learning_resources.through
+    resource_ids = iter(resource_ids)
+    updated_ids = []
+    changed_term_ids = set(add_term_ids)
+    with transaction.atomic():
+        chunk = set(islice(resource_ids, BULK_TERMS_CHUNK_SIZE))
+        while len(chunk) > 0:
+            resource_types = dict(LearningResource.objects.filter(
+                course__repository__id=repo.id,
+                id__in=chunk,
+            ).values_list("id", "learning_resource_type_id"))
+            if len(resource_types) != len(chunk):
+                raise ValueError("Unknown LearningResources: {ids}".format(
+                    ids=", ".join(
+                        str(x) for x in sorted(chunk - set(resource_types)))
+                ))
+            for resource_id, type_id in resource_types.items():
+                for term in add_terms:
+                    if type_id not in supported_types[term.vocabulary_id]:
+                        raise ValueError(
+                            "Term {label} is not supported for "
+                            "LearningResource {id}".format(
+                                label=term.label, id=resource_id
+                            )
+                        )
+
+            removed = through.objects.filter(
+                remove_query, learningresource__id__in=chunk)
+            changed_term_ids.update(removed.values_list("term_id", flat=True))
+            removed.delete()
+            existing = set(through.objects.filter(
+                learningresource__id__in=chunk,
+                term__id__in=add_term_ids,
+            ).values_list("learningresource_id", "term_id"))
+            through.objects.bulk_create([
+                through(learningresource_id=resource_id, term_id=term_id)
+                for resource_id in chunk
+                for term_id in add_term_ids
+                if (resource_id, term_id) not in existing
+            ])
+            updated_ids.extend(chunk)
+            chunk = set(islice(resource_ids, BULK_TERMS_CHUNK_SIZE))
+
+    if len(updated_ids) > 0:
+        index_resources.delay(updated_ids)
+        refresh_term_rollups(repo.id, changed_term_ids)
+    return updated_ids
+
+
+def _check_label(label, kind):
+    """
+    Validate a vocabulary name or term label.
+
+    Args:
+        label (object): Value from the import
+        kind (unicode): What the label is for, used in errors
+    Raises:
+        ValueError: Not a valid label
+    Returns:
+        unicode: The label
+    """
+    if not isinstance(label, six.string_types) or label.strip() == "":
+        raise ValueError("Missing {kind}".format(kind=kind))
+    if len(label) > MAX_LABEL_LENGTH:
+        raise ValueError("{kind} {label} is too long".format(
+            kind=kind.capitalize(), label=label[:MAX_LABEL_LENGTH]))
+    return label
+
+
+def _check_int(value, kind):
+    """
+    Validate a weight.
+
+    Args:
+        value (object): Value from the import
+        kind (unicode): What the value is for, used in errors
+    Raises:
+        ValueError: Not an integer
+    Returns:
+        int: The value
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError("{kind} is not a number".format(kind=kind))
+
+
+def parse_taxonomy_json(text):
+    """
+    Parse a JSON taxonomy import.
+
+    The JSON is either a list of vocabularies or an object with the list
+    as `vocabularies`.
+
+    Args:
+        text (unicode): JSON
+    Raises:
+        ValueError: Invalid JSON
+    Returns:
+        list of dict: Vocabularies for import_taxonomy
+    """
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("vocabularies")
+    if not isinstance(data, list):
+        raise ValueError("Missing vocabularies")
+    return data
+
+
+def parse_taxonomy_csv(text):
+    """
+    Parse a CSV taxonomy import.
+
+    The first row names the columns: `vocabulary` and `label` are required,
+    `weight` is optional. Each other row is one term.
+
+    Args:
+        text (unicode): CSV
+    Raises:
+        ValueError: Missing columns
+    Returns:
+        list of dict: Vocabularies for import_taxonomy
+    """
+    rows = csv_rows(text)
+    try:
+        header = [name.strip().lower() for name in next(rows)]
+    except StopIteration:
+        raise ValueError("Missing header row")
+    if "vocabulary" not in header or "label" not in header:
+        raise ValueError("Missing vocabulary or label column")
+
+    vocabularies = []
+    by_name = {}
+    for row in rows:
+        if not any(cell.strip() for cell in row):
+            continue
+        values = dict(zip(header, row))
+        name = values.get("vocabulary", "")
+        if name not in by_name:
+            by_name[name] = {"name": name, "terms": []}
+            vocabularies.append(by_name[name])
+        term = {"label": values.get("label", "")}
+        if values.get("weight", "") != "":
+            term["weight"] = values["weight"]
+        by_name[name]["terms"].append(term)
+    return vocabularies
+
+
+# pylint: disable=too-many-locals,too-many-branches
+def import_taxonomy(repo, vocabularies):
+    """
+    Create many vocabularies and terms in a repository at once.
+
+    Vocabularies are matched by name, existing vocabularies keep their
+    settings and only get the terms they don't have yet. Slugs for the
+    whole import are allocated with one query per model and rows are
+    inserted in bulk. Nothing is saved unless the whole import is valid.
+
+    Args:
+        repo (learningresources.models.Repository): Repository to import to
+        vocabularies (list of dict): Vocabularies with `name` and
+            optionally `description`, `vocabulary_type`, `required`,
+            `weight`, `multi_terms`, `learning_resource_types` (names) and
+            `terms`, a list of labels or of dicts with `label` and
+            optionally `weight`
+    Raises:
+        ValueError: Invalid vocabulary or term
+        django.db.IntegrityError: Slugs were still taken concurrently
+            after the last attempt
+    Returns:
+        dict: Numbers of vocabularies created, terms created and terms
+            skipped because they already existed
+    """
+    specs = []
+    type_names = set()
+    for vocab in vocabularies:
+        if not isinstance(vocab, dict):
+            raise ValueError("Vocabularies must be objects")
+        spec = {
+            "name": _check_label(vocab.get("name"), "vocabulary name"),
+            "description": vocab.get("description", ""),
+            "vocabulary_type": vocab.get(
+                "vocabulary_type", Vocabulary.MANAGED),
+            "required": bool(vocab.get("required", False)),
+            "weight": _check_int(vocab.get("weight", 1), "Vocabulary weight"),
+            "multi_terms": bool(vocab.get("multi_terms", False)),
+            "learning_resource_types": vocab.get(
+                "learning_resource_types", []),
+            "terms": [],
+        }
+        if spec["vocabulary_type"] not in (
+                Vocabulary.MANAGED, Vocabulary.FREE_TAGGING):
+            raise ValueError("Unknown vocabulary type {type}".format(
+                type=spec["vocabulary_type"]))
+        if not isinstance(spec["learning_resource_types"], list):
+            raise ValueError("learning_resource_types must be a list")
+        type_names.update(spec["learning_resource_types"])
+        for term in vocab.get("terms", []):
+            if not isinstance(term, dict):
+                term = {"label": term}
+            spec["terms"].append((
+                _check_label(term.get("label"), "term label"),
+                _check_int(term.get("weight", 1), "Term weight"),
+            ))
+        specs.append(spec)
+
+    types = dict(LearningResourceType.objects.filter(
+        name__in=type_names).values_list('name', 'id'))
+    missing = type_names - set(types)
+    if missing:
+        raise ValueError("Unknown learning resource types: {names}".format(
+            names=", ".join(sorted(missing))))
+
+    for attempt in range(IMPORT_ATTEMPTS):
+        try:
+            return _import_specs(repo, specs, types)
+        except IntegrityError:
+            # A concurrent import took some of the slugs, allocate again.
+            if attempt == IMPORT_ATTEMPTS - 1:
+                raise
+            log.info(
+                "Retrying taxonomy import to repository %s", repo.slug)
+
+
+def _import_specs(repo, specs, types):
+    """
+    Save the validated vocabularies and terms of import_taxonomy
+    in one transaction.
+
+    Args:
+        repo (learningresources.models.Repository): Repository to import to
+        specs (list of dict): Validated vocabularies
+        types (dict): LearningResourceType ids by name
+    Raises:
+        django.db.IntegrityError: Slugs were taken concurrently
+    Returns:
+        dict: Numbers of vocabularies created, terms created and terms
+            skipped because they already existed
+    """
+    with transaction.atomic():
+        existing = dict(
+            (vocab.name, vocab) for vocab in repo.vocabulary_set.all())
+        new_specs = []
+        new_names = set()
+        for spec in specs:
+            if spec["name"] not in existing and spec["name"] not in new_names:
+                new_names.add(spec["name"])
+                new_specs.append(spec)
+        slugs = bulk_slugify(
+            [spec["name"] for spec in new_specs],
+            Vocabulary._meta.model_name,  # pylint: disable=protected-access
+            slugs_with_prefixes(Vocabulary),
+        )
+        Vocabulary.objects.bulk_create([
+            Vocabulary(
+                repository=repo,
+                slug=slug,
+                name=spec["name"],
+                description=spec["description"],
+                vocabulary_type=spec["vocabulary_type"],
+                required=spec["required"],
+                weight=spec["weight"],
+                multi_terms=spec["multi_terms"],
+            )
+            for spec, slug in zip(new_specs, slugs)
+        ])
+        # bulk_create doesn't set primary keys, read them back by slug.
+        for vocab in Vocabulary.objects.filter(slug__in=slugs):
+            existing[vocab.name] = vocab
+        through = Vocabulary.learning_resource_types.through
+        through.objects.bulk_create([
+            through(
+                vocabulary_id=existing[spec["name"]].id,
+                learningresourcetype_id=types[name],
+            )
+            for spec in new_specs
+            for name in set(spec["learning_resource_types"])
+        ])
+
+        vocab_ids = set(vocab.id for vocab in existing.values())
+        seen = set(Term.objects.filter(
+            vocabulary__id__in=vocab_ids
+        ).values_list('vocabulary_id', 'label'))
+        new_terms = []
+        skipped = 0
+        for spec in specs:
+            vocab_id = existing[spec["name"]].id
+            for label, weight in spec["terms"]:
+                if (vocab_id, label) in seen:
+                    skipped += 1
+                    continue
+                seen.add((vocab_id, label))
+                new_terms.append(
+                    Term(vocabulary_id=vocab_id, label=label, weight=weight))
+        slugs = bulk_slugify(
+            [term.label for term in new_terms],
+            Term._meta.model_name,  # pylint: disable=protected-access
+            slugs_with_prefixes(Term),
+        )
+        for term, slug in zip(new_terms, slugs):
+            term.slug = slug
+        Term.objects.bulk_create(
+            new_terms, batch_size=IMPORT_TERMS_CHUNK_SIZE)
+
+    return {
+        "vocabularies_created": len(new_specs),
+        "terms_created": len(new_terms),
+        "terms_skipped": skipped,
+    }
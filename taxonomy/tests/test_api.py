@@ -5,6 +5,9 @@ from __future__ import unicode_literals
 
 # pylint: disable=too-many-instance-attributes
 
+from django.db import IntegrityError
+from mock import patch
+
 from learningresources.tests.base import LoreTestCase
 from learningresources.api import (
     NotFound,
@@ -16,9 +19,15 @@ from learningresources.models import (
     Course,
 )
 
+from rest.util import bulk_slugify
 from taxonomy.api import (
+    IMPORT_ATTEMPTS,
+    capped_terms,
     get_term,
     get_vocabulary,
+    import_taxonomy,
+    parse_taxonomy_csv,
+    parse_taxonomy_json,
 )
 from taxonomy.models import (
     Vocabulary,
@@ -98,3 +107,166 @@ class TestApi(LoreTestCase):
             get_vocabulary(self.repo.slug, -1, self.vocabulary.slug)
         with self.assertRaises(NotFound):
             get_vocabulary(self.repo.slug, self.user.id, "missing")
+
+    def test_capped_terms(self):
+        """
+        Test capped_terms loads the first terms of each vocabulary
+        in one query
+        """
+        other = Vocabulary.objects.create(
+            repository=self.repo,
+            name="other",
+            required=False,
+            weight=100,
+        )
+        empty = Vocabulary.objects.create(
+            repository=self.repo,
+            name="empty",
+            required=False,
+            weight=100,
+        )
+        terms = [self.term] + [
+            Term.objects.create(
+                vocabulary=self.vocabulary,
+                label="term{0}".format(i),
+                weight=4,
+            ) for i in range(3)
+        ]
+        other_term = Term.objects.create(
+            vocabulary=other, label="other", weight=4)
+        with self.assertNumQueries(1):
+            vocabularies = capped_terms([self.vocabulary, other, empty], 2)
+        self.assertEqual(vocabularies[0].capped_terms, terms[:2])
+        self.assertEqual(vocabularies[1].capped_terms, [other_term])
+        self.assertEqual(vocabularies[2].capped_terms, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(capped_terms([], 2), [])
+
+
+class TestImportTaxonomy(LoreTestCase):
+    """Tests for importing many vocabularies and terms"""
+
+    def setUp(self):
+        super(TestImportTaxonomy, self).setUp()
+        self.vocabulary = Vocabulary.objects.create(
+            repository=self.repo,
+            name="existing",
+            required=True,
+            weight=5,
+        )
+        Term.objects.create(vocabulary=self.vocabulary, label="Easy", weight=1)
+
+    def test_import(self):
+        """New vocabularies and terms are created, existing ones kept."""
+        summary = import_taxonomy(self.repo, [
+            {"name": "existing", "required": False, "terms": ["Easy", "Hard"]},
+            {
+                "name": "new",
+                "vocabulary_type": Vocabulary.FREE_TAGGING,
+                "learning_resource_types": ["example"],
+                "terms": ["Easy", "Easy", {"label": "Medium", "weight": 3}],
+            },
+        ])
+        self.assertEqual(summary, {
+            "vocabularies_created": 1,
+            "terms_created": 3,
+            "terms_skipped": 2,
+        })
+
+        self.vocabulary.refresh_from_db()
+        self.assertTrue(self.vocabulary.required)
+        self.assertEqual(
+            sorted(self.vocabulary.term_set.values_list('label', flat=True)),
+            ["Easy", "Hard"]
+        )
+
+        new = Vocabulary.objects.get(repository=self.repo, name="new")
+        self.assertEqual(new.slug, "new")
+        self.assertEqual(new.vocabulary_type, Vocabulary.FREE_TAGGING)
+        self.assertEqual(
+            list(new.learning_resource_types.values_list('name', flat=True)),
+            ["example"]
+        )
+        self.assertEqual(
+            sorted(new.term_set.values_list('label', 'slug', 'weight')),
+            [("Easy", "easy1", 1), ("Medium", "medium", 3)]
+        )
+
+    def test_concurrent_slugs(self):
+        """Slugs taken by a concurrent import are allocated again."""
+        stale = []
+
+        def stale_slugify(labels, default_name, existing_func):
+            """Hand out a taken term slug a limited number of times."""
+            if default_name == "term" and len(stale) < attempts:
+                stale.append(labels)
+                return ["easy"] * len(labels)
+            return bulk_slugify(labels, default_name, existing_func)
+
+        attempts = IMPORT_ATTEMPTS - 1
+        with patch("taxonomy.api.bulk_slugify", side_effect=stale_slugify):
+            summary = import_taxonomy(
+                self.repo, [{"name": "existing", "terms": ["Hard"]}])
+        self.assertEqual(summary["terms_created"], 1)
+        self.assertEqual(len(stale), IMPORT_ATTEMPTS - 1)
+        self.assertTrue(Term.objects.filter(slug="hard").exists())
+
+        del stale[:]
+        attempts = IMPORT_ATTEMPTS
+        with patch("taxonomy.api.bulk_slugify", side_effect=stale_slugify):
+            with self.assertRaises(IntegrityError):
+                import_taxonomy(
+                    self.repo, [{"name": "existing", "terms": ["Soft"]}])
+        self.assertEqual(len(stale), IMPORT_ATTEMPTS)
+        self.assertFalse(Term.objects.filter(label="Soft").exists())
+
+    def test_invalid(self):
+        """Nothing is imported if anything is invalid."""
+        for vocabularies in (
+                [{"name": "new", "learning_resource_types": ["missing"]}],
+                [{"name": "new", "vocabulary_type": "x"}],
+                [{"name": ""}],
+                [{"name": "new", "terms": [{"label": "a" * 257}]}],
+                [{"name": "new", "terms": [{"label": "a", "weight": "b"}]}],
+                ["new"],
+        ):
+            with self.assertRaises(ValueError):
+                import_taxonomy(self.repo, vocabularies)
+        self.assertEqual(Vocabulary.objects.count(), 1)
+        self.assertEqual(Term.objects.count(), 1)
+
+    def test_parse(self):
+        """CSV and JSON imports parse to vocabularies."""
+        self.assertEqual(
+            parse_taxonomy_csv(
+                "Vocabulary,label,weight\n"
+                "difficulty,Easy,1\n"
+                ",,\n"
+                "topic,\u00e9t\u00e9,\n"
+                "difficulty,Hard,2\n"
+            ),
+            [
+                {"name": "difficulty", "terms": [
+                    {"label": "Easy", "weight": "1"},
+                    {"label": "Hard", "weight": "2"},
+                ]},
+                {"name": "topic", "terms": [{"label": "\u00e9t\u00e9"}]},
+            ]
+        )
+        with self.assertRaises(ValueError):
+            parse_taxonomy_csv("name,weight\nfoo,1\n")
+        with self.assertRaises(ValueError):
+            parse_taxonomy_csv("")
+
+        vocabularies = [{"name": "difficulty", "terms": ["Easy"]}]
+        self.assertEqual(
+            parse_taxonomy_json('{"vocabularies": [{"name": "difficulty", '
+                                '"terms": ["Easy"]}]}'),
+            vocabularies
+        )
+        self.assertEqual(
+            parse_taxonomy_json('[{"name": "difficulty", "terms": ["Easy"]}]'),
+            vocabularies
+        )
+        with self.assertRaises(ValueError):
+            parse_taxonomy_json('{"name": "difficulty"}')
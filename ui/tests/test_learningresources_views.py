@@ -11,13 +11,19 @@ import os
 from django.conf import settings
 from django.core.files.storage import default_storage
 from django.core.urlresolvers import resolve
+from guardian.shortcuts import get_perms
+from mock import patch
 
 from six.moves import reload_module  # pylint: disable=import-error
 
 import ui.urls
 from learningresources.tests.base import LoreTestCase
 from learningresources.models import Repository, StaticAsset
-from roles.api import assign_user_to_repo_group, remove_user_from_repo_group
+from roles.api import (
+    assign_user_to_repo_group,
+    invalidate_repo_perms,
+    remove_user_from_repo_group,
+)
 from roles.permissions import GroupTypes
 from search.sorting import LoreSortingFields
 
@@ -316,10 +322,42 @@ class TestViews(LoreTestCase):
                 os.path.basename(static_asset_url)
             )
         )
+        content = static_asset.file.read()
+        self.assertEqual(b"".join(resp.streaming_content), content)
+        self.assertEqual(resp['Accept-Ranges'], 'bytes')
+        self.assertEqual(resp['Content-Length'], str(len(content)))
+
+        # request part of the file
+        resp = self.client.get(static_asset_url, HTTP_RANGE='bytes=1-3')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b"".join(resp.streaming_content), content[1:4])
         self.assertEqual(
-            b"".join(resp.streaming_content),
-            static_asset.file.read()
+            resp['Content-Range'], 'bytes 1-3/{}'.format(len(content)))
+        resp = self.client.get(static_asset_url, HTTP_RANGE='bytes=-2')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b"".join(resp.streaming_content), content[-2:])
+        # the whole file is sent again when it changed since the first try
+        resp = self.client.get(
+            static_asset_url,
+            HTTP_RANGE='bytes=1-3',
+            HTTP_IF_RANGE='"stale"',
         )
+        self.assertEqual(resp.status_code, HTTP_OK)
+        self.assertEqual(b"".join(resp.streaming_content), content)
+        etag = resp['ETag']
+        resp = self.client.get(
+            static_asset_url, HTTP_RANGE='bytes=1-', HTTP_IF_RANGE=etag)
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(b"".join(resp.streaming_content), content[1:])
+        # a range beyond the end of the file can't be satisfied
+        resp = self.client.get(
+            static_asset_url,
+            HTTP_RANGE='bytes={}-'.format(len(content)),
+        )
+        self.assertEqual(resp.status_code, 416)
+        self.assertEqual(
+            resp['Content-Range'], 'bytes */{}'.format(len(content)))
+
         # only the user with right to see the repo can access the file
         self.logout()
         self.login(self.user_norepo.username)
@@ -342,3 +380,76 @@ class TestViews(LoreTestCase):
             self.assertEqual(resp.status_code, NOT_FOUND)
         # force the reload of the urls again to be sure to have everything back
         reload_module(ui.urls)
+
+    def test_serve_media_offload(self):
+        """
+        Test that downloads are handed to the web server after the
+        permission check when offloading is configured.
+        """
+        self.upload_test_file()
+        static_asset = StaticAsset.objects.first().asset
+        static_asset_url = static_asset.url
+        file_path = os.path.join(settings.MEDIA_ROOT, static_asset.name)
+
+        with self.settings(
+            DOWNLOAD_OFFLOAD='x-accel-redirect',
+            DOWNLOAD_OFFLOAD_PREFIX='/protected/',
+        ):
+            resp = self.client.get(static_asset_url)
+            self.assertEqual(resp.status_code, HTTP_OK)
+            self.assertEqual(resp.content, b"")
+            self.assertEqual(
+                resp['X-Accel-Redirect'],
+                '/protected/{}'.format(static_asset.name)
+            )
+            self.assertEqual(
+                resp['Content-Disposition'],
+                'attachment; filename={}'.format(
+                    os.path.basename(static_asset_url)
+                )
+            )
+
+        with self.settings(DOWNLOAD_OFFLOAD='x-sendfile'):
+            resp = self.client.get(static_asset_url)
+            self.assertEqual(resp.status_code, HTTP_OK)
+            self.assertEqual(resp['X-Sendfile'], file_path)
+
+            # Nothing is handed off without permission.
+            self.logout()
+            self.login(self.user_norepo.username)
+            resp = self.client.get(static_asset_url)
+            self.assertEqual(resp.status_code, UNAUTHORIZED)
+            self.assertFalse(resp.has_header('X-Sendfile'))
+            self.logout()
+            self.login(self.user.username)
+
+        # Without offloading Django sends the file itself.
+        with self.settings(DOWNLOAD_OFFLOAD=''):
+            resp = self.client.get(static_asset_url)
+            self.assertEqual(resp.status_code, HTTP_OK)
+            self.assertFalse(resp.has_header('X-Sendfile'))
+            self.assertEqual(
+                b"".join(resp.streaming_content),
+                static_asset.file.read()
+            )
+
+    def test_serve_media_permission_cache(self):
+        """
+        Test that permissions are checked once for a page full of
+        static assets.
+        """
+        self.upload_test_file()
+        invalidate_repo_perms(self.repo)
+        with patch('roles.api.get_perms', wraps=get_perms) as mock_perms:
+            for static_asset in StaticAsset.objects.all():
+                resp = self.client.get(static_asset.asset.url)
+                self.assertEqual(resp.status_code, HTTP_OK)
+            self.assertEqual(mock_perms.call_count, 1)
+
+            # Other users are checked separately.
+            self.logout()
+            self.login(self.user_norepo.username)
+            resp = self.client.get(
+                StaticAsset.objects.first().asset.url)
+            self.assertEqual(resp.status_code, UNAUTHORIZED)
+            self.assertEqual(mock_perms.call_count, 2)
@@ -7,21 +7,27 @@ import logging
 import mimetypes
 import json
 import os
+import re
 
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.core.exceptions import PermissionDenied
-from django.core.servers.basehttp import FileWrapper
+from django.core.exceptions import ImproperlyConfigured, PermissionDenied
 from django.core.urlresolvers import reverse
-from django.http import Http404, StreamingHttpResponse
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.shortcuts import (
     render,
     redirect,
 )
+from django.utils.http import http_date, urlquote
 from guardian.decorators import permission_required_or_403
-from guardian.shortcuts import get_perms
 from statsd.defaults.django import statsd
 
+from exporter.api import EXPORT_CODECS, export_path
 from learningresources.api import (
     get_repo,
     get_repos,
@@ -34,12 +40,17 @@ from learningresources.models import (
     STATIC_ASSET_PREFIX,
 )
 from rest.pagination import LorePagination
+from roles.api import get_repo_perms
 from roles.permissions import RepoPermission
 from search.sorting import LoreSortingFields
 from ui.forms import UploadForm, RepositoryForm
 
 log = logging.getLogger(__name__)
 
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# Bytes read at a time when serving part of a file.
+RANGE_CHUNK_SIZE = 64 * 1024
+
 
 @login_required
 @permission_required_or_403(
@@ -89,7 +100,7 @@ def welcome(request):
         request,
         "welcome.html",
         {
-            "repos": get_repos(request.user.id),
+            "repos": get_repos(request.user.id).only('id', 'slug', 'name'),
             "support_email": settings.EMAIL_SUPPORT,
         }
     )
@@ -165,7 +176,7 @@ def repository_view(request, repo_slug):
 
     context = {
         "repo": repo,
-        "perms_on_cur_repo": get_perms(request.user, repo),
+        "perms_on_cur_repo": get_repo_perms(request.user, repo),
         "sorting_options_json": json.dumps(sorting_options),
         "exports_json": json.dumps(exports),
         "page_size_json": json.dumps(page_size)
@@ -201,6 +212,153 @@ def repository_data_view(request, repo_slug):
     )
 
 
+def parse_range(header, size):
+    """
+    Parse a single byte range from a Range header.
+
+    Args:
+        header (unicode): Value of the Range header
+        size (int): Size of the file in bytes
+    Returns:
+        tuple:
+            (start, end) of the requested bytes, both inclusive, or None
+            if the header should be ignored. start is not less than size
+            if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        # Multiple ranges aren't supported, the whole file is served.
+        return None
+    first, last = match.groups()
+    if first == '':
+        if last == '':
+            return None
+        # Suffix range, the last bytes of the file.
+        length = int(last)
+        if length == 0:
+            return size, size
+        return max(size - length, 0), size - 1
+    start = int(first)
+    if last == '':
+        return start, size - 1
+    if int(last) < start:
+        return None
+    return start, min(int(last), size - 1)
+
+
+def _iter_file_range(fileobj, start, length):
+    """
+    Read part of a file in chunks, closing it afterwards.
+
+    Args:
+        fileobj (file): File to read
+        start (int): Offset of the first byte
+        length (int): Number of bytes to read
+    Returns:
+        generator: Yields chunks of bytes
+    """
+    try:
+        fileobj.seek(start)
+        while length > 0:
+            chunk = fileobj.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        fileobj.close()
+
+
+def offload_file(file_path):
+    """
+    Hand a file to the front web server with an internal redirect header
+    according to settings.DOWNLOAD_OFFLOAD. The web server takes care of
+    range requests and conditional headers.
+
+    Args:
+        file_path (unicode): Absolute path of the file within MEDIA_ROOT
+    Returns:
+        HttpResponse: Empty response with the redirect header
+    """
+    response = HttpResponse(content_type=mimetypes.guess_type(file_path)[0])
+    if settings.DOWNLOAD_OFFLOAD == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = urlquote(
+            settings.DOWNLOAD_OFFLOAD_PREFIX +
+            os.path.relpath(file_path, settings.MEDIA_ROOT)
+        )
+    elif settings.DOWNLOAD_OFFLOAD == 'x-sendfile':
+        response['X-Sendfile'] = file_path
+    else:
+        raise ImproperlyConfigured(
+            "Unknown LORE_DOWNLOAD_OFFLOAD {offload}".format(
+                offload=settings.DOWNLOAD_OFFLOAD
+            )
+        )
+    response['Content-Disposition'] = "attachment; filename={filename}".format(
+        filename=os.path.basename(file_path)
+    )
+    return response
+
+
+def serve_file(request, file_path):
+    """
+    Serve a file as an attachment, honoring Range and If-Range headers so
+    interrupted downloads can resume and media can be seeked into.
+
+    Whole files are served with FileResponse so WSGI servers can send them
+    with sendfile.
+
+    Args:
+        request (HttpRequest): The request
+        file_path (unicode): Absolute path of the file
+    Returns:
+        HttpResponse: 200, 206 or 416 response
+    """
+    if settings.DOWNLOAD_OFFLOAD:
+        return offload_file(file_path)
+
+    stat = os.stat(file_path)
+    size = stat.st_size
+    etag = '"{mtime:x}-{size:x}"'.format(mtime=int(stat.st_mtime), size=size)
+    last_modified = http_date(stat.st_mtime)
+    content_type = mimetypes.guess_type(file_path)[0]
+
+    byte_range = None
+    range_header = request.META.get('HTTP_RANGE')
+    if range_header is not None:
+        # A stale If-Range means the client must start over.
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if if_range is None or if_range in (etag, last_modified):
+            byte_range = parse_range(range_header, size)
+
+    if byte_range is None:
+        response = FileResponse(
+            open(file_path, 'rb'), content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        if start >= size:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = 'bytes */{size}'.format(size=size)
+            return response
+        response = StreamingHttpResponse(
+            _iter_file_range(open(file_path, 'rb'), start, end - start + 1),
+            status=206,
+            content_type=content_type,
+        )
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = 'bytes {start}-{end}/{size}'.format(
+            start=start, end=end, size=size)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Content-Disposition'] = "attachment; filename={filename}".format(
+        filename=os.path.basename(file_path)
+    )
+    return response
+
+
 @login_required
 def serve_static_assets(request, path):
     """
@@ -210,21 +368,15 @@ def serve_static_assets(request, path):
     # first check if the user has access to the file
     media_path = os.path.join(STATIC_ASSET_PREFIX, path)
     file_path = os.path.join(settings.MEDIA_ROOT, media_path)
-    static_assets = StaticAsset.objects.filter(asset=media_path)
-    if not static_assets:
+    static_asset = StaticAsset.objects.filter(
+        asset=media_path
+    ).select_related('course__repository').first()
+    if static_asset is None:
         raise Http404()
-    static_asset = static_assets.first()
-    if (RepoPermission.view_repo[0] not in
-            get_perms(request.user, static_asset.course.repository)):
+    perms = get_repo_perms(request.user, static_asset.course.repository)
+    if RepoPermission.view_repo[0] not in perms:
         raise PermissionDenied()
-    filename = os.path.basename(file_path)
-    response = StreamingHttpResponse(
-        FileWrapper(open(file_path, 'rb')),
-        content_type=mimetypes.guess_type(file_path)[0]
-    )
-    response['Content-Length'] = os.path.getsize(file_path)
-    response['Content-Disposition'] = "attachment; filename=%s" % filename
-    return response
+    return serve_file(request, file_path)
 
 
 @login_required
@@ -236,24 +388,15 @@ def serve_resource_exports(request, path):
     media_path = os.path.join(settings.EXPORT_PATH_PREFIX, path)
     file_path = os.path.join(settings.MEDIA_ROOT, media_path)
 
-    # There is only one path that will work here, make sure it matches exactly.
-    expected_filename = "{name}_exports.tar.gz".format(
-        name=request.user.username
-    )
-    expected_path = os.path.join(
-        settings.MEDIA_ROOT, settings.EXPORT_PATH_PREFIX, expected_filename)
-    if expected_path != file_path:
+    # Only the user's own export will work here, make sure it matches exactly.
+    expected_paths = [
+        os.path.join(settings.MEDIA_ROOT, export_path(
+            request.user.username, codec))
+        for codec in EXPORT_CODECS
+    ]
+    if file_path not in expected_paths:
         raise PermissionDenied()
     if not os.path.exists(file_path):
         raise Http404()
 
-    filename = os.path.basename(file_path)
-    response = StreamingHttpResponse(
-        FileWrapper(open(file_path, 'rb')),
-        content_type=mimetypes.guess_type(file_path)[0]
-    )
-    response['Content-Length'] = os.path.getsize(file_path)
-    response['Content-Disposition'] = "attachment; filename={filename}".format(
-        filename=filename
-    )
-    return response
+    return serve_file(request, file_path)
@@ -5,7 +5,12 @@ from random import randint
 
 from django.core.management.base import BaseCommand, CommandError
 
+from learningresources.api import (
+    XANALYTICS_ROLLUP_FIELDS,
+    bulk_update_resources,
+)
 from learningresources.models import Course
+from xanalytics.rollups import apply_rollup_deltas, resource_deltas
 
 log = logging.getLogger(__name__)
 
@@ -33,10 +38,21 @@ class Command(BaseCommand):
         except Course.DoesNotExist:
             raise CommandError("invalid course ID")
 
-        # This should call importer.tasks.populate_xanalytics_fields
-        # once the xanalytics API is ready.
-        for resource in course.resources.all().iterator():
-            resource.xa_nr_views = randint(1, 10000)
-            resource.xa_nr_attempts = randint(1, 1000)
-            resource.xa_avg_grade = randint(65, 101)
-            resource.save()
+        # Random values for development, the populate_xanalytics_fields
+        # task in importer.tasks requests the real ones from xanalytics.
+        values_by_id = {}
+        changes = []
+        for row in course.resources.values_list(
+                'id', 'learning_resource_type_id', *XANALYTICS_ROLLUP_FIELDS):
+            values = {
+                "xa_nr_views": randint(1, 10000),
+                "xa_nr_attempts": randint(1, 1000),
+                "xa_avg_grade": randint(65, 101),
+            }
+            values_by_id[row[0]] = values
+            changes.append((
+                row[0], course.id, row[1], tuple(row[2:]),
+                tuple(values[name] for name in XANALYTICS_ROLLUP_FIELDS),
+            ))
+        bulk_update_resources(values_by_id)
+        apply_rollup_deltas(resource_deltas(changes))
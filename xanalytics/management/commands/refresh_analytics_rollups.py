@@ -0,0 +1,20 @@
+"""Management command to recompute the analytics rollups."""
+
+import logging
+
+from django.core.management.base import BaseCommand
+
+from xanalytics.rollups import refresh_all_rollups
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """Recompute the analytics rollups of every repository."""
+
+    help = "Recompute the analytics rollups of every repository."
+
+    def handle(self, *args, **options):
+        """Run the command."""
+        count = refresh_all_rollups()
+        log.info("Wrote %d analytics rollups", count)
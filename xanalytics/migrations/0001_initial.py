@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+# pylint: skip-file
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learningresources', '0020_learningresource_uuid_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='XanalyticsJob',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('token', models.TextField()),
+                ('attempts', models.IntegerField(default=0)),
+                ('next_check', models.DateTimeField(db_index=True)),
+                ('course', models.ForeignKey(to='learningresources.Course')),
+            ],
+        ),
+    ]
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import models, migrations
+
+# pylint: skip-file
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learningresources', '0020_learningresource_uuid_index'),
+        ('xanalytics', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnalyticsRollup',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_modified', models.DateTimeField(auto_now=True)),
+                ('dimension', models.CharField(max_length=20, choices=[('course', 'Course'), ('term', 'Term'), ('resource_type', 'Resource type')])),
+                ('key', models.IntegerField()),
+                ('label', models.TextField()),
+                ('resource_count', models.IntegerField(default=0)),
+                ('views', models.BigIntegerField(default=0)),
+                ('attempts', models.BigIntegerField(default=0)),
+                ('grade_sum', models.FloatField(default=0)),
+                ('grade_histogram', models.TextField(default='[]')),
+                ('repository', models.ForeignKey(to='learningresources.Repository')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='analyticsrollup',
+            unique_together=set([('repository', 'dimension', 'key')]),
+        ),
+    ]
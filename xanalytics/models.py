@@ -0,0 +1,52 @@
+"""
+Models for xanalytics
+"""
+
+from __future__ import unicode_literals
+
+from django.db import models
+
+from audit.models import BaseModel
+from learningresources.models import Course, Repository
+
+
+class XanalyticsJob(BaseModel):
+    """
+    An xanalytics job for a course whose results haven't been fetched yet.
+    """
+    course = models.ForeignKey(Course)
+    token = models.TextField()
+    attempts = models.IntegerField(default=0)
+    next_check = models.DateTimeField(db_index=True)
+
+
+class AnalyticsRollup(BaseModel):
+    """
+    Totals of the xanalytics fields of the LearningResources in a course,
+    with a term or of a resource type, kept so repository dashboards
+    don't have to aggregate every resource.
+    """
+    COURSE = "course"
+    TERM = "term"
+    RESOURCE_TYPE = "resource_type"
+    DIMENSION_CHOICES = (
+        (COURSE, "Course"),
+        (TERM, "Term"),
+        (RESOURCE_TYPE, "Resource type"),
+    )
+
+    repository = models.ForeignKey(Repository)
+    dimension = models.CharField(max_length=20, choices=DIMENSION_CHOICES)
+    # Primary key of the Course, Term or LearningResourceType.
+    key = models.IntegerField()
+    label = models.TextField()
+    resource_count = models.IntegerField(default=0)
+    views = models.BigIntegerField(default=0)
+    attempts = models.BigIntegerField(default=0)
+    grade_sum = models.FloatField(default=0)
+    # JSON list of resource counts per average grade bucket.
+    grade_histogram = models.TextField(default="[]")
+
+    class Meta:
+        # pylint: disable=missing-docstring
+        unique_together = (("repository", "dimension", "key"),)
@@ -0,0 +1,221 @@
+"""
+Poll the xanalytics API for the results of outstanding jobs.
+"""
+
+from __future__ import unicode_literals
+
+from datetime import timedelta
+import logging
+from multiprocessing.pool import ThreadPool
+from tempfile import SpooledTemporaryFile
+
+from django.utils import timezone
+import requests
+from requests.adapters import HTTPAdapter
+from requests.exceptions import RequestException
+
+from xanalytics.models import XanalyticsJob
+from xanalytics.stream import ingest_result, READ_CHUNK_SIZE
+
+log = logging.getLogger(__name__)
+
+# Seconds before the first status check of a job, doubled after each check.
+INITIAL_WAIT = 5
+# Number of status checks before a job is given up on.
+RETRY_LIMIT = 10
+# Seconds a job claimed by a poller is hidden from other pollers.
+CLAIM_TIMEOUT = 10 * 60
+# Results larger than this are downloaded to a temporary file.
+RESULT_SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def register_job(course_id, token):
+    """
+    Record an xanalytics job so a poller will fetch its results.
+
+    Args:
+        course_id (int): Primary key of the Course
+        token (unicode): Job token from xanalytics
+    Returns:
+        xanalytics.models.XanalyticsJob: The new job
+    """
+    return XanalyticsJob.objects.create(
+        course_id=course_id,
+        token=token,
+        next_check=timezone.now() + timedelta(seconds=INITIAL_WAIT),
+    )
+
+
+def seconds_until_next_check():
+    """
+    Time until the next outstanding job is due to be checked.
+
+    Returns:
+        float: Seconds to wait, or None if there are no outstanding jobs
+    """
+    next_check = XanalyticsJob.objects.order_by(
+        'next_check').values_list('next_check', flat=True).first()
+    if next_check is None:
+        return None
+    return max((next_check - timezone.now()).total_seconds(), 0)
+
+
+class XanalyticsPoller(object):
+    """
+    Checks outstanding xanalytics jobs concurrently over a pooled HTTP
+    session and streams completed results to an ingestion function.
+
+    Network calls run on a thread pool, database work stays on the
+    calling thread.
+    """
+
+    def __init__(self, base_url, ingest, threads):
+        """
+        Args:
+            base_url (unicode): URL of the xanalytics API
+            ingest (function):
+                Called with the course number and an iterable of module
+                records of each completed job
+            threads (int): Number of concurrent HTTP requests
+        """
+        self.base_url = base_url
+        self.ingest = ingest
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=threads)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.pool = ThreadPool(threads)
+
+    def close(self):
+        """Stop the thread pool and close pooled connections."""
+        self.pool.close()
+        self.pool.join()
+        self.session.close()
+
+    def _check_status(self, token):
+        """
+        Ask xanalytics about a job.
+
+        Args:
+            token (unicode): Job token
+        Returns:
+            dict: Status of the job, empty if it couldn't be read
+        """
+        try:
+            resp = self.session.post(
+                self.base_url + "/status", data={"token": token})
+            return resp.json()
+        except (RequestException, ValueError) as ex:
+            log.error("Unable to check xanalytics job %s: %s", token, ex)
+            return {}
+
+    def _fetch_result(self, url):
+        """
+        Download the result of a completed job without holding it in memory.
+
+        Args:
+            url (unicode): URL of the result
+        Returns:
+            SpooledTemporaryFile: The result, or None if it couldn't be read
+        """
+        spool = SpooledTemporaryFile(max_size=RESULT_SPOOL_MAX_SIZE)
+        try:
+            resp = self.session.get(url, stream=True)
+            try:
+                resp.raise_for_status()
+                for chunk in resp.iter_content(READ_CHUNK_SIZE):
+                    spool.write(chunk)
+            finally:
+                resp.close()
+        except RequestException as ex:
+            log.error("Unable to download xanalytics result %s: %s", url, ex)
+            spool.close()
+            return None
+        return spool
+
+    @staticmethod
+    def _claim_due_jobs():
+        """
+        Claim the jobs due for a status check, so concurrent pollers don't
+        check them too.
+
+        Returns:
+            list of xanalytics.models.XanalyticsJob: Claimed jobs
+        """
+        now = timezone.now()
+        claimed = []
+        for job in XanalyticsJob.objects.filter(next_check__lte=now):
+            if XanalyticsJob.objects.filter(
+                    id=job.id, next_check=job.next_check
+            ).update(next_check=now + timedelta(seconds=CLAIM_TIMEOUT)) == 1:
+                claimed.append(job)
+        return claimed
+
+    def poll(self):
+        """
+        Check all due jobs at once, fetch the completed ones in parallel
+        and ingest them.
+
+        Returns:
+            int: Number of results ingested
+        """
+        jobs = self._claim_due_jobs()
+        if len(jobs) == 0:
+            return 0
+        statuses = self.pool.map(
+            self._check_status, [job.token for job in jobs])
+
+        completed = []
+        for job, status in zip(jobs, statuses):
+            if status.get("status") == "complete":
+                completed.append((job, status["url"]))
+            elif status == {} or status.get("status") == "still busy":
+                # A check which failed counts as an attempt too.
+                self._retry_later(job, status)
+            else:
+                log.error(
+                    "Giving up on xanalytics job %s: %s", job.token, status)
+                job.delete()
+
+        results = self.pool.map(
+            self._fetch_result, [url for _, url in completed])
+        ingested = 0
+        for (job, url), spool in zip(completed, results):
+            if spool is None:
+                self._retry_later(job, "download of {0} failed".format(url))
+                continue
+            try:
+                ingest_result(spool, self.ingest)
+                ingested += 1
+            except ValueError as ex:
+                log.error("Unable to parse xanalytics response from "
+                          "%s: %s", url, ex)
+            except Exception as ex:  # pylint: disable=broad-except
+                log.exception("Unable to ingest xanalytics response from "
+                              "%s", url)
+                self._retry_later(job, ex)
+                continue
+            finally:
+                spool.close()
+            job.delete()
+        return ingested
+
+    @staticmethod
+    def _retry_later(job, reason):
+        """
+        Check a job again after a backoff, or give up on it once it was
+        checked RETRY_LIMIT times.
+
+        Args:
+            job (xanalytics.models.XanalyticsJob): Job to retry
+            reason (object): Why the job isn't done, for the log
+        """
+        if job.attempts + 1 < RETRY_LIMIT:
+            job.attempts += 1
+            job.next_check = timezone.now() + timedelta(
+                seconds=INITIAL_WAIT * 2 ** job.attempts)
+            job.save()
+        else:
+            log.error(
+                "Giving up on xanalytics job %s: %s", job.token, reason)
+            job.delete()
@@ -0,0 +1,418 @@
+"""
+Precomputed totals of the xanalytics fields, per course, term and
+resource type of a repository.
+"""
+
+from __future__ import unicode_literals
+
+from collections import defaultdict
+import json
+
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Sum, Value, When
+from statsd.defaults.django import statsd
+
+from learningresources.models import Course, LearningResource, Repository
+from taxonomy.models import Term
+from xanalytics.models import AnalyticsRollup
+
+# Average grades are counted in buckets of this width, the last bucket
+# also counts grades above the top of the scale.
+GRADE_BUCKET_WIDTH = 10
+GRADE_BUCKETS = 10
+# Number of LearningResources whose terms are loaded per query.
+DELTA_CHUNK_SIZE = 1000
+
+
+def _aggregates(prefix=""):
+    """
+    Aggregates for one rollup row.
+
+    Args:
+        prefix (unicode): Lookup from the queried model to LearningResource
+    Returns:
+        dict: Aggregate expressions by name
+    """
+    grade = prefix + "xa_avg_grade"
+    aggregates = {
+        "resource_count": Count(prefix + "id"),
+        "views": Sum(prefix + "xa_nr_views"),
+        "attempts": Sum(prefix + "xa_nr_attempts"),
+        "grade_sum": Sum(grade),
+    }
+    for bucket in range(GRADE_BUCKETS):
+        bounds = {}
+        if bucket > 0:
+            bounds[grade + "__gte"] = bucket * GRADE_BUCKET_WIDTH
+        if bucket < GRADE_BUCKETS - 1:
+            bounds[grade + "__lt"] = (bucket + 1) * GRADE_BUCKET_WIDTH
+        aggregates["bucket{0}".format(bucket)] = Sum(Case(
+            When(then=Value(1), **bounds),
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+    return aggregates
+
+
+def _rollup(repository_id, dimension, key, label, row):
+    """
+    Make an unsaved AnalyticsRollup from an aggregated row.
+    """
+    return AnalyticsRollup(
+        repository_id=repository_id,
+        dimension=dimension,
+        key=key,
+        label=label,
+        resource_count=row["resource_count"],
+        views=row["views"] or 0,
+        attempts=row["attempts"] or 0,
+        grade_sum=row["grade_sum"] or 0,
+        grade_histogram=json.dumps([
+            row["bucket{0}".format(bucket)] or 0
+            for bucket in range(GRADE_BUCKETS)
+        ]),
+    )
+
+
+def _course_rollups(repository_id, course_ids):
+    """Aggregate resources by course."""
+    resources = LearningResource.objects.filter(
+        course__repository_id=repository_id)
+    if course_ids is not None:
+        resources = resources.filter(course_id__in=course_ids)
+    rows = resources.values(
+        "course_id", "course__org", "course__course_number", "course__run"
+    ).annotate(**_aggregates()).order_by()
+    return [
+        _rollup(
+            repository_id, AnalyticsRollup.COURSE, row["course_id"],
+            "/".join([row["course__org"], row["course__course_number"],
+                      row["course__run"]]),
+            row
+        )
+        for row in rows
+    ]
+
+
+def _resource_type_rollups(repository_id, type_ids):
+    """Aggregate resources by resource type."""
+    resources = LearningResource.objects.filter(
+        course__repository_id=repository_id)
+    if type_ids is not None:
+        resources = resources.filter(learning_resource_type_id__in=type_ids)
+    rows = resources.values(
+        "learning_resource_type_id", "learning_resource_type__name"
+    ).annotate(**_aggregates()).order_by()
+    return [
+        _rollup(
+            repository_id, AnalyticsRollup.RESOURCE_TYPE,
+            row["learning_resource_type_id"],
+            row["learning_resource_type__name"], row
+        )
+        for row in rows
+    ]
+
+
+def _term_rollups(repository_id, term_ids):
+    """Aggregate resources by term, from the term to resource table."""
+    links = Term.learning_resources.through.objects.filter(
+        learningresource__course__repository_id=repository_id)
+    if term_ids is not None:
+        links = links.filter(term_id__in=term_ids)
+    rows = links.values("term_id", "term__label").annotate(
+        **_aggregates("learningresource__")).order_by()
+    return [
+        _rollup(
+            repository_id, AnalyticsRollup.TERM, row["term_id"],
+            row["term__label"], row
+        )
+        for row in rows
+    ]
+
+
+def course_rollup_keys(course_ids):
+    """
+    Keys of the rollups which depend on the resources of some courses.
+
+    Args:
+        course_ids (iterable of int): Primary keys of the Courses
+    Returns:
+        dict: Lists of rollup keys by dimension
+    """
+    course_ids = list(course_ids)
+    return {
+        AnalyticsRollup.COURSE: course_ids,
+        AnalyticsRollup.RESOURCE_TYPE: list(
+            LearningResource.objects.filter(
+                course_id__in=course_ids
+            ).values_list(
+                "learning_resource_type_id", flat=True
+            ).order_by().distinct()
+        ),
+        AnalyticsRollup.TERM: list(
+            Term.learning_resources.through.objects.filter(
+                learningresource__course_id__in=course_ids
+            ).values_list("term_id", flat=True).order_by().distinct()
+        ),
+    }
+
+
+_DIMENSION_ROLLUPS = {
+    AnalyticsRollup.COURSE: _course_rollups,
+    AnalyticsRollup.RESOURCE_TYPE: _resource_type_rollups,
+    AnalyticsRollup.TERM: _term_rollups,
+}
+
+
+@statsd.timer('lore.xanalytics.refresh_rollups')
+def refresh_rollup_keys(repository_id, keys):
+    """
+    Recompute some rollups of a repository with one GROUP BY query per
+    dimension. Rollups of keys which no longer have resources are deleted.
+
+    Args:
+        repository_id (int): Primary key of the Repository
+        keys (dict):
+            Maps dimensions to the list of keys to recompute, or to None
+            to recompute the whole dimension. Other dimensions are kept.
+    Returns:
+        int: Number of rollups written
+    """
+    rollups = []
+    for dimension, dimension_keys in keys.items():
+        rollups.extend(
+            _DIMENSION_ROLLUPS[dimension](repository_id, dimension_keys))
+    with transaction.atomic():
+        for dimension, dimension_keys in keys.items():
+            stale = AnalyticsRollup.objects.filter(
+                repository_id=repository_id, dimension=dimension)
+            if dimension_keys is not None:
+                stale = stale.filter(key__in=dimension_keys)
+            stale.delete()
+        AnalyticsRollup.objects.bulk_create(rollups)
+    return len(rollups)
+
+
+def refresh_rollups(repository_id, course_ids=None):
+    """
+    Recompute the rollups of a repository.
+
+    Args:
+        repository_id (int): Primary key of the Repository
+        course_ids (list of int):
+            If set, only recompute the rollups of these courses and of the
+            terms and resource types of their resources
+    Returns:
+        int: Number of rollups written
+    """
+    if course_ids is None:
+        keys = dict((dimension, None) for dimension in _DIMENSION_ROLLUPS)
+    else:
+        keys = course_rollup_keys(course_ids)
+    return refresh_rollup_keys(repository_id, keys)
+
+
+def refresh_term_rollups(repository_id, term_ids):
+    """
+    Recompute the rollups of some terms, after their label or their
+    resources changed, or delete them if the terms were deleted.
+
+    Args:
+        repository_id (int): Primary key of the Repository
+        term_ids (iterable of int): Primary keys of the Terms
+    Returns:
+        int: Number of rollups written
+    """
+    term_ids = list(term_ids)
+    if len(term_ids) == 0:
+        return 0
+    return refresh_rollup_keys(
+        repository_id, {AnalyticsRollup.TERM: term_ids})
+
+
+def _grade_bucket(grade):
+    """Histogram bucket of an average grade, like the bucket aggregates."""
+    return max(0, min(int(grade // GRADE_BUCKET_WIDTH), GRADE_BUCKETS - 1))
+
+
+def _delta(deltas, repository_id, dimension, key):
+    """
+    The pending change of one rollup, added to deltas if it isn't yet.
+    """
+    delta_key = (repository_id, dimension, key)
+    if delta_key not in deltas:
+        deltas[delta_key] = {
+            "resource_count": 0,
+            "views": 0,
+            "attempts": 0,
+            "grade_sum": 0,
+            "grade_histogram": [0] * GRADE_BUCKETS,
+        }
+    return deltas[delta_key]
+
+
+def resource_deltas(changes):
+    """
+    Changes to the rollups from new xanalytics values of some resources,
+    computed from the old and new values alone.
+
+    Args:
+        changes (iterable of tuple):
+            (id, course id, resource type id, old values, new values) of
+            each updated LearningResource, values are (views, attempts,
+            average grade)
+    Returns:
+        dict: Rollup changes by (repository id, dimension, key)
+    """
+    changes = [change for change in changes if change[3] != change[4]]
+    if len(changes) == 0:
+        return {}
+    repository_ids = dict(Course.objects.filter(
+        id__in=set(change[1] for change in changes)
+    ).values_list("id", "repository_id"))
+    term_ids = defaultdict(list)
+    resource_ids = sorted(set(change[0] for change in changes))
+    links = Term.learning_resources.through.objects
+    for start in range(0, len(resource_ids), DELTA_CHUNK_SIZE):
+        for resource_id, term_id in links.filter(
+                learningresource_id__in=resource_ids[
+                    start:start + DELTA_CHUNK_SIZE]
+        ).values_list("learningresource_id", "term_id"):
+            term_ids[resource_id].append(term_id)
+
+    deltas = {}
+    for resource_id, course_id, type_id, old, new in changes:
+        keys = [
+            (AnalyticsRollup.COURSE, course_id),
+            (AnalyticsRollup.RESOURCE_TYPE, type_id),
+        ] + [
+            (AnalyticsRollup.TERM, term_id)
+            for term_id in term_ids[resource_id]
+        ]
+        for dimension, key in keys:
+            delta = _delta(
+                deltas, repository_ids[course_id], dimension, key)
+            delta["views"] += new[0] - old[0]
+            delta["attempts"] += new[1] - old[1]
+            delta["grade_sum"] += new[2] - old[2]
+            delta["grade_histogram"][_grade_bucket(old[2])] -= 1
+            delta["grade_histogram"][_grade_bucket(new[2])] += 1
+    return deltas
+
+
+def course_removal_deltas(course_ids):
+    """
+    Changes to the rollups from deleting some courses, aggregated over the
+    resources of the courses only. Read them before deleting the courses.
+
+    Args:
+        course_ids (iterable of int): Primary keys of the Courses
+    Returns:
+        dict: Rollup changes by (repository id, dimension, key)
+    """
+    course_ids = list(course_ids)
+    repository_ids = dict(Course.objects.filter(
+        id__in=course_ids).values_list("id", "repository_id"))
+    resources = LearningResource.objects.filter(course_id__in=course_ids)
+    links = Term.learning_resources.through.objects.filter(
+        learningresource__course_id__in=course_ids)
+    grouped = (
+        (AnalyticsRollup.COURSE, "course_id", "course_id",
+         resources.values("course_id").annotate(**_aggregates())),
+        (AnalyticsRollup.RESOURCE_TYPE, "course_id",
+         "learning_resource_type_id",
+         resources.values("course_id", "learning_resource_type_id").annotate(
+             **_aggregates())),
+        (AnalyticsRollup.TERM, "learningresource__course_id", "term_id",
+         links.values("learningresource__course_id", "term_id").annotate(
+             **_aggregates("learningresource__"))),
+    )
+    deltas = {}
+    for dimension, course_field, key_field, rows in grouped:
+        for row in rows.order_by():
+            delta = _delta(
+                deltas, repository_ids[row[course_field]], dimension,
+                row[key_field]
+            )
+            delta["resource_count"] -= row["resource_count"]
+            delta["views"] -= row["views"] or 0
+            delta["attempts"] -= row["attempts"] or 0
+            delta["grade_sum"] -= row["grade_sum"] or 0
+            for bucket in range(GRADE_BUCKETS):
+                delta["grade_histogram"][bucket] -= (
+                    row["bucket{0}".format(bucket)] or 0)
+    return deltas
+
+
+@statsd.timer('lore.xanalytics.apply_rollup_deltas')
+def apply_rollup_deltas(deltas):
+    """
+    Add changes to the rollups they belong to. Rollups left without
+    resources are deleted. Rollups which weren't computed yet are computed
+    for their keys only, from the already changed resources.
+
+    Args:
+        deltas (dict): Rollup changes by (repository id, dimension, key)
+    Returns:
+        int: Number of rollups changed
+    """
+    if len(deltas) == 0:
+        return 0
+    keys = defaultdict(list)
+    for repository_id, dimension, key in deltas:
+        keys[(repository_id, dimension)].append(key)
+
+    changed = 0
+    missing = defaultdict(dict)
+    with transaction.atomic():
+        for (repository_id, dimension), dimension_keys in keys.items():
+            rollups = AnalyticsRollup.objects.select_for_update().filter(
+                repository_id=repository_id,
+                dimension=dimension,
+                key__in=dimension_keys,
+            )
+            found = set()
+            empty_ids = []
+            for rollup in rollups:
+                found.add(rollup.key)
+                delta = deltas[(repository_id, dimension, rollup.key)]
+                rollup.resource_count += delta["resource_count"]
+                if rollup.resource_count <= 0:
+                    empty_ids.append(rollup.id)
+                    continue
+                rollup.views += delta["views"]
+                rollup.attempts += delta["attempts"]
+                rollup.grade_sum += delta["grade_sum"]
+                rollup.grade_histogram = json.dumps([
+                    count + change for count, change in zip(
+                        json.loads(rollup.grade_histogram),
+                        delta["grade_histogram"]
+                    )
+                ])
+                rollup.save()
+            AnalyticsRollup.objects.filter(id__in=empty_ids).delete()
+            changed += len(found)
+            # Removals have nothing to remove from missing rollups.
+            new_keys = [
+                key for key in dimension_keys if key not in found and
+                deltas[(repository_id, dimension, key)][
+                    "resource_count"] >= 0
+            ]
+            if len(new_keys) > 0:
+                missing[repository_id][dimension] = new_keys
+    for repository_id, missing_keys in missing.items():
+        changed += refresh_rollup_keys(repository_id, missing_keys)
+    return changed
+
+
+def refresh_all_rollups():
+    """
+    Recompute the rollups of every repository.
+
+    Returns:
+        int: Number of rollups written
+    """
+    return sum(
+        refresh_rollups(repository_id)
+        for repository_id in Repository.objects.values_list("id", flat=True)
+    )
@@ -0,0 +1,190 @@
+"""
+Incremental parsing of xanalytics results, so large results are never
+held in memory as a whole.
+"""
+
+from __future__ import unicode_literals
+
+import codecs
+import json
+
+# Bytes read from a result file at a time.
+READ_CHUNK_SIZE = 64 * 1024
+# Key of the array holding one record per module.
+MODULES_KEY = "module_medata"
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+
+class _StreamReader(object):
+    """
+    Reads JSON tokens and values from an iterable of byte chunks,
+    keeping only the unparsed part of the text in memory.
+    """
+
+    def __init__(self, chunks):
+        """
+        Args:
+            chunks (iterable of bytes): UTF-8 encoded JSON
+        """
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """
+        Append the next chunk to the buffer.
+
+        Returns:
+            bool: False if there was nothing left to read
+        """
+        if self._eof:
+            return False
+        try:
+            text = self._decoder.decode(next(self._chunks))
+        except StopIteration:
+            self._eof = True
+            text = self._decoder.decode(b"", True)
+        self._buffer = self._buffer[self._pos:] + text
+        self._pos = 0
+        return True
+
+    def peek(self):
+        """
+        Skip whitespace and return the next character without consuming it.
+
+        Returns:
+            unicode: Next character
+        Raises:
+            ValueError: The JSON ended early
+        """
+        while True:
+            while (self._pos < len(self._buffer) and
+                   self._buffer[self._pos] in _WHITESPACE):
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON")
+
+    def expect(self, *chars):
+        """
+        Consume the next character, which must be one of chars.
+
+        Args:
+            chars (list of unicode): Allowed characters
+        Returns:
+            unicode: The character
+        Raises:
+            ValueError: The character isn't allowed here
+        """
+        char = self.peek()
+        if char not in chars:
+            raise ValueError("Expected {expected} but got {char}".format(
+                expected=" or ".join(chars), char=char))
+        self._pos += 1
+        return char
+
+    def value(self):
+        """
+        Decode the next complete JSON value.
+
+        Returns:
+            object: Decoded value
+        Raises:
+            ValueError: The JSON is invalid
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self._buffer, self._pos)
+            except ValueError:
+                if self._fill():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next
+            # chunk.
+            if end == len(self._buffer) and self._fill():
+                continue
+            self._pos = end
+            return value
+
+
+def iter_result_items(chunks):
+    """
+    Parse an xanalytics result object one item at a time.
+
+    Args:
+        chunks (iterable of bytes): UTF-8 encoded JSON object
+    Returns:
+        generator:
+            Yields (key, value) for each top level item, except that
+            (MODULES_KEY, record) is yielded for each module record.
+    Raises:
+        ValueError: The JSON is invalid
+    """
+    reader = _StreamReader(chunks)
+    reader.expect("{")
+    if reader.peek() == "}":
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        if key == MODULES_KEY and reader.peek() == "[":
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.expect("]")
+            else:
+                while True:
+                    yield key, reader.value()
+                    if reader.expect(",", "]") == "]":
+                        break
+        else:
+            yield key, reader.value()
+        if reader.expect(",", "}") == "}":
+            return
+
+
+def _read_chunks(fileobj):
+    """Read a file from the start in chunks."""
+    fileobj.seek(0)
+    return iter(lambda: fileobj.read(READ_CHUNK_SIZE), b"")
+
+
+def ingest_result(fileobj, ingest):
+    """
+    Feed the module records of an xanalytics result to an ingestion
+    function as a stream.
+
+    If course_id comes after the records, the file is read a second time
+    instead of holding the records in memory.
+
+    Args:
+        fileobj (file): Seekable file with the result
+        ingest (function):
+            Called with the course number and an iterable of records
+    Returns:
+        object: What ingest returned, or 0 if there was no course_id
+    Raises:
+        ValueError: The JSON is invalid
+    """
+    items = iter_result_items(_read_chunks(fileobj))
+    course_number = None
+    records_first = False
+    for key, value in items:
+        if key == "course_id":
+            course_number = value
+            break
+        if key == MODULES_KEY:
+            records_first = True
+    if course_number is None:
+        return 0
+
+    if records_first:
+        items = iter_result_items(_read_chunks(fileobj))
+    return ingest(course_number, (
+        value for key, value in items if key == MODULES_KEY
+    ))
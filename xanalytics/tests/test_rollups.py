@@ -0,0 +1,287 @@
+"""
+Tests for the analytics rollups.
+"""
+
+from __future__ import unicode_literals
+
+import json
+
+from django.core.management import call_command
+
+from mock import patch
+
+from learningresources.api import (
+    _apply_xanalytics_orm,
+    create_course,
+    create_resource,
+    delete_course,
+    update_xanalytics,
+)
+from learningresources.tests.base import LoreTestCase
+from taxonomy.api import update_resource_terms
+from taxonomy.models import Term, Vocabulary
+from xanalytics.models import AnalyticsRollup
+from xanalytics.rollups import (
+    apply_rollup_deltas,
+    refresh_all_rollups,
+    refresh_rollups,
+    refresh_term_rollups,
+    resource_deltas,
+)
+
+
+class TestRollups(LoreTestCase):
+    """
+    Test computing rollups per course, term and resource type.
+    """
+    def setUp(self):
+        """Two resources of different types, one with a term."""
+        super(TestRollups, self).setUp()
+        self.resource.xa_nr_views = 10
+        self.resource.xa_nr_attempts = 2
+        self.resource.xa_avg_grade = 95
+        self.resource.save()
+        self.other = self.create_resource(
+            resource_type="problem", xa_nr_views=5, xa_nr_attempts=1,
+            xa_avg_grade=42,
+        )
+        vocab = Vocabulary.objects.create(
+            repository=self.repo, required=False, weight=1, name="vocab",
+        )
+        self.term = Term.objects.create(
+            vocabulary=vocab, label="term", weight=1)
+        self.other.terms.add(self.term)
+
+    def create_other_course(self):
+        """A second course with a resource of the same type and term."""
+        course = create_course(
+            org="other-org", repo_id=self.repo.id,
+            course_number="other", run="run", user_id=self.user.id,
+        )
+        resource = create_resource(
+            course=course, parent=None, resource_type="problem",
+            title="other course", content_xml="", mpath="", url_name=None,
+            dpath="",
+        )
+        resource.xa_nr_views = 1000
+        resource.xa_avg_grade = 15
+        resource.save()
+        resource.terms.add(self.term)
+        return course
+
+    def rollup_values(self):
+        """Every rollup of the test repository, without ids."""
+        return sorted(AnalyticsRollup.objects.filter(
+            repository=self.repo
+        ).values_list(
+            "dimension", "key", "label", "resource_count", "views",
+            "attempts", "grade_sum", "grade_histogram",
+        ))
+
+    def assert_rollups_recomputed(self):
+        """The maintained rollups match rollups computed from scratch."""
+        maintained = self.rollup_values()
+        refresh_all_rollups()
+        self.assertEqual(maintained, self.rollup_values())
+
+    def get_rollup(self, dimension, key):
+        """Fetch a rollup of the test repository."""
+        return AnalyticsRollup.objects.get(
+            repository=self.repo, dimension=dimension, key=key)
+
+    def test_refresh(self):
+        """Totals and histograms per dimension."""
+        self.assertEqual(refresh_rollups(self.repo.id), 4)
+
+        course = self.get_rollup(AnalyticsRollup.COURSE, self.course.id)
+        self.assertEqual(course.label, "test-org/infinity/Febtober")
+        self.assertEqual(course.resource_count, 2)
+        self.assertEqual(course.views, 15)
+        self.assertEqual(course.attempts, 3)
+        self.assertEqual(course.grade_sum, 137)
+        self.assertEqual(
+            json.loads(course.grade_histogram),
+            [0, 0, 0, 0, 1, 0, 0, 0, 0, 1]
+        )
+
+        problem = self.get_rollup(
+            AnalyticsRollup.RESOURCE_TYPE,
+            self.other.learning_resource_type_id
+        )
+        self.assertEqual(problem.label, "problem")
+        self.assertEqual(problem.resource_count, 1)
+        self.assertEqual(problem.views, 5)
+
+        term = self.get_rollup(AnalyticsRollup.TERM, self.term.id)
+        self.assertEqual(term.label, "term")
+        self.assertEqual(term.resource_count, 1)
+        self.assertEqual(term.attempts, 1)
+
+    def test_refresh_courses(self):
+        """Only rollups touched by the courses are recomputed."""
+        refresh_all_rollups()
+        self.other.xa_nr_views = 105
+        self.other.save()
+        self.other.terms.remove(self.term)
+
+        refresh_rollups(self.repo.id, [self.course.id])
+        self.assertEqual(
+            self.get_rollup(AnalyticsRollup.COURSE, self.course.id).views,
+            115
+        )
+        # The term no longer has resources in the course, so its rollup
+        # is left alone.
+        self.assertEqual(
+            self.get_rollup(AnalyticsRollup.TERM, self.term.id).views, 5)
+
+    def test_refresh_terms(self):
+        """Term rollups follow renamed and deleted terms."""
+        refresh_all_rollups()
+        self.assertEqual(refresh_term_rollups(self.repo.id, []), 0)
+
+        self.term.label = "renamed"
+        self.term.save()
+        self.assertEqual(refresh_term_rollups(self.repo.id, [self.term.id]), 1)
+        self.assertEqual(
+            self.get_rollup(AnalyticsRollup.TERM, self.term.id).label,
+            "renamed"
+        )
+
+        term_id = self.term.id
+        self.term.delete()
+        self.assertEqual(refresh_term_rollups(self.repo.id, [term_id]), 0)
+        self.assertFalse(AnalyticsRollup.objects.filter(
+            dimension=AnalyticsRollup.TERM, key=term_id).exists())
+
+    def test_update_resource_terms(self):
+        """Bulk term assignment refreshes the rollups of the terms."""
+        refresh_all_rollups()
+        self.term.vocabulary.learning_resource_types.add(
+            self.resource.learning_resource_type)
+        update_resource_terms(
+            self.repo, [self.resource.id], add_slugs=[self.term.slug])
+        term = self.get_rollup(AnalyticsRollup.TERM, self.term.id)
+        self.assertEqual(term.resource_count, 2)
+        self.assertEqual(term.views, 15)
+
+        update_resource_terms(
+            self.repo, [self.resource.id, self.other.id],
+            remove_slugs=[self.term.slug]
+        )
+        self.assertFalse(AnalyticsRollup.objects.filter(
+            dimension=AnalyticsRollup.TERM, key=self.term.id).exists())
+
+    def test_delete_course(self):
+        """Deleting a course removes the rollups of its resources."""
+        refresh_all_rollups()
+        self.assertEqual(
+            AnalyticsRollup.objects.filter(repository=self.repo).count(), 4)
+        delete_course(self.course.id)
+        self.assertEqual(
+            AnalyticsRollup.objects.filter(repository=self.repo).count(), 0)
+
+    def test_ingest(self):
+        """Ingesting xanalytics data updates the rollups."""
+        self.resource.uuid = "1"
+        self.resource.save()
+        update_xanalytics({
+            "course_id": self.course.course_number,
+            "module_medata": [{"module_id": "1", "xa_nr_views": "20"}],
+        })
+        self.assertEqual(
+            self.get_rollup(AnalyticsRollup.COURSE, self.course.id).views,
+            25
+        )
+
+    def test_ingest_deltas(self):
+        """
+        Ingesting adds the changes of the updated resources to their
+        rollups, without aggregating the rest of the repository.
+        """
+        self.create_other_course()
+        refresh_all_rollups()
+        self.other.uuid = "1"
+        self.other.save()
+        with patch(
+            "xanalytics.rollups.refresh_rollup_keys"
+        ) as mock_refresh:
+            update_xanalytics({
+                "course_id": self.course.course_number,
+                "module_medata": [{
+                    "module_id": "1", "xa_nr_views": "50",
+                    "xa_avg_grade": "85",
+                }],
+            })
+        self.assertFalse(mock_refresh.called)
+        problem = self.get_rollup(
+            AnalyticsRollup.RESOURCE_TYPE,
+            self.other.learning_resource_type_id
+        )
+        self.assertEqual(problem.views, 1050)
+        self.assertEqual(
+            json.loads(problem.grade_histogram),
+            [0, 1, 0, 0, 0, 0, 0, 0, 1, 0]
+        )
+        self.assert_rollups_recomputed()
+
+    def test_orm_deltas(self):
+        """Changes from the ORM fallback apply the same way."""
+        refresh_all_rollups()
+        self.resource.uuid = "1"
+        self.resource.save()
+        changes = _apply_xanalytics_orm(
+            self.course.course_number, ("xa_avg_grade",), [("1", 55)])
+        self.assertEqual(apply_rollup_deltas(resource_deltas(changes)), 2)
+        self.assert_rollups_recomputed()
+        # Resources whose values didn't change leave the rollups alone.
+        self.assertEqual(apply_rollup_deltas(resource_deltas(
+            [(self.resource.id, self.course.id, None, (1, 2, 3), (1, 2, 3))]
+        )), 0)
+
+    def test_delete_course_deltas(self):
+        """
+        Deleting a course takes its resources out of the rollups, without
+        aggregating the rest of the repository.
+        """
+        other_course = self.create_other_course()
+        refresh_all_rollups()
+        with patch(
+            "xanalytics.rollups.refresh_rollup_keys"
+        ) as mock_refresh:
+            delete_course(self.course.id)
+        self.assertFalse(mock_refresh.called)
+        self.assertEqual(
+            sorted(AnalyticsRollup.objects.filter(
+                repository=self.repo
+            ).values_list("dimension", "key", "resource_count", "views")),
+            sorted([
+                (AnalyticsRollup.COURSE, other_course.id, 1, 1000),
+                (AnalyticsRollup.RESOURCE_TYPE,
+                 self.other.learning_resource_type_id, 1, 1000),
+                (AnalyticsRollup.TERM, self.term.id, 1, 1000),
+            ])
+        )
+        self.assert_rollups_recomputed()
+
+    def test_missing_rollups(self):
+        """Rollups which weren't computed yet are computed for their keys."""
+        self.other.uuid = "1"
+        self.other.save()
+        update_xanalytics({
+            "course_id": self.course.course_number,
+            "module_medata": [{"module_id": "1", "xa_nr_views": "6"}],
+        })
+        self.assertEqual(
+            sorted(AnalyticsRollup.objects.filter(
+                repository=self.repo).values_list("dimension", flat=True)),
+            [AnalyticsRollup.COURSE, AnalyticsRollup.RESOURCE_TYPE,
+             AnalyticsRollup.TERM]
+        )
+        self.assertEqual(
+            self.get_rollup(AnalyticsRollup.TERM, self.term.id).views, 6)
+
+    def test_command(self):
+        """The management command recomputes every rollup."""
+        call_command("refresh_analytics_rollups")
+        self.assertEqual(
+            AnalyticsRollup.objects.filter(repository=self.repo).count(), 4)
@@ -0,0 +1,88 @@
+"""
+Tests for incremental parsing of xanalytics results.
+"""
+
+from __future__ import unicode_literals
+
+from io import BytesIO
+import json
+from unittest import TestCase
+
+from xanalytics.stream import ingest_result, iter_result_items
+
+
+def split(data, size):
+    """Split bytes into chunks of size bytes."""
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+class TestStream(TestCase):
+    """
+    Parse results a few bytes at a time.
+    """
+    records = [
+        {"module_id": "mé{0}".format(i), "xa_nr_views": i * 1000}
+        for i in range(5)
+    ]
+
+    def encode(self, before_records):
+        """Encode a result with course_id before or after the records."""
+        items = [
+            '"module_medata": {0}'.format(json.dumps(self.records)),
+            '"course_id": "123"',
+            '"other": 12345',
+        ]
+        if before_records:
+            items.reverse()
+        return "{{{0}}}".format(", ".join(items)).encode('utf-8')
+
+    def test_items(self):
+        """Records are yielded one by one, across chunk boundaries."""
+        for size in (1, 3, 1024):
+            items = list(iter_result_items(split(self.encode(False), size)))
+            self.assertEqual(
+                items,
+                [("module_medata", record) for record in self.records] +
+                [("course_id", "123"), ("other", 12345)]
+            )
+
+    def test_lazy(self):
+        """Records are parsed before the rest of the result is read."""
+        chunks = split(self.encode(True), 8)
+        read = []
+
+        def chunk_reader():
+            """Record which chunks were read."""
+            for chunk in chunks:
+                read.append(chunk)
+                yield chunk
+        items = iter_result_items(chunk_reader())
+        for key, _ in items:
+            if key == "module_medata":
+                break
+        self.assertLess(len(read), len(chunks))
+
+    def test_ingest(self):
+        """Records reach ingestion whether course_id comes first or last."""
+        for before_records in (True, False):
+            result = ingest_result(
+                BytesIO(self.encode(before_records)),
+                lambda course, records: (course, list(records))
+            )
+            self.assertEqual(result, ("123", self.records))
+
+    def test_empty(self):
+        """Results without records or course_id."""
+        self.assertEqual(list(iter_result_items([b"{}"])), [])
+        self.assertEqual(
+            list(iter_result_items([b'{"module_medata": [ ]}'])),
+            []
+        )
+        self.assertEqual(
+            ingest_result(BytesIO(b'{"module_medata": [{}]}'), None), 0)
+
+    def test_invalid(self):
+        """Invalid JSON raises ValueError."""
+        for data in (b'{"a": 1,}', b'{"module_medata": [{}', b'[]', b''):
+            with self.assertRaises(ValueError):
+                list(iter_result_items(split(data, 2)))